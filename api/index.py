@@ -2,16 +2,24 @@ import os
 import io
 import uuid
 import json
+import hashlib
 import time
 import math
+import re
 import asyncio
+import queue
 import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from typing import List, Tuple, Optional, Dict, Any
 
-from fastapi import FastAPI, Request, UploadFile, HTTPException
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+# request.form() yields Starlette's UploadFile; FastAPI's is a subclass, so isinstance checks need this one
+from starlette.datastructures import UploadFile
 from dotenv import load_dotenv
 import requests
 
@@ -32,7 +40,199 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "").strip()
 REPLICATE_API_TOKEN = os.getenv("REPLICATE_API_TOKEN", "").strip()
 
-app = FastAPI(title="Data Analyst Agent - Ingest API", docs_url=None, redoc_url=None)
+# Ordered provider list for failover/hedging; defaults to the single LLM_PROVIDER
+LLM_PROVIDERS = [
+    p for p in (x.strip().lower() for x in os.getenv("LLM_PROVIDERS", LLM_PROVIDER).split(","))
+    if p and p != "none"
+]
+LLM_HEDGE_DEFAULT_MS = float(os.getenv("LLM_HEDGE_DEFAULT_MS", 8000))            # hedge delay until p95 is known
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 3))                # consecutive failures to open
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", 30))
+
+# Micro-batching of concurrent prompts to the local provider (off by default)
+LOCAL_LLM_BATCHING = os.getenv("LOCAL_LLM_BATCHING", "false").lower() in {"1", "true", "yes"}
+LOCAL_LLM_BATCH_WINDOW_MS = float(os.getenv("LOCAL_LLM_BATCH_WINDOW_MS", 5))   # collect window
+LOCAL_LLM_BATCH_MAX_SIZE = int(os.getenv("LOCAL_LLM_BATCH_MAX_SIZE", 8))       # prompts per batch
+
+# Response encoding
+RESPONSE_MAX_BYTES = int(os.getenv("RESPONSE_MAX_BYTES", 2 * 1024 * 1024))            # 0 disables the budget
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", 1024))     # smaller bodies go as-is
+
+
+# ---- Response encoding: fast JSON, size budget, compression ----
+import gzip
+from decimal import Decimal
+
+try:
+    import orjson  # optional; stdlib json is used when missing
+except ImportError:
+    orjson = None
+
+try:
+    import brotli  # optional; gzip only when missing
+except ImportError:
+    brotli = None
+
+_PNG_B64_PREFIX = "iVBORw0KGgo"   # base64 of the PNG signature
+# (max list items, max dict keys, max string chars) tried in order until the body fits
+_RESPONSE_SHRINK_LEVELS = ((200, 500, 4000), (50, 100, 1000), (10, 25, 200), (3, 8, 80))
+
+
+def _json_default(obj):
+    """numpy/pandas scalars, arrays and timestamps -> plain JSON values."""
+    if type(obj).__name__ in {"NAType", "NaTType"}:
+        return None
+    if hasattr(obj, "tolist"):  # numpy scalars/arrays, pandas Series/Index
+        return obj.tolist()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+def _to_jsonable(obj):
+    # Slow path for the stdlib encoder: non-finite floats become null, keys become strings
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {
+            (k if isinstance(k, (str, int, bool)) or k is None else str(_json_default(k))): _to_jsonable(v)
+            for k, v in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [_to_jsonable(v) for v in obj]
+    if isinstance(obj, (str, int, bool)) or obj is None:
+        return obj
+    return _to_jsonable(_json_default(obj))
+
+
+def encode_json(content: Any) -> bytes:
+    """Compact JSON bytes; NaN/inf become null and numpy/pandas values are converted."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                content, default=_json_default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits
+    try:
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    except (TypeError, ValueError):
+        return json.dumps(
+            _to_jsonable(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+def _shrink(obj, max_items: int, max_keys: int, max_chars: int):
+    """Copy of obj with lists, dicts and long strings cut down; PNG payloads are kept whole."""
+    if isinstance(obj, dict):
+        return {k: _shrink(v, max_items, max_keys, max_chars) for k, v in list(obj.items())[:max_keys]}
+    if isinstance(obj, (list, tuple)):
+        return [_shrink(v, max_items, max_keys, max_chars) for v in obj[:max_items]]
+    if isinstance(obj, str) and len(obj) > max_chars and not obj.startswith(_PNG_B64_PREFIX):
+        return obj[:max_chars]
+    return obj
+
+
+def _fit_budget(content: Any, body: bytes) -> bytes:
+    """Re-encode content at progressively smaller shapes until it fits RESPONSE_MAX_BYTES."""
+    original = len(body)
+    for level in _RESPONSE_SHRINK_LEVELS:
+        shrunk = _shrink(content, *level)
+        if isinstance(shrunk, dict):
+            shrunk["truncated"] = True
+        body = encode_json(shrunk)
+        if len(body) <= RESPONSE_MAX_BYTES:
+            break
+    _log_event("response_truncated", bytes_before=original, bytes_after=len(body))
+    return body
+
+
+def _negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q-values and '*'."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    supported = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for enc in supported:
+        q = weights.get(enc, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def _png_share(body: bytes) -> float:
+    """Fraction of the body taken by base64 PNG strings (already compressed data)."""
+    total, start, marker = 0, 0, b'"' + _PNG_B64_PREFIX.encode()
+    while True:
+        i = body.find(marker, start)
+        if i < 0:
+            break
+        end = body.find(b'"', i + 1)
+        end = len(body) if end < 0 else end
+        total += end - i
+        start = end + 1
+    return total / max(1, len(body))
+
+
+class AnalysisResponse(JSONResponse):
+    """
+    JSONResponse with a faster, NaN/numpy-safe encoder, a RESPONSE_MAX_BYTES budget and
+    gzip/brotli chosen from the request's Accept-Encoding. Bodies that are small or mostly
+    base64 PNG are sent uncompressed. A body cut down to fit the budget carries
+    X-Response-Truncated: true, since a top-level array has nowhere to put a marker.
+    """
+
+    truncated = False
+
+    def render(self, content: Any) -> bytes:
+        body = encode_json(content)
+        if RESPONSE_MAX_BYTES and len(body) > RESPONSE_MAX_BYTES:
+            body = _fit_budget(content, body)
+            self.truncated = True
+        return body
+
+    async def __call__(self, scope, receive, send) -> None:
+        if self.truncated:
+            self.headers["X-Response-Truncated"] = "true"
+        body = self.body
+        if len(body) >= RESPONSE_COMPRESS_MIN_BYTES and "content-encoding" not in self.headers:
+            self.headers.add_vary_header("Accept-Encoding")
+            accept = ""
+            for key, value in scope.get("headers") or []:
+                if key == b"accept-encoding":
+                    accept = value.decode("latin-1")
+            encoding = _negotiate_encoding(accept) if accept else None
+            if encoding and _png_share(body) < 0.5:
+                if encoding == "br":
+                    self.body = brotli.compress(body, quality=4)
+                else:
+                    self.body = gzip.compress(body, compresslevel=5, mtime=0)
+                self.headers["content-encoding"] = encoding
+                self.headers["content-length"] = str(len(self.body))
+        await super().__call__(scope, receive, send)
+
+
+app = FastAPI(
+    title="Data Analyst Agent - Ingest API", docs_url=None, redoc_url=None,
+    default_response_class=AnalysisResponse,
+)
 
 # Minimal CORS to ease local testing; restrict in production if needed
 app.add_middleware(
@@ -48,6 +248,11 @@ def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
+def _log_event(event: str, **fields: Any) -> None:
+    """Structured log line on stdout: {"event": event, **fields} as one JSON object."""
+    print(json.dumps({"event": event, **fields}, default=str), flush=True)
+
+
 def _strip_bom(text_bytes: bytes) -> str:
     # Remove UTF-8 BOM if present and decode
     if text_bytes.startswith(b"\xef\xbb\xbf"):
@@ -157,11 +362,113 @@ def with_retries(fn, *, retries: int = 2, base_delay: float = 0.5):
     raise last_exc  # type: ignore[misc]
 
 
+# ---- Local provider micro-batching ----
+
+def _local_output_text(item: Any) -> str:
+    # Normalize one local-provider output (string or {"output"/"text"/"data": ...}) to text
+    if isinstance(item, dict):
+        item = item.get("output") or item.get("text") or item.get("data") or ""
+    if not isinstance(item, str):
+        item = json.dumps(item)
+    return item
+
+
+class _LocalBatcher:
+    """
+    Collects prompts from concurrent callers for a short window (or until the
+    batch cap) and sends them to LOCAL_LLM_ENDPOINT as one batched request:
+      { "model": "...", "inputs": ["<prompt>", ...], "max_tokens": 128, "temperature": 0.0 }
+    expecting { "outputs": ["<text with JSON>", ...] } in the same order.
+    Prompts are only batched together when max_tokens/temperature match.
+    """
+
+    def __init__(self, endpoint: str, model: str, window_s: float, max_size: int):
+        self.endpoint = endpoint
+        self.model = model
+        self.window_s = max(0.0, window_s)
+        self.max_size = max(1, max_size)
+        self._queue: "queue.Queue[Tuple[Tuple[int, float], str, Future]]" = queue.Queue()
+        self._sender = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-batch")
+        self._worker = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt: str, *, max_tokens: int, temperature: float, timeout: float) -> str:
+        """Queue a prompt and block until its batch returns; returns the raw output text."""
+        fut: Future = Future()
+        self._queue.put(((max_tokens, temperature), prompt, fut))
+        return fut.result(timeout=timeout + self.window_s + 1)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            buckets: Dict[Tuple[int, float], List[Tuple[str, Future]]] = {first[0]: [(first[1], first[2])]}
+            deadline = time.monotonic() + self.window_s
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    key, prompt, fut = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                bucket = buckets.setdefault(key, [])
+                bucket.append((prompt, fut))
+                if len(bucket) >= self.max_size:
+                    self._sender.submit(self._send, key, buckets.pop(key))
+                    if not buckets:
+                        break
+            for key, batch in buckets.items():
+                self._sender.submit(self._send, key, batch)
+
+    def _send(self, key: Tuple[int, float], batch: List[Tuple[str, Future]]) -> None:
+        max_tokens, temperature = key
+        try:
+            resp = requests.post(
+                self.endpoint,
+                json={
+                    "model": self.model,
+                    "inputs": [prompt for prompt, _ in batch],
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                },
+                timeout=60,
+            )
+            resp.raise_for_status()
+            outputs = resp.json().get("outputs")
+            if not isinstance(outputs, list) or len(outputs) != len(batch):
+                raise RuntimeError("local batch response size mismatch")
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), item in zip(batch, outputs):
+            if not fut.done():
+                fut.set_result(_local_output_text(item))
+
+
+_LOCAL_BATCHER: Optional[_LocalBatcher] = None
+_LOCAL_BATCHER_LOCK = threading.Lock()
+
+
+def _get_local_batcher() -> _LocalBatcher:
+    global _LOCAL_BATCHER
+    with _LOCAL_BATCHER_LOCK:
+        if _LOCAL_BATCHER is None:
+            _LOCAL_BATCHER = _LocalBatcher(
+                LOCAL_LLM_ENDPOINT,
+                GPT_OSS_MODEL,
+                LOCAL_LLM_BATCH_WINDOW_MS / 1000.0,
+                LOCAL_LLM_BATCH_MAX_SIZE,
+            )
+        return _LOCAL_BATCHER
+
+
 # ---- LLM provider interface ----
 
-def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, request_id: Optional[str] = None, prefix_instructions: Optional[str] = None) -> Dict[str, Any]:
+def _call_provider(provider: str, composed_prompt: str, *, max_tokens: int, temperature: float, retries: int = 2) -> Dict[str, Any]:
     """
-    Provider-agnostic LLM call that requests a JSON-only response.
+    Call a single provider with an already-composed JSON-only prompt.
 
     Local provider contract (example): send POST to LOCAL_LLM_ENDPOINT with JSON
       {
@@ -171,6 +478,8 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
         "temperature": 0.0
       }
     and expect JSON response like { "output": "<text with JSON>" }.
+    With LOCAL_LLM_BATCHING=true, concurrent prompts are grouped by _LocalBatcher
+    and sent as { ..., "inputs": [...] } expecting { "outputs": [...] }.
 
     Hugging Face Inference API: POST https://api-inference.huggingface.co/models/{model}
       headers: Authorization: Bearer <token>
@@ -179,22 +488,13 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
 
     Replicate generic contract: POST https://api.replicate.com/v1/predictions
       body: { "version": "<model-or-version>", "input": { "prompt": "...", "temperature": 0.0, "max_tokens": 1024 } }
-      Then poll GET /v1/predictions/{id} until status "succeeded" and read .output (string or list joined).
+      Then poll GET /v1/predictions/{id} with a growing interval until status "succeeded"
+      and read .output (string or list joined).
 
     Returns a dict: { ok: bool, data?: dict, provider: str, model: str, error?: str }
     """
-    provider = LLM_PROVIDER
     model = GPT_OSS_MODEL
 
-    # Default to planner schema unless overridden
-    if prefix_instructions is None:
-        prefix_instructions = (
-            "You are a planner. Respond ONLY with compact JSON matching this schema: "
-            "{\"plan\":{\"steps\":[{\"id\":\"s1\",\"type\":\"<string>\",\"description\":\"<short>\"}]}}. "
-            "No prose. No markdown."
-        )
-    composed_prompt = f"{prefix_instructions}\n\n{prompt.strip()}\n"
-
     def _finish_from_text_output(text_out: str) -> Dict[str, Any]:
         parsed = safe_parse_json(text_out)
         if parsed.get("ok"):
@@ -211,6 +511,11 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
             return {"ok": False, "error": "LOCAL_LLM_ENDPOINT not set", "provider": provider, "model": model}
 
         def _do():
+            if LOCAL_LLM_BATCHING:
+                text_out = _get_local_batcher().submit(
+                    composed_prompt, max_tokens=max_tokens, temperature=temperature, timeout=timeout
+                )
+                return _finish_from_text_output(text_out)
             resp = requests.post(
                 LOCAL_LLM_ENDPOINT,
                 json={
@@ -222,13 +527,9 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
                 timeout=timeout,
             )
             resp.raise_for_status()
-            js = resp.json()
-            text_out = js.get("output") or js.get("text") or js.get("data") or ""
-            if not isinstance(text_out, str):
-                text_out = json.dumps(text_out)
-            return _finish_from_text_output(text_out)
+            return _finish_from_text_output(_local_output_text(resp.json()))
 
-        return with_retries(_do)
+        return with_retries(_do, retries=retries)
 
     if provider == "openai_api":
         if not OPENAI_API_KEY:
@@ -255,7 +556,7 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
             text_out = resp.choices[0].message.content or ""
             return _finish_from_text_output(text_out)
 
-        return with_retries(_do)
+        return with_retries(_do, retries=retries)
 
     if provider == "huggingface":
         if not HUGGINGFACE_API_KEY:
@@ -288,7 +589,7 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
                 text_out = ""
             return _finish_from_text_output(text_out)
 
-        return with_retries(_do)
+        return with_retries(_do, retries=retries)
 
     if provider == "replicate":
         if not REPLICATE_API_TOKEN:
@@ -301,6 +602,8 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
                 headers={
                     "Authorization": f"Token {REPLICATE_API_TOKEN}",
                     "Content-Type": "application/json",
+                    # Let Replicate hold the create call briefly so fast predictions skip polling
+                    "Prefer": "wait=5",
                 },
                 json={
                     "version": model,  # For generic use, set GPT_OSS_MODEL to a valid Replicate version or model slug
@@ -315,14 +618,18 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
             create.raise_for_status()
             cjs = create.json()
             pred_id = cjs.get("id")
-            status = cjs.get("status")
             get_url = cjs.get("urls", {}).get("get") or f"https://api.replicate.com/v1/predictions/{pred_id}"
-            # Poll until completed or timeout budget spent
+            # Poll until completed or timeout budget spent; start fast and back off so
+            # quick predictions are not held back by a fixed interval
             start = time.time()
-            text_out = ""
-            while True:
-                if time.time() - start > timeout:
+            poll_interval = 0.2
+            gjs = cjs
+            while gjs.get("status") not in {"succeeded", "failed", "canceled"}:
+                elapsed = time.time() - start
+                if elapsed > timeout:
                     raise TimeoutError("replicate prediction timeout")
+                _sleep(min(poll_interval, max(0.0, timeout - elapsed)))
+                poll_interval = min(poll_interval * 1.5, 2.0)
                 g = requests.get(
                     get_url,
                     headers={"Authorization": f"Token {REPLICATE_API_TOKEN}"},
@@ -330,31 +637,199 @@ def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, r
                 )
                 g.raise_for_status()
                 gjs = g.json()
-                status = gjs.get("status")
-                if status in {"succeeded", "failed", "canceled"}:
-                    out = gjs.get("output")
-                    if isinstance(out, list):
-                        text_out = "\n".join(map(str, out))
-                    elif isinstance(out, str):
-                        text_out = out
-                    else:
-                        text_out = json.dumps(out) if out is not None else ""
-                    if status != "succeeded":
-                        raise RuntimeError(f"replicate status={status}")
-                    break
-                _sleep(1.0)
+            status = gjs.get("status")
+            out = gjs.get("output")
+            if isinstance(out, list):
+                text_out = "\n".join(map(str, out))
+            elif isinstance(out, str):
+                text_out = out
+            else:
+                text_out = json.dumps(out) if out is not None else ""
+            if status != "succeeded":
+                raise RuntimeError(f"replicate status={status}")
             return _finish_from_text_output(text_out)
 
-        return with_retries(_do)
+        return with_retries(_do, retries=retries)
 
     return {"ok": False, "error": f"Unknown LLM_PROVIDER '{provider}'", "provider": provider, "model": model}
 
 
+# ---- Provider health, failover & hedging ----
+
+class _ProviderHealth:
+    """
+    Per-provider circuit breaker plus a rolling window of successful call latencies.
+    The breaker opens after LLM_BREAKER_FAILURES consecutive failures. Once
+    LLM_BREAKER_COOLDOWN_SECONDS have passed it is half-open: allow() admits a single
+    trial call and rejects the rest until record() reports how that call went.
+    """
+
+    def __init__(self, window: int = 50):
+        self._lock = threading.Lock()
+        self._latencies: "deque[float]" = deque(maxlen=window)
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None   # half-open trial call in flight since
+
+    def _admits(self, now: float) -> bool:
+        if self._opened_at is None:
+            return True
+        if now - self._opened_at < LLM_BREAKER_COOLDOWN_SECONDS:
+            return False
+        # A trial call that never reported back stops blocking after another cooldown
+        return self._probe_at is None or now - self._probe_at >= LLM_BREAKER_COOLDOWN_SECONDS
+
+    def available(self) -> bool:
+        """Whether allow() would admit a call right now; claims nothing."""
+        with self._lock:
+            return self._admits(time.monotonic())
+
+    def allow(self) -> bool:
+        """Admit a call; in the half-open state this claims the single trial call."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._admits(now):
+                return False
+            if self._opened_at is not None:
+                self._probe_at = now
+            return True
+
+    def record(self, ok: bool, latency_s: float) -> None:
+        with self._lock:
+            self._probe_at = None
+            if ok:
+                self._latencies.append(latency_s)
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._failures >= LLM_BREAKER_FAILURES:
+                    self._opened_at = time.monotonic()
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait before hedging: the rolling p95, or the default until enough samples exist."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 5:
+            return LLM_HEDGE_DEFAULT_MS / 1000.0
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._latencies)
+            if self._opened_at is None:
+                state = "closed"
+            elif time.monotonic() - self._opened_at >= LLM_BREAKER_COOLDOWN_SECONDS:
+                state = "half_open"
+            else:
+                state = "open"
+            failures = self._failures
+        pct = lambda q: round(samples[int(q * (len(samples) - 1))] * 1000) if samples else None  # noqa: E731
+        return {"state": state, "consecutive_failures": failures, "p50_ms": pct(0.5), "p95_ms": pct(0.95)}
+
+
+_PROVIDER_HEALTH: Dict[str, _ProviderHealth] = {p: _ProviderHealth() for p in LLM_PROVIDERS}
+_LLM_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm")
+
+
+def _call_provider_tracked(provider: str, composed_prompt: str, **kwargs) -> Dict[str, Any]:
+    # Run one provider call and feed its outcome into that provider's health stats
+    started = time.monotonic()
+    try:
+        result = _call_provider(provider, composed_prompt, **kwargs)
+    except Exception as e:
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}", "provider": provider, "model": GPT_OSS_MODEL}
+    health = _PROVIDER_HEALTH.get(provider)
+    if health is not None:
+        health.record(bool(result.get("ok")), time.monotonic() - started)
+    return result
+
+
+def _call_hedged(composed_prompt: str, *, max_tokens: int, temperature: float) -> Dict[str, Any]:
+    """
+    Try providers in LLM_PROVIDERS order, skipping ones whose breaker is open.
+    If the current provider has not answered within its p95 latency, the next one
+    is fired as a hedge and whichever valid JSON arrives first wins. A failure
+    moves on to the next provider immediately instead of retrying the same one.
+    """
+    candidates = [p for p in LLM_PROVIDERS if _PROVIDER_HEALTH[p].available()]
+    forced = not candidates  # every breaker open: try them all rather than fail outright
+    if forced:
+        candidates = list(LLM_PROVIDERS)
+    pending: Dict[Future, str] = {}
+    last_result: Dict[str, Any] = {"ok": False, "error": "all providers failed", "provider": None, "model": GPT_OSS_MODEL}
+    next_idx = 0
+
+    def _launch() -> None:
+        # Admission is claimed only when a provider is actually called, so a half-open
+        # provider's single trial slot is never held by a hedge that did not fire
+        nonlocal next_idx
+        while next_idx < len(candidates):
+            provider = candidates[next_idx]
+            next_idx += 1
+            if forced or _PROVIDER_HEALTH[provider].allow():
+                fut = _LLM_POOL.submit(
+                    _call_provider_tracked, provider, composed_prompt,
+                    max_tokens=max_tokens, temperature=temperature, retries=0,
+                )
+                pending[fut] = provider
+                return
+
+    _launch()
+    while pending:
+        # Only hedge while there is still a provider left to fire
+        wait_s = _PROVIDER_HEALTH[candidates[next_idx - 1]].hedge_delay() if next_idx < len(candidates) else None
+        done, _ = wait(list(pending), timeout=wait_s, return_when=FIRST_COMPLETED)
+        if not done:
+            _launch()
+            continue
+        for fut in done:
+            pending.pop(fut)
+            result = fut.result()
+            if result.get("ok"):
+                return result
+            last_result = result
+        if not pending and next_idx < len(candidates):
+            _launch()
+    return last_result
+
+
+def call_llm(prompt: str, *, max_tokens: int = 1024, temperature: float = 0.0, request_id: Optional[str] = None, prefix_instructions: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Provider-agnostic LLM call that requests a JSON-only response.
+
+    With a single configured provider the call is retried with backoff. With an
+    ordered LLM_PROVIDERS list, providers are tried via _call_hedged instead.
+    See _call_provider for the per-provider contracts.
+
+    Returns a dict: { ok: bool, data?: dict, provider: str, model: str, error?: str }
+    """
+    if not LLM_PROVIDERS:
+        return {"ok": False, "error": "LLM provider not configured (LLM_PROVIDER=none)", "provider": "none", "model": GPT_OSS_MODEL}
+
+    # Default to planner schema unless overridden
+    if prefix_instructions is None:
+        prefix_instructions = (
+            "You are a planner. Respond ONLY with compact JSON matching this schema: "
+            "{\"plan\":{\"steps\":[{\"id\":\"s1\",\"type\":\"<string>\",\"description\":\"<short>\"}]}}. "
+            "No prose. No markdown."
+        )
+    composed_prompt = f"{prefix_instructions}\n\n{prompt.strip()}\n"
+
+    if len(LLM_PROVIDERS) == 1:
+        return _call_provider_tracked(LLM_PROVIDERS[0], composed_prompt, max_tokens=max_tokens, temperature=temperature)
+    return _call_hedged(composed_prompt, max_tokens=max_tokens, temperature=temperature)
+
+
+def _llm_enabled() -> bool:
+    return not SKIP_LLM and bool(LLM_PROVIDERS)
+
+
 # ---- Planning & dispatch ----
 async def plan_and_dispatch(
     request_id: str,
     questions_text: str,
-    attachments_dir: str,
+    attachments: "AttachmentStore",
     attachments_meta: List[Dict[str, Any]],
 ) -> Dict[str, Any]:
     """
@@ -366,18 +841,25 @@ async def plan_and_dispatch(
     filenames = [m.get("filename", "") for m in attachments_meta]
     task_type = _detect_task_type(questions_text, filenames)
 
-    if SKIP_LLM or LLM_PROVIDER == "none":
+    if not _llm_enabled():
         # Deterministic heuristic plan
         steps: List[Dict[str, Any]] = []
         steps.append({"id": "s1", "type": "parse_questions", "description": "Parse instructions from questions.txt"})
         if any(fn.lower().endswith(".csv") for fn in filenames):
             steps.append({"id": "s2", "type": "load_csv", "description": "Load CSV files into DataFrames"})
+        if any(fn.lower().endswith(JSON_TABLE_EXTENSIONS) for fn in filenames):
+            steps.append({"id": "s7", "type": "load_json", "description": "Stream JSON/NDJSON records into DataFrames"})
+        analytic = heuristic_graph_step(questions_text, attachments_meta) or heuristic_analytic_step(questions_text, attachments_meta)
+        if analytic is not None:
+            analytic["description"] = f"Compute {analytic['type']} over named columns"
+            steps.append(analytic)
+        elif any(s["type"] in {"load_csv", "load_json"} for s in steps):
             steps.append({"id": "s3", "type": "analyze_tabular", "description": "Run summary stats and answer prompts"})
         if any(fn.lower().endswith(ext) for ext in (".parquet", ".pq", ".duckdb") for fn in filenames):
             steps.append({"id": "s4", "type": "query_parquet_duckdb", "description": "Query columnar data using DuckDB"})
         if ("http://" in questions_text) or ("https://" in questions_text):
             steps.append({"id": "s5", "type": "scrape", "description": "Fetch and parse referenced web pages"})
-        if not any(s["id"] == "s3" for s in steps):
+        if not any(s["id"] in {"s3", "s8", "s9"} for s in steps):
             steps.append({"id": "s6", "type": "text_analysis", "description": "Analyze and summarize textual instructions"})
         plan = {"plan": {"steps": steps}}
         return {"ok": True, "plan": plan, "provider": "heuristic", "model": "skip"}
@@ -388,7 +870,10 @@ async def plan_and_dispatch(
         q_preview = q_preview[:1200]
     context = {
         "question_preview": q_preview,
-        "attachments": [{"filename": m["filename"], "bytes": m.get("bytes", 0)} for m in attachments_meta],
+        "attachments": [
+            {"filename": m["filename"], "bytes": m.get("bytes", 0), **_profile_summary(m.get("profile"))}
+            for m in attachments_meta
+        ],
         "constraints": {
             "no_raw_bytes": True,
             "max_runtime_s": REQUEST_TIMEOUT_SECONDS,
@@ -399,14 +884,24 @@ async def plan_and_dispatch(
         # Call model requesting JSON-only plan
         prompt = (
             "Create a short execution plan as JSON only. Schema: {\"plan\":{\"steps\":[{\"id\":\"s1\",\"type\":\"string\",\"description\":\"short\",\"params\":{}}]}}. "
-            "Use 2-6 steps. Allowed types include: parse_questions, math, load_csv, analyze_tabular, query_parquet_duckdb, scrape, matplotlib_plot, llm_answer, text_analysis. "
+            "Use 2-6 steps. Allowed types include: parse_questions, math, load_csv, load_json, analyze_tabular, scrape, matplotlib_plot, llm_answer, text_analysis, "
+            "query_parquet_duckdb (params: columns, filters [{column,op,value}], group_by, aggregates [{fn,column,as}], order_by, limit; or table for .duckdb), "
+            "expression (params: expression over column names, optional file, name, aggregate), "
+            "text_to_sql (question answered by SQL generated from table schemas; best for aggregations over large tables), "
+            "correlation (params: x, y, method pearson|spearman), regression (params: x, y, return slope|intercept|r2|prediction, predict_x), "
+            "group_by (params: by, column, agg sum|avg|min|max|count|median, filters, order desc|asc, limit, return table|label|value), "
+            "top_k (params: column, k, ascending, columns, return <label column>), "
+            "rolling (params: column, window rows or offset like 7D, agg mean|sum|min|max|std|median, order_by), "
+            "graph_analysis (edge list; params: source, target, weight, directed, metric density|degree|average_degree|components|shortest_path|top_nodes|nodes|edges, node, from, to, k); "
+            "these take an optional file param and use exact column names from the attachment profiles. "
             "Choose minimal steps to answer. No code, no markdown."
             " Context: " + json.dumps(context, ensure_ascii=False)
         )
         return call_llm(prompt, max_tokens=512, temperature=0.0, request_id=request_id)
 
-    # Offload sync HTTP to thread so we don't block the event loop
-    result = await asyncio.to_thread(with_retries, _provider_call, retries=1, base_delay=0.75)
+    # Offload sync HTTP to thread so we don't block the event loop.
+    # call_llm already retries/fails over, so no extra retry layer here.
+    result = await asyncio.to_thread(_provider_call)
 
     if not result.get("ok"):
         return {"ok": False, "error": result.get("error", "llm_error"), "provider": result.get("provider"), "model": result.get("model")}
@@ -428,20 +923,150 @@ async def plan_and_dispatch(
     return {"ok": True, "plan": plan, "provider": result.get("provider"), "model": result.get("model")}
 
 
-async def _save_upload_to_disk(
+# ---- Attachment store (memory first, spill to disk) ----
+
+ATTACHMENT_SPILL_BYTES = int(os.getenv("ATTACHMENT_SPILL_BYTES", 8 * 1024 * 1024))   # larger files go to disk
+
+
+class _StoreWriter:
+    """Incremental writer for one attachment; buffers in memory until the spill threshold."""
+
+    def __init__(self, store: "AttachmentStore", name: str):
+        self._store = store
+        self._name = name
+        self._buf = bytearray()
+        self._fh = None
+        self._path: Optional[str] = None
+        self.bytes = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> None:
+        self.bytes += len(data)
+        if self._fh is None and len(self._buf) + len(data) > self._store.spill_bytes:
+            self._path = self._store.scratch_path(self._name)
+            self._fh = open(self._path, "wb")
+            self._fh.write(self._buf)
+            self._buf = bytearray()
+        if self._fh is not None:
+            self._fh.write(data)
+        else:
+            self._buf += data
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self._fh is not None:
+            self._fh.close()
+            self._store._entries[self._name] = {"path": self._path, "size": self.bytes}
+        else:
+            self._store._entries[self._name] = {"data": bytes(self._buf), "size": self.bytes}
+            self._buf = bytearray()
+
+
+class AttachmentStore:
+    """
+    Per-request attachment storage. Files up to spill_bytes stay in memory and are
+    handed out as BytesIO views over the same buffer; larger files are written
+    to a lazily created temp dir. path() materializes an in-memory file for readers
+    that need a real path (DuckDB read_parquet / ATTACH).
+    """
+
+    def __init__(self, prefix: str = "att-", spill_bytes: int = ATTACHMENT_SPILL_BYTES):
+        self.prefix = prefix
+        self.spill_bytes = spill_bytes
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dir: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def scratch_path(self, name: str) -> str:
+        with self._lock:
+            if self._dir is None:
+                self._dir = tempfile.mkdtemp(prefix=self.prefix)
+        return os.path.join(self._dir, name)
+
+    def writer(self, name: str) -> _StoreWriter:
+        return _StoreWriter(self, name)
+
+    def put(self, name: str, data: bytes) -> None:
+        w = self.writer(name)
+        w.write(data)
+        w.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def size(self, name: str) -> int:
+        return self._entries[name]["size"]
+
+    def open(self, name: str):
+        """Binary file object; in-memory entries share the stored buffer (no copy)."""
+        entry = self._entries[name]
+        if "data" in entry:
+            return io.BytesIO(entry["data"])
+        return open(entry["path"], "rb")
+
+    def open_text(self, name: str):
+        return io.TextIOWrapper(self.open(name), encoding="utf-8", errors="replace")
+
+    def path(self, name: str) -> str:
+        entry = self._entries[name]
+        with self._lock:
+            if "path" not in entry:
+                if self._dir is None:
+                    self._dir = tempfile.mkdtemp(prefix=self.prefix)
+                path = os.path.join(self._dir, name)
+                with open(path, "wb") as f:
+                    f.write(entry["data"])
+                entry["path"] = path
+        return entry["path"]
+
+    def remove(self, name: str) -> None:
+        entry = self._entries.pop(name, None)
+        if entry and "path" in entry:
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self._entries.clear()
+        with self._lock:
+            temp_dir, self._dir = self._dir, None
+        if temp_dir:
+            import shutil
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def release(self) -> None:
+        """Drop buffers now; if anything reached disk, remove it off the request path."""
+        if self._dir is None:
+            self._entries.clear()
+            return
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self.close)
+        except RuntimeError:  # no loop (sync callers)
+            self.close()
+
+
+async def _save_upload(
     upload: UploadFile,
-    dest_path: str,
+    store: AttachmentStore,
+    name: str,
     per_file_limit: int,
     total_state: dict,
     chunk_size: int = 1024 * 1024,
 ) -> int:
     """
-    Save an UploadFile to disk in chunks with size enforcement.
+    Copy an UploadFile into the attachment store in chunks with size enforcement.
     Returns number of bytes written. Updates total_state["total_bytes"].
     Raises HTTPException 413 on limit breach.
     """
     bytes_written = 0
-    with open(dest_path, "wb") as f:
+    f = store.writer(name)
+    try:
         while True:
             # Read at most chunk_size, but also respect remaining budget
             remaining_file = per_file_limit - bytes_written
@@ -457,14 +1082,244 @@ async def _save_upload_to_disk(
             total_state["total_bytes"] += len(chunk)
             if bytes_written > per_file_limit or total_state["total_bytes"] > TOTAL_MAX_BYTES:
                 raise HTTPException(status_code=413, detail="Upload size limit exceeded")
+    finally:
+        f.close()
     return bytes_written
 
 
+# ---- Streaming ingestion with incremental profiling ----
+import csv
+
+PROFILE_HEAD_BYTES = int(os.getenv("PROFILE_HEAD_BYTES", 64 * 1024))   # bytes sniffed for dialect/dtypes
+
+
+def _profile_csv_head(head: bytes, complete: bool) -> Dict[str, Any]:
+    """
+    Sniff the delimiter and infer column dtypes from the first bytes of a CSV. The header
+    row is left to pandas (first row), as csv.Sniffer.has_header misreads all-text tables.
+    """
+    import pandas as pd  # local import
+    if not complete and b"\n" in head:
+        head = head[: head.rfind(b"\n") + 1]  # drop the partial last line
+    sample = _strip_bom(head)
+    sniffer = csv.Sniffer()
+    try:
+        delimiter = sniffer.sniff(sample[:16384], delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ","
+    df = pd.read_csv(io.StringIO(sample), sep=delimiter, nrows=2000)
+    return {
+        "delimiter": delimiter,
+        "columns": [str(c) for c in df.columns],
+        "dtypes": {str(c): str(t) for c, t in df.dtypes.items()},
+    }
+
+
+def _csv_read_kwargs(meta: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """pandas.read_csv arguments from an upload-time profile (empty when unprofiled)."""
+    profile = (meta or {}).get("profile") or {}
+    if "delimiter" not in profile:
+        return {}
+    return {"sep": profile["delimiter"]}
+
+
+def _profile_summary(profile: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Planner-facing subset of a profile: column names/dtypes and size, never content."""
+    profile = profile or {}
+    return {k: profile[k] for k in ("columns", "dtypes", "rows_estimate", "layout") if k in profile}
+
+
+def _is_json_line(head: bytes) -> bool:
+    # NDJSON only if the first line is a complete value; a pretty-printed object spans lines
+    line, sep, _ = head.partition(b"\n")
+    if not sep:
+        return False
+    try:
+        json.loads(line)
+    except ValueError:
+        return False
+    return True
+
+
+class _AttachmentProfiler:
+    """
+    Profiles one attachment while it uploads: bytes and line counts are updated per
+    chunk, and once the first PROFILE_HEAD_BYTES of a CSV have arrived its dialect and
+    dtypes are inferred in a worker thread, overlapping with the rest of the transfer.
+    """
+
+    def __init__(self, filename: str):
+        low = filename.lower()
+        self.kind = "csv" if low.endswith(".csv") else "json" if low.endswith(JSON_TABLE_EXTENSIONS) else None
+        self.bytes = 0
+        self.newlines = 0
+        self._last_byte = b""
+        self._head = bytearray()
+        self._task: Optional[asyncio.Future] = None
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self.bytes += len(chunk)
+        self.newlines += chunk.count(b"\n")
+        self._last_byte = chunk[-1:]
+        if self.kind and len(self._head) < PROFILE_HEAD_BYTES:
+            self._head += chunk[: PROFILE_HEAD_BYTES - len(self._head)]
+            if self.kind == "csv" and len(self._head) >= PROFILE_HEAD_BYTES:
+                self._task = asyncio.ensure_future(asyncio.to_thread(_profile_csv_head, bytes(self._head), False))
+
+    async def finish(self) -> Dict[str, Any]:
+        profile: Dict[str, Any] = {}
+        lines = self.newlines + (1 if self.bytes and self._last_byte != b"\n" else 0)
+        if self.kind == "csv" and self._head:
+            if self._task is None:  # small file: whole content is the head
+                self._task = asyncio.ensure_future(asyncio.to_thread(_profile_csv_head, bytes(self._head), True))
+            try:
+                profile.update(await self._task)
+            except Exception:
+                return profile
+            profile["rows_estimate"] = max(0, lines - 1)
+        elif self.kind == "json":
+            head = self._head.lstrip()
+            profile["layout"] = "array" if head[:1] == b"[" else "ndjson" if _is_json_line(head) else "object"
+            if profile["layout"] == "ndjson":
+                profile["rows_estimate"] = lines
+        return profile
+
+    def cancel(self) -> None:
+        # Upload aborted: drop a head profile still in flight (its worker thread just runs out)
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+async def _ingest_multipart(request: Request, store: AttachmentStore, total_state: dict) -> Dict[str, Any]:
+    """
+    Parse a multipart body straight from the request stream. questions.txt is kept in
+    memory; every other file part is written to the store and profiled as its bytes
+    arrive. Size limits are enforced per chunk.
+    Returns { question_text, questions_bytes, attachments_meta }; raises HTTPException.
+    """
+    try:
+        from python_multipart.multipart import MultipartParser, parse_options_header
+    except ImportError:  # python-multipart < 0.0.13
+        from multipart.multipart import MultipartParser, parse_options_header
+
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="questions.txt required (multipart/form-data)")
+
+    events: List[Tuple[str, bytes]] = []
+    parser = MultipartParser(options[b"boundary"], {
+        "on_part_begin": lambda: events.append(("begin", b"")),
+        "on_header_field": lambda d, s, e: events.append(("field", d[s:e])),
+        "on_header_value": lambda d, s, e: events.append(("value", d[s:e])),
+        "on_header_end": lambda: events.append(("header_end", b"")),
+        "on_headers_finished": lambda: events.append(("headers_done", b"")),
+        "on_part_data": lambda d, s, e: events.append(("data", d[s:e])),
+        "on_part_end": lambda: events.append(("end", b"")),
+    })
+
+    question: Optional[io.BytesIO] = None
+    question_bytes = 0
+    attachments_meta: List[Dict[str, Any]] = []
+    headers: Dict[bytes, bytes] = {}
+    field, value = b"", b""
+    part: Optional[Dict[str, Any]] = None
+    profilers: List[_AttachmentProfiler] = []
+
+    async def _handle(kind: str, data: bytes) -> None:
+        nonlocal field, value, part, question, question_bytes, headers
+        if kind == "begin":
+            headers, field, value, part = {}, b"", b"", None
+        elif kind == "field":
+            field += data
+        elif kind == "value":
+            value += data
+        elif kind == "header_end":
+            headers[field.lower()] = value
+            field, value = b"", b""
+        elif kind == "headers_done":
+            _, disp = parse_options_header(headers.get(b"content-disposition"))
+            raw_name = disp.get(b"filename")
+            if raw_name is None:
+                part = {"skip": True, "bytes": 0}
+                return
+            filename = raw_name.decode("utf-8", errors="replace")
+            ctype = headers.get(b"content-type", b"").decode("latin-1")
+            if filename.lower() == "questions.txt" and question is None:
+                question = io.BytesIO()
+                part = {"question": True, "bytes": 0}
+            else:
+                safe_name = _sanitize_filename(filename or "attachment")
+                profilers.append(_AttachmentProfiler(safe_name))
+                part = {
+                    "filename": safe_name,
+                    "content_type": ctype,
+                    "bytes": 0,
+                    "writer": store.writer(safe_name),
+                    "profiler": profilers[-1],
+                }
+        elif kind == "data" and part is not None:
+            part["bytes"] += len(data)
+            total_state["total_bytes"] += len(data)
+            if part["bytes"] > PER_FILE_MAX_BYTES or total_state["total_bytes"] > TOTAL_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Upload size limit exceeded")
+            if part.get("question"):
+                question.write(data)
+                question_bytes += len(data)
+            elif not part.get("skip"):
+                part["writer"].write(data)
+                part["profiler"].feed(data)
+        elif kind == "end" and part is not None and "writer" in part:
+            part["writer"].close()
+            attachments_meta.append({
+                "filename": part["filename"],
+                "bytes": part["bytes"],
+                "content_type": part["content_type"],
+                "profile": await part["profiler"].finish(),
+            })
+            part = None
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, data in events:
+                await _handle(kind, data)
+            events.clear()
+        parser.finalize()
+        for kind, data in events:
+            await _handle(kind, data)
+    finally:
+        if part is not None and "writer" in part:
+            part["writer"].close()
+        # On a 413 or a dropped connection, profiles of parts that never finished are not awaited
+        for profiler in profilers:
+            profiler.cancel()
+
+    if question is None:
+        # Fall back to a single text attachment as the questions file
+        text_like = [m for m in attachments_meta if m["content_type"].startswith("text/")]
+        if len(text_like) != 1:
+            raise HTTPException(status_code=400, detail="Missing questions.txt")
+        meta = text_like[0]
+        attachments_meta.remove(meta)
+        with store.open(meta["filename"]) as f:
+            question = io.BytesIO(f.read())
+        store.remove(meta["filename"])
+        question_bytes = meta["bytes"]
+
+    return {
+        "question_text": _strip_bom(question.getvalue()).strip(),
+        "questions_bytes": question_bytes,
+        "attachments_meta": attachments_meta,
+    }
+
+
 async def _process_request(request: Request, request_id: str, steps: List[str]) -> JSONResponse:
     start_ts = _utc_now_iso()
     start_time = datetime.now(timezone.utc)
 
-    temp_dir = tempfile.mkdtemp(prefix=f"req-{request_id[:8]}-")
+    store = AttachmentStore(prefix=f"req-{request_id[:8]}-")
     total_state = {"total_bytes": 0}
 
     try:
@@ -520,8 +1375,7 @@ async def _process_request(request: Request, request_id: str, steps: List[str])
             if uf is qfile:
                 continue
             safe_name = _sanitize_filename(uf.filename or "attachment")
-            dest_path = os.path.join(temp_dir, safe_name)
-            written = await _save_upload_to_disk(uf, dest_path, PER_FILE_MAX_BYTES, total_state)
+            written = await _save_upload(uf, store, safe_name, PER_FILE_MAX_BYTES, total_state)
             attachments_meta.append({"filename": safe_name, "bytes": written})
         steps.append("attachments_saved")
 
@@ -530,24 +1384,23 @@ async def _process_request(request: Request, request_id: str, steps: List[str])
         steps.append("heuristics_done")
 
         # Plan generation (safe & deterministic). Will not send attachment bytes.
-        plan_result = await plan_and_dispatch(request_id, question_text, temp_dir, attachments_meta)
+        plan_result = await plan_and_dispatch(request_id, question_text, store, attachments_meta)
         steps.append("plan_generated" if plan_result.get("ok") else "plan_failed")
 
         duration_ms = int((datetime.now(timezone.utc) - start_time).total_seconds() * 1000)
         # Structured, privacy-conscious log
-        log_event = {
-            "event": "ingest_ack",
-            "request_id": request_id,
-            "task_type": task_type,
-            "file_count": 1 + len(attachments_meta),
-            "filenames": ["questions.txt"] + attachment_names,
-            "bytes_total": total_state["total_bytes"],
-            "provider": plan_result.get("provider"),
-            "model": plan_result.get("model"),
-            "ts": start_ts,
-            "duration_ms": duration_ms,
-        }
-        print(json.dumps(log_event), flush=True)
+        _log_event(
+            "ingest_ack",
+            request_id=request_id,
+            task_type=task_type,
+            file_count=1 + len(attachments_meta),
+            filenames=["questions.txt"] + attachment_names,
+            bytes_total=total_state["total_bytes"],
+            provider=plan_result.get("provider"),
+            model=plan_result.get("model"),
+            ts=start_ts,
+            duration_ms=duration_ms,
+        )
 
         ack: Dict[str, Any] = {
             "request_id": request_id,
@@ -574,7 +1427,7 @@ async def _process_request(request: Request, request_id: str, steps: List[str])
         else:
             ack["plan_error"] = plan_result.get("error")
 
-        return JSONResponse(status_code=202, content=ack)
+        return AnalysisResponse(status_code=202, content=ack)
 
     except HTTPException as he:
         # Log and re-raise as JSON response
@@ -582,22 +1435,18 @@ async def _process_request(request: Request, request_id: str, steps: List[str])
             "request_id": request_id,
             "error": he.detail,
         }
-        print(json.dumps({"event": "error", "request_id": request_id, "status": he.status_code, "detail": he.detail, "ts": _utc_now_iso()}), flush=True)
-        return JSONResponse(status_code=he.status_code, content=error_payload)
+        _log_event("error", request_id=request_id, status=he.status_code, detail=he.detail, ts=_utc_now_iso())
+        return AnalysisResponse(status_code=he.status_code, content=error_payload)
     except Exception as e:
         error_payload = {
             "request_id": request_id,
             "error": "Internal server error",
         }
-        print(json.dumps({"event": "error", "request_id": request_id, "status": 500, "detail": str(e), "ts": _utc_now_iso()}), flush=True)
-        return JSONResponse(status_code=500, content=error_payload)
+        _log_event("error", request_id=request_id, status=500, detail=str(e), ts=_utc_now_iso())
+        return AnalysisResponse(status_code=500, content=error_payload)
     finally:
-        # Cleanup temp directory
-        try:
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
-        except Exception:
-            pass
+        # Spilled files (if any) are removed off the response path
+        store.release()
 
 
 @app.post("/")
@@ -613,13 +1462,19 @@ async def ingest(request: Request):
             "error": "Processing timed out. Please try a smaller request or simplify inputs.",
             "steps_completed": steps,
         }
-        print(json.dumps({"event": "timeout", "request_id": request_id, "ts": _utc_now_iso()}), flush=True)
-        return JSONResponse(status_code=504, content=payload)
+        _log_event("timeout", request_id=request_id, ts=_utc_now_iso())
+        return AnalysisResponse(status_code=504, content=payload)
 
 
 @app.get("/")
 async def health():
-    return {"status": "ok", "name": "data-analyst-agent", "time": _utc_now_iso()}
+    return {
+        "status": "ok",
+        "name": "data-analyst-agent",
+        "time": _utc_now_iso(),
+        "providers": {p: h.snapshot() for p, h in _PROVIDER_HEALTH.items()},
+        "answer_cache": _ANSWER_CACHE.stats(),
+    }
 
 
 # Optional: make handler also available under common paths (useful behind certain platforms)
@@ -628,8 +1483,13 @@ for route in ["/api/index", "/api/index/"]:
     app.add_api_route(route, ingest, methods=["POST"])
 
 
-# ---- Helper: simple math evaluator ----
+# ---- Helper: cost-bounded expression evaluator ----
 import ast
+import operator
+
+MATH_MAX_NODES = int(os.getenv("MATH_MAX_NODES", 256))                        # AST nodes per expression
+MATH_MAX_INT_BITS = int(os.getenv("MATH_MAX_INT_BITS", 4096))                 # largest integer intermediate
+MATH_MAX_VECTOR_OPS = int(os.getenv("MATH_MAX_VECTOR_OPS", 200_000_000))      # nodes x rows for column expressions
 
 ALLOWED_AST_NODES = (
     ast.Expression,
@@ -645,42 +1505,493 @@ ALLOWED_AST_NODES = (
     ast.FloorDiv,
     ast.UAdd,
     ast.USub,
-    ast.Pow,  # allow exponentiation cautiously
+    ast.Pow,  # allowed; cost-checked in _estimate_cost
     ast.Load,
-    ast.Call,  # will be rejected below
-    ast.Name,  # will be rejected below
+    ast.Call,  # column expressions only, allowlisted functions
+    ast.Name,  # column expressions only, must be a known column
 )
 
+# Extra nodes accepted when an expression is evaluated over dataframe columns
+COLUMN_AST_NODES = (
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.BoolOp, ast.And, ast.Or, ast.Not,
+)
 
-def _is_safe_ast(node: ast.AST) -> bool:
+_BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: operator.pow,
+}
+_CMP_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+# Function name -> numpy ufunc name, for column expressions
+_VECTOR_FUNCS = {"abs": "absolute", "sqrt": "sqrt", "log": "log", "log10": "log10", "exp": "exp", "round": "round"}
+
+
+def _is_safe_ast(node: ast.AST, *, columns: bool = False) -> bool:
+    allowed = ALLOWED_AST_NODES + COLUMN_AST_NODES if columns else ALLOWED_AST_NODES
     for child in ast.walk(node):
-        if not isinstance(child, ALLOWED_AST_NODES):
+        if not isinstance(child, allowed):
             return False
-        # Disallow names and calls to avoid attacks
-        if isinstance(child, (ast.Call, ast.Name)):
+        if isinstance(child, ast.Constant) and not isinstance(child.value, (int, float, str)):
             return False
+        if not columns:
+            # Names, calls and strings only make sense over columns
+            if isinstance(child, (ast.Call, ast.Name)):
+                return False
+            if isinstance(child, ast.Constant) and isinstance(child.value, str):
+                return False
+        elif isinstance(child, ast.Call):
+            if not isinstance(child.func, ast.Name) or child.func.id not in _VECTOR_FUNCS or child.keywords or len(child.args) != 1:
+                return False
     return True
 
 
+def _estimate_cost(node: ast.AST, columns: Dict[str, str]) -> Tuple[str, int]:
+    """
+    Statically bound an expression before running it. Returns (kind, bits) where kind
+    is "int", "float", "str", "vector" (numeric/bool column) or "text" (any other column)
+    and bits bounds the size of integer results. columns maps identifiers to "vector" or
+    "text". Raises ValueError when an integer intermediate could exceed MATH_MAX_INT_BITS
+    (e.g. 9**9**9), which is the only way plain arithmetic can run unbounded, and for
+    anything but ==/!= on text columns, whose object arrays would otherwise be repeated
+    or concatenated element by element ("name * 10**9").
+    """
+    if isinstance(node, ast.Expression):
+        return _estimate_cost(node.body, columns)
+    if isinstance(node, ast.Constant):
+        v = node.value
+        if isinstance(v, str):
+            return "str", 0
+        if isinstance(v, int):
+            return "int", max(1, abs(v).bit_length())
+        return "float", 0
+    if isinstance(node, ast.Name):
+        if node.id not in columns:
+            raise ValueError(f"unknown_column:{node.id}")
+        return columns[node.id], 0
+    if isinstance(node, ast.Call):
+        if _estimate_cost(node.args[0], columns)[0] in ("str", "text"):
+            raise ValueError("string_arithmetic")
+        return "vector", 0
+    if isinstance(node, ast.UnaryOp):
+        kind, bits = _estimate_cost(node.operand, columns)
+        if kind in ("str", "text"):
+            raise ValueError("string_arithmetic")
+        return kind, bits
+    if isinstance(node, ast.Compare):
+        kinds = [_estimate_cost(sub, columns)[0] for sub in [node.left] + list(node.comparators)]
+        if "text" in kinds and not all(isinstance(o, (ast.Eq, ast.NotEq)) for o in node.ops):
+            raise ValueError("text_column_comparison")
+        return "vector", 0
+    if isinstance(node, ast.BoolOp):
+        for sub in node.values:
+            if _estimate_cost(sub, columns)[0] == "text":
+                raise ValueError("string_arithmetic")
+        return "vector", 0
+    if isinstance(node, ast.BinOp):
+        lk, lb = _estimate_cost(node.left, columns)
+        rk, rb = _estimate_cost(node.right, columns)
+        if {"str", "text"} & {lk, rk}:
+            raise ValueError("string_arithmetic")
+        if "vector" in (lk, rk):
+            return "vector", 0
+        if lk == "float" or rk == "float" or isinstance(node.op, ast.Div):
+            return "float", 0
+        if isinstance(node.op, ast.Pow):
+            if lb <= 1:  # base is -1, 0 or 1
+                return "int", 1
+            if rb > 32:
+                raise ValueError("expression_too_expensive")
+            bits = lb * (1 << rb)
+        elif isinstance(node.op, ast.Mult):
+            bits = lb + rb
+        elif isinstance(node.op, (ast.Add, ast.Sub)):
+            bits = max(lb, rb) + 1
+        else:  # FloorDiv, Mod
+            bits = lb
+        if bits > MATH_MAX_INT_BITS:
+            raise ValueError("expression_too_expensive")
+        return "int", bits
+    raise ValueError("unsupported_expression")
+
+
+def _column_identifier(name: Any) -> str:
+    # Column names usable as expression identifiers: "Unit Price" -> "Unit_Price"
+    ident = re.sub(r"\W+", "_", str(name)).strip("_")
+    if not ident or ident[0].isdigit():
+        ident = f"c_{ident}"
+    return ident
+
+
+def _build_evaluator(node: ast.AST):
+    # Turn a validated AST into nested closures; evaluation never goes through eval()
+    if isinstance(node, ast.Expression):
+        return _build_evaluator(node.body)
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda env: value
+    if isinstance(node, ast.Name):
+        name = node.id
+        return lambda env: env[name]
+    if isinstance(node, ast.Call):
+        import numpy as np
+        fn = getattr(np, _VECTOR_FUNCS[node.func.id])
+        arg = _build_evaluator(node.args[0])
+        return lambda env: fn(arg(env))
+    if isinstance(node, ast.UnaryOp):
+        operand = _build_evaluator(node.operand)
+        if isinstance(node.op, ast.USub):
+            return lambda env: -operand(env)
+        if isinstance(node.op, ast.Not):
+            import numpy as np
+            return lambda env: np.logical_not(operand(env))
+        return lambda env: +operand(env)
+    if isinstance(node, ast.BinOp):
+        op = _BIN_OPS[type(node.op)]
+        left, right = _build_evaluator(node.left), _build_evaluator(node.right)
+        return lambda env: op(left(env), right(env))
+    if isinstance(node, ast.Compare):
+        first = _build_evaluator(node.left)
+        pairs = [(_CMP_OPS[type(o)], _build_evaluator(c)) for o, c in zip(node.ops, node.comparators)]
+
+        def _compare(env):
+            import numpy as np
+            lhs, result = first(env), True
+            for op, rhs_fn in pairs:
+                rhs = rhs_fn(env)
+                result = np.logical_and(result, op(lhs, rhs))
+                lhs = rhs
+            return result
+        return _compare
+    if isinstance(node, ast.BoolOp):
+        values = [_build_evaluator(v) for v in node.values]
+        is_and = isinstance(node.op, ast.And)
+
+        def _boolop(env):
+            import numpy as np
+            combine = np.logical_and if is_and else np.logical_or
+            result = values[0](env)
+            for fn in values[1:]:
+                result = combine(result, fn(env))
+            return result
+        return _boolop
+    raise ValueError("unsupported_expression")
+
+
+def compile_expression(expr: str, columns: Optional[Dict[Any, str]] = None) -> Dict[str, Any]:
+    """
+    Parse, validate and cost-check an expression, returning
+    { ok: True, fn, nodes, kind, columns } or { ok: False, error }.
+    Without columns only numeric literals are accepted (as in eval_simple_math).
+    With columns ({label: "vector" | "text"}, see _column_kind), identifiers refer to
+    dataframe columns (non-word characters become "_"), and comparisons, and/or/not and
+    abs/sqrt/log/log10/exp/round are allowed; text columns only support == and !=.
+    fn(env) evaluates with env mapping column names to arrays.
+    """
+    try:
+        tree = ast.parse((expr or "").strip(), mode="eval")
+    except Exception:
+        return {"ok": False, "error": "invalid_expression"}
+    with_columns = columns is not None
+    if not _is_safe_ast(tree, columns=with_columns):
+        return {"ok": False, "error": "invalid_expression"}
+    nodes = sum(1 for _ in ast.walk(tree))
+    if nodes > MATH_MAX_NODES:
+        return {"ok": False, "error": "expression_too_expensive"}
+    ident_map = {_column_identifier(c): c for c in (columns or {})}
+    try:
+        kind, _ = _estimate_cost(tree, {ident: columns[c] for ident, c in ident_map.items()})
+    except ValueError as e:
+        return {"ok": False, "error": str(e)}
+    func_names = {id(n.func) for n in ast.walk(tree) if isinstance(n, ast.Call)}
+    used = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and id(n) not in func_names}
+    return {
+        "ok": True,
+        "fn": _build_evaluator(tree),
+        "nodes": nodes,
+        "kind": kind,
+        "columns": {ident: ident_map[ident] for ident in sorted(used)},
+    }
+
+
 def eval_simple_math(expr: str) -> Optional[float]:
     """Evaluate a simple arithmetic expression safely. Returns None if not simple.
-    Supports +, -, *, /, //, %, ** and parentheses.
+    Supports +, -, *, /, //, %, ** and parentheses; expressions whose integer
+    results would be too large (e.g. 9**9**9) are rejected before evaluation.
     """
+    compiled = compile_expression(expr)
+    if not compiled["ok"]:
+        return None
     try:
-        tree = ast.parse(expr.strip(), mode="eval")
+        return float(compiled["fn"]({}))
     except Exception:
         return None
-    if not _is_safe_ast(tree):
+
+
+def _column_kind(series) -> str:
+    # "vector" for columns evaluated as float/bool arrays, "text" for everything else
+    import pandas as pd
+    return "vector" if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series) else "text"
+
+
+def eval_column_expression(expr: str, df) -> Dict[str, Any]:
+    """
+    Evaluate an expression over whole dataframe columns as vectorized NumPy operations.
+    Returns { ok: True, value } (array or scalar) or { ok: False, error }.
+    """
+    compiled = compile_expression(expr, columns={c: _column_kind(df[c]) for c in df.columns})
+    if not compiled["ok"]:
+        return compiled
+    if compiled["nodes"] * max(1, len(df)) > MATH_MAX_VECTOR_OPS:
+        return {"ok": False, "error": "expression_too_expensive"}
+    import numpy as np
+    import pandas as pd
+    env = {}
+    for ident, col in compiled["columns"].items():
+        series = df[col]
+        if pd.api.types.is_bool_dtype(series):
+            env[ident] = series.to_numpy(dtype=bool, na_value=False)
+        elif pd.api.types.is_numeric_dtype(series):
+            env[ident] = series.to_numpy(dtype="float64", na_value=np.nan)
+        else:
+            # Categorical / Arrow-backed strings come out as plain objects, missing as NaN
+            env[ident] = series.to_numpy(dtype=object, na_value=np.nan)
+    try:
+        with np.errstate(all="ignore"):
+            value = compiled["fn"](env)
+    except Exception as e:
+        return {"ok": False, "error": f"evaluation_error:{type(e).__name__}"}
+    return {"ok": True, "value": value}
+
+
+def _round_number(val: float):
+    # Present integral floats as ints and keep the rest short
+    if not math.isfinite(val):
+        return None
+    return int(val) if abs(val - int(val)) < 1e-9 else round(val, 6)
+
+
+def _aggregate_array(values, how: str):
+    """Reduce an evaluated column (numeric or boolean mask) to a single number; None if unsupported."""
+    import numpy as np
+    arr = np.asarray(values)
+    if how == "count":
+        return int(np.count_nonzero(arr)) if arr.dtype == bool else int(np.count_nonzero(~np.isnan(arr.astype("float64"))))
+    reducer = {"sum": np.nansum, "mean": np.nanmean, "min": np.nanmin, "max": np.nanmax,
+               "median": np.nanmedian, "std": np.nanstd}.get(how)
+    if reducer is None:
         return None
     try:
-        return float(eval(compile(tree, "<expr>", "eval")))
+        out = float(reducer(arr.astype("float64")))
     except Exception:
         return None
+    return None if math.isnan(out) else _round_number(out)
 
 
 # ---- Attachment loaders & lightweight analysis ----
 
-def load_attachments(attachments_dir: str, attachments_meta: List[Dict[str, Any]]):
+JSON_TABLE_EXTENSIONS = (".json", ".ndjson", ".jsonl")
+JSON_BATCH_ROWS = int(os.getenv("JSON_BATCH_ROWS", 5000))   # records materialized as Python objects at once
+_JSON_RECORD_KEYS = ("data", "records", "items", "results", "rows")
+
+
+def _table_name(filename: str) -> str:
+    # SQL-friendly table name for an attachment: "sales-2024.csv" -> "sales_2024"
+    stem = os.path.splitext(filename)[0]
+    name = re.sub(r"\W+", "_", stem).strip("_").lower() or "t"
+    return f"t_{name}" if name[0].isdigit() else name
+
+
+def _flatten_record(obj: Any, prefix: str = "", out: Optional[Dict[str, Any]] = None, depth: int = 0) -> Dict[str, Any]:
+    """Flatten nested objects into dotted column names; lists are kept as JSON text."""
+    if out is None:
+        out = {}
+    if not isinstance(obj, dict):
+        out[prefix or "value"] = json.dumps(obj) if isinstance(obj, list) else obj
+        return out
+    for key, val in obj.items():
+        col = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(val, dict) and val and depth < 8:
+            _flatten_record(val, col, out, depth + 1)
+        elif isinstance(val, (list, dict)):
+            out[col] = json.dumps(val)
+        else:
+            out[col] = val
+    return out
+
+
+def _unwrap_records(obj: Any):
+    # A single top-level object: yield the records it wraps, or the object itself
+    if isinstance(obj, dict):
+        lists = [(k, v) for k, v in obj.items() if isinstance(v, list) and v and isinstance(v[0], dict)]
+        if lists:
+            preferred = [kv for kv in lists if kv[0].lower() in _JSON_RECORD_KEYS]
+            yield from max(preferred or lists, key=lambda kv: len(kv[1]))[1]
+            return
+    if isinstance(obj, list):
+        yield from obj
+        return
+    yield obj
+
+
+def iter_json_records(fh, chunk_size: int = 1024 * 1024):
+    """
+    Stream records from a text file object holding a JSON array, NDJSON/concatenated
+    objects, or a single object wrapping a list of records (e.g. {"data": [...]}).
+    Only one array element is decoded at a time, so memory stays proportional to the
+    largest record rather than the whole file. Inside a wrapper object the first list of
+    objects under a _JSON_RECORD_KEYS key is streamed; other wrappers are decoded whole.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def _more(size: int) -> bool:
+        nonlocal buf, pos, eof
+        chunk = fh.read(size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def _peek(skip: str = "") -> str:
+        # Skip whitespace (and separators in `skip`); return next char or "" at EOF
+        nonlocal pos
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] in skip):
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if eof or not _more(chunk_size):
+                return ""
+
+    def _value() -> Any:
+        nonlocal pos
+        size = chunk_size
+        while True:
+            try:
+                val, end = decoder.raw_decode(buf, pos)
+                # A bare number at the end of the buffer may continue in the next chunk
+                if end < len(buf) or eof or isinstance(val, (dict, list, str)):
+                    pos = end
+                    return val
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            if not _more(size):
+                continue
+            size *= 2  # large records: read ahead faster instead of re-parsing per chunk
+
+    def _peek_inside() -> str:
+        # First char inside the array opening at pos, without consuming the "["
+        while True:
+            i = pos + 1
+            while i < len(buf) and buf[i].isspace():
+                i += 1
+            if i < len(buf):
+                return buf[i]
+            if eof or not _more(chunk_size):
+                return ""
+
+    def _items():
+        nonlocal pos
+        pos += 1
+        while True:
+            ch = _peek(",")
+            if ch in ("]", ""):
+                pos += len(ch)
+                return
+            yield _value()
+
+    def _wrapper():
+        # Walk a top-level object; stream its record list, decode every other member whole.
+        # Returns (members decoded whole, whether a record list was streamed)
+        nonlocal pos
+        pos += 1
+        members: Dict[str, Any] = {}
+        streamed = False
+        while True:
+            ch = _peek(",")
+            if ch in ("}", ""):
+                pos += len(ch)
+                return members, streamed
+            key = _value()
+            if _peek() != ":":
+                raise json.JSONDecodeError("Expecting ':' delimiter", buf, pos)
+            pos += 1
+            ch = _peek()
+            if not streamed and ch == "[" and str(key).lower() in _JSON_RECORD_KEYS and _peek_inside() == "{":
+                streamed = True
+                yield from _items()
+            else:
+                members[key] = _value()
+
+    first = _peek()
+    if first == "[":
+        yield from _items()
+        return
+    if first == "":
+        return
+    if first == "{":
+        head, streamed = yield from _wrapper()
+    else:
+        head, streamed = _value(), False
+    if streamed:
+        # Records already came from the wrapper; further top-level values are more wrappers
+        while _peek() != "":
+            yield from _unwrap_records(_value())
+        return
+    if _peek() == "":
+        yield from _unwrap_records(head)
+        return
+    # Several top-level values: NDJSON / concatenated objects
+    yield head
+    while _peek() != "":
+        yield _value()
+
+
+def read_json_table(source, *, batch_rows: int = JSON_BATCH_ROWS):
+    """
+    Read a JSON/NDJSON file (path or text file object) into a DataFrame.
+    Records are flattened and converted to columnar batches of batch_rows;
+    column sets are unioned across batches and dtypes inferred per column.
+    """
+    import pandas as pd  # local import
+    fh = open(source, "r", encoding="utf-8", errors="replace") if isinstance(source, str) else source
+    try:
+        batches = []
+        rows: List[Dict[str, Any]] = []
+        for rec in iter_json_records(fh):
+            rows.append(_flatten_record(rec))
+            if len(rows) >= batch_rows:
+                batches.append(pd.DataFrame.from_records(rows))
+                rows = []
+        if rows:
+            batches.append(pd.DataFrame.from_records(rows))
+    finally:
+        if isinstance(source, str):
+            fh.close()
+    if not batches:
+        return pd.DataFrame()
+    df = batches[0] if len(batches) == 1 else pd.concat(batches, ignore_index=True, sort=False)
+    return df.infer_objects()
+
+
+def load_attachments(attachments: AttachmentStore, attachments_meta: List[Dict[str, Any]]):
     dataframes: Dict[str, Any] = {}
     json_objs: Dict[str, Any] = {}
     others: Dict[str, Dict[str, Any]] = {}
@@ -688,30 +1999,1253 @@ def load_attachments(attachments_dir: str, attachments_meta: List[Dict[str, Any]
         fn = meta.get("filename")
         if not fn:
             continue
-        path = os.path.join(attachments_dir, fn)
         low = fn.lower()
         try:
             if low.endswith(".csv"):
                 import pandas as pd  # local import to keep import time low
                 # Read small/medium CSV; our upload caps keep this bounded
-                df = pd.read_csv(path)
+                df = pd.read_csv(attachments.open(fn), **_csv_read_kwargs(meta))
                 dataframes[fn] = df
-            elif low.endswith(".json"):
-                with open(path, "r", encoding="utf-8") as f:
-                    json_objs[fn] = json.load(f)
+            elif low.endswith(JSON_TABLE_EXTENSIONS):
+                # Streamed into a table instead of building the whole object tree
+                dataframes[fn] = read_json_table(attachments.open_text(fn))
             elif low.endswith((".txt", ".md")):
-                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                with attachments.open_text(fn) as f:
                     txt = f.read(1024 * 64)
                 others[fn] = {"preview": txt[:200]}
             else:
                 # Just capture metadata for unknown types
-                stat = os.stat(path)
-                others[fn] = {"bytes": stat.st_size}
+                others[fn] = {"bytes": attachments.size(fn)}
         except Exception as e:
             others[fn] = {"error": str(e)}
     return dataframes, json_objs, others
 
 
+# ---- Artifact store: memory budget, dtype compaction, spilling ----
+import pickle
+import weakref
+from collections.abc import MutableMapping
+
+ARTIFACT_MEMORY_BUDGET_BYTES = int(os.getenv("ARTIFACT_MEMORY_BUDGET_BYTES", 256 * 1024 * 1024))   # per request
+CATEGORY_MAX_UNIQUE_RATIO = float(os.getenv("CATEGORY_MAX_UNIQUE_RATIO", 0.5))   # object -> category cutoff
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def compact_frame(df):
+    """
+    Shrink a freshly loaded DataFrame without changing any value: repetitive string
+    columns become categoricals, and other string columns become Arrow-backed when
+    pyarrow is installed. Numeric columns keep their dtypes: float32 would change
+    summaries, and int32 would make DuckDB and pandas arithmetic on the frame overflow
+    where int64 does not (sum(price * qty)).
+    """
+    import pandas as pd
+    arrow_strings = _has_pyarrow()
+    out = df.copy(deep=False)
+    for i in range(df.shape[1]):
+        s = df.iloc[:, i]
+        if s.dtype == object and len(s) and pd.api.types.infer_dtype(s, skipna=True) == "string":
+            if s.nunique(dropna=True) <= len(s) * CATEGORY_MAX_UNIQUE_RATIO:
+                out.isetitem(i, s.astype("category"))
+            elif arrow_strings:
+                out.isetitem(i, s.astype("string[pyarrow]"))
+    return out
+
+
+def _artifact_nbytes(value) -> int:
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    import sys
+    return sys.getsizeof(value)
+
+
+class ArtifactStore(MutableMapping):
+    """
+    Request-scoped mapping of named artifacts (mostly DataFrames) with size accounting.
+    When resident artifacts exceed budget_bytes, the least recently used frames are
+    written to the attachment store's scratch dir (Arrow IPC when pyarrow is present,
+    pickle otherwise) and transparently reloaded on the next access. Stored frames are
+    treated as immutable, so a reloaded frame keeps its spill file for the next eviction.
+    """
+
+    def __init__(self, scratch: AttachmentStore, budget_bytes: int = ARTIFACT_MEMORY_BUDGET_BYTES):
+        self._scratch = scratch
+        self.budget_bytes = budget_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()   # LRU order
+        self._by_id: Dict[int, str] = {}
+        self._lock = threading.RLock()
+        self.resident_bytes = 0
+        self.spills = 0
+
+    def __getitem__(self, key: str):
+        with self._lock:
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            if entry["value"] is None:
+                # A step may still hold the evicted object; reuse it rather than reading back
+                alive = entry["ref"]() if entry["ref"] else None
+                entry["value"] = alive if alive is not None else self._load(entry)
+                entry["ref"] = self._ref(entry["value"])
+                self._by_id[id(entry["value"])] = key
+                self.resident_bytes += entry["bytes"]
+                self._enforce(keep=key)
+            return entry["value"]
+
+    def __setitem__(self, key: str, value) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            entry = {"value": value, "bytes": _artifact_nbytes(value), "path": None, "ref": self._ref(value)}
+            self._entries[key] = entry
+            self._by_id[id(value)] = key
+            self.resident_bytes += entry["bytes"]
+            self._enforce(keep=key)
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            self._discard(key)
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key_of(self, value) -> Optional[str]:
+        """Key under which this exact object is stored (resident or spilled), if any."""
+        key = self._by_id.get(id(value))
+        entry = self._entries.get(key) if key is not None else None
+        if entry and (entry["value"] is value or (entry["ref"] and entry["ref"]() is value)):
+            return key
+        return None
+
+    @staticmethod
+    def _ref(value):
+        try:
+            return weakref.ref(value)
+        except TypeError:  # str/bytes/dict artifacts
+            return None
+
+    def view(self, scope: str) -> "_ArtifactView":
+        return _ArtifactView(self, scope)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "artifacts": len(self._entries),
+                "resident_bytes": self.resident_bytes,
+                "spilled": sum(1 for e in self._entries.values() if e["value"] is None),
+                "spills": self.spills,
+                "budget_bytes": self.budget_bytes,
+            }
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        for obj_id in [i for i, k in self._by_id.items() if k == key]:
+            del self._by_id[obj_id]
+        if entry["value"] is not None:
+            self.resident_bytes -= entry["bytes"]
+        if entry["path"]:
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+
+    def _enforce(self, keep: str) -> None:
+        for key in list(self._entries):
+            if self.resident_bytes <= self.budget_bytes:
+                return
+            entry = self._entries[key]
+            if key == keep or entry["value"] is None or not hasattr(entry["value"], "to_pickle"):
+                continue
+            self._spill(key, entry)
+
+    def _spill(self, key: str, entry: Dict[str, Any]) -> None:
+        value = entry["value"]
+        if entry["path"] is None:
+            path = self._scratch.scratch_path(f".artifact-{uuid.uuid4().hex}")
+            entry["format"] = "pickle"
+            if _has_pyarrow():
+                try:
+                    value.to_feather(path)  # Arrow IPC; needs a default index and string column names
+                    entry["format"] = "arrow"
+                except Exception:
+                    pass
+            if entry["format"] == "pickle":
+                with open(path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            entry["path"] = path
+            self.spills += 1
+            _log_event("artifact_spill", key=key, bytes=entry["bytes"], format=entry["format"])
+        entry["value"] = None
+        self.resident_bytes -= entry["bytes"]
+
+    @staticmethod
+    def _load(entry: Dict[str, Any]):
+        import pandas as pd
+        if entry["format"] == "arrow":
+            return pd.read_feather(entry["path"])
+        with open(entry["path"], "rb") as f:
+            return pickle.load(f)  # written by _spill in this request
+
+
+class _ArtifactView(MutableMapping):
+    """
+    One plan's named frames inside a shared ArtifactStore. Assigning an object the store
+    already holds (e.g. a parsed attachment) aliases it; anything else is stored under a
+    scope-prefixed key so concurrent plans cannot overwrite each other's derived frames.
+    """
+
+    def __init__(self, store: ArtifactStore, scope: str):
+        self._store = store
+        self._scope = scope
+        self._keys: Dict[str, str] = {}
+
+    def __getitem__(self, name: str):
+        return self._store[self._keys[name]]
+
+    def __setitem__(self, name: str, value) -> None:
+        key = self._store.key_of(value)
+        if key is None:
+            key = f"{self._scope}/{name}"
+            self._store[key] = value
+        self._keys[name] = key
+
+    def __delitem__(self, name: str) -> None:
+        key = self._keys.pop(name)
+        if key.startswith(f"{self._scope}/"):
+            self._store.pop(key, None)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def release(self) -> None:
+        """Drop frames this plan derived; shared attachment frames stay cached."""
+        for name in list(self._keys):
+            del self[name]
+
+
+# ---- DuckDB structured queries over Parquet / .duckdb attachments ----
+
+PARQUET_QUERY_MAX_ROWS = int(os.getenv("PARQUET_QUERY_MAX_ROWS", 1000))   # LIMIT cap for structured queries
+
+_SQL_AGGREGATES = {
+    "sum": "sum", "avg": "avg", "mean": "avg", "min": "min", "max": "max", "count": "count",
+    "median": "median", "std": "stddev_samp", "stddev": "stddev_samp", "count_distinct": "count",
+}
+_SQL_COMPARE_OPS = {"=": "=", "==": "=", "!=": "<>", "<>": "<>", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+
+
+def _quote_ident(name: Any) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_string(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _normalize_filters(filters: Any) -> List[Dict[str, Any]]:
+    # Accept [{"column", "op", "value"}] or a plain {column: value} equality mapping
+    if isinstance(filters, dict):
+        return [{"column": k, "op": "=", "value": v} for k, v in filters.items()]
+    return [f for f in (filters or []) if isinstance(f, dict) and f.get("column")]
+
+
+def compile_structured_query(params: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """
+    Compile structured params into a DuckDB SELECT over `source`:
+      columns: [..]                      projection (ignored when grouping or aggregating)
+      filters: [{column, op, value}]     op: = != < <= > >= in not_in between like is_null not_null
+      group_by: [..]                     one row per group, even without aggregates
+      aggregates: [{fn, column, as}]     fn: sum avg min max count count_distinct median std
+      order_by: [{column, desc}] or ["col", "-col"]
+      limit: int (capped at PARQUET_QUERY_MAX_ROWS)
+    Values are bound as parameters and identifiers quoted. Returns
+    { sql, args, columns_read (None = all columns), limit }; raises ValueError on bad params.
+    """
+    filters = _normalize_filters(params.get("filters"))
+    group_by = params.get("group_by") or []
+    group_by = [group_by] if isinstance(group_by, str) else [str(c) for c in group_by]
+    aggregates = [a for a in (params.get("aggregates") or []) if isinstance(a, dict)]
+    columns = [str(c) for c in (params.get("columns") or [])]
+    touched = set(group_by) | {str(f["column"]) for f in filters}
+
+    select: List[str] = []
+    if aggregates:
+        select.extend(_quote_ident(c) for c in group_by)
+        for agg in aggregates:
+            fn = str(agg.get("fn") or "").lower()
+            if fn not in _SQL_AGGREGATES:
+                raise ValueError(f"unsupported_aggregate:{fn}")
+            col = agg.get("column") or "*"
+            alias = agg.get("as") or f"{fn}_{'all' if col == '*' else col}"
+            if col == "*":
+                if fn != "count":
+                    raise ValueError("aggregate_needs_column")
+                expr = "count(*)"
+            else:
+                touched.add(str(col))
+                distinct = "DISTINCT " if fn == "count_distinct" else ""
+                expr = f"{_SQL_AGGREGATES[fn]}({distinct}{_quote_ident(col)})"
+            select.append(f"{expr} AS {_quote_ident(alias)}")
+    elif group_by:
+        select.extend(_quote_ident(c) for c in group_by)
+    elif columns:
+        select.extend(_quote_ident(c) for c in columns)
+        touched |= set(columns)
+    else:
+        select.append("*")
+
+    where: List[str] = []
+    args: List[Any] = []
+    for f in filters:
+        col = _quote_ident(f["column"])
+        op = str(f.get("op") or "=").lower()
+        val = f.get("value")
+        if op in _SQL_COMPARE_OPS:
+            where.append(f"{col} {_SQL_COMPARE_OPS[op]} ?")
+            args.append(val)
+        elif op in {"in", "not_in"}:
+            vals = list(val) if isinstance(val, (list, tuple)) else [val]
+            if not vals:
+                raise ValueError("empty_in_list")
+            where.append(f"{col} {'NOT IN' if op == 'not_in' else 'IN'} ({', '.join('?' for _ in vals)})")
+            args.extend(vals)
+        elif op == "between" and isinstance(val, (list, tuple)) and len(val) == 2:
+            where.append(f"{col} BETWEEN ? AND ?")
+            args.extend(val)
+        elif op == "like":
+            where.append(f"{col} LIKE ?")
+            args.append(val)
+        elif op in {"is_null", "not_null"}:
+            where.append(f"{col} IS {'NOT ' if op == 'not_null' else ''}NULL")
+        else:
+            raise ValueError(f"unsupported_filter:{op}")
+
+    order: List[str] = []
+    for item in params.get("order_by") or []:
+        if isinstance(item, dict):
+            col, desc = item.get("column"), bool(item.get("desc"))
+        else:
+            col, desc = str(item).lstrip("-"), str(item).startswith("-")
+        if col:
+            order.append(f"{_quote_ident(col)}{' DESC' if desc else ''}")
+
+    try:
+        limit = int(params.get("limit") or PARQUET_QUERY_MAX_ROWS)
+    except (TypeError, ValueError):
+        limit = PARQUET_QUERY_MAX_ROWS
+    limit = max(1, min(limit, PARQUET_QUERY_MAX_ROWS))
+
+    sql = f"SELECT {', '.join(select)} FROM {source}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if group_by:
+        sql += " GROUP BY " + ", ".join(_quote_ident(c) for c in group_by)
+    if order:
+        sql += " ORDER BY " + ", ".join(order)
+    sql += f" LIMIT {limit}"
+    columns_read = None if select == ["*"] else sorted(touched)
+    return {"sql": sql, "args": args, "columns_read": columns_read, "limit": limit}
+
+
+def _stat_excludes(kind: str, lo: Optional[str], hi: Optional[str], op: str, value: Any) -> bool:
+    # True when a row group's [min, max] statistics prove no row can satisfy `col op value`
+    if lo is None or hi is None or value is None or isinstance(value, bool):
+        return False
+    try:
+        if kind in {"INT32", "INT64", "FLOAT", "DOUBLE"}:
+            lo_v, hi_v, v = float(lo), float(hi), float(value)
+        elif kind == "BYTE_ARRAY" and isinstance(value, str):
+            lo_v, hi_v, v = lo, hi, value
+        else:
+            return False
+    except (TypeError, ValueError):
+        return False
+    op = _SQL_COMPARE_OPS.get(op, op)
+    if op == "=":
+        return v < lo_v or v > hi_v
+    if op == "<":
+        return lo_v >= v
+    if op == "<=":
+        return lo_v > v
+    if op == ">":
+        return hi_v <= v
+    if op == ">=":
+        return hi_v < v
+    return False
+
+
+def parquet_scan_stats(con, files: List[str], filters: List[Dict[str, Any]], columns_read: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    Estimate what a query reads from Parquet using footer metadata only: row groups whose
+    min/max statistics rule out a filter are pruned (as DuckDB's zone maps do), and bytes
+    are counted for the projected columns of the remaining row groups. These are not
+    measurements; DuckDB's profiler reports no row-group or byte counts, hence the
+    *_estimated field names.
+    """
+    rows = con.execute(
+        "SELECT file_name, row_group_id, path_in_schema, type, stats_min_value, stats_max_value, total_compressed_size "
+        "FROM parquet_metadata(?)",
+        [files],
+    ).fetchall()
+    groups: Dict[Tuple[str, int], Dict[str, Tuple[str, Optional[str], Optional[str], int]]] = {}
+    for file_name, rg, path, kind, lo, hi, size in rows:
+        top = str(path).split(".")[0]
+        groups.setdefault((file_name, rg), {})[top] = (kind, lo, hi, int(size or 0))
+    wanted = set(columns_read) if columns_read is not None else None
+    bytes_total = bytes_scanned = scanned = 0
+    for cols in groups.values():
+        group_bytes = sum(c[3] for c in cols.values())
+        bytes_total += group_bytes
+        pruned = any(
+            str(f["column"]) in cols and _stat_excludes(*cols[str(f["column"])][:3], str(f.get("op") or "="), f.get("value"))
+            for f in filters
+        )
+        if pruned:
+            continue
+        scanned += 1
+        bytes_scanned += group_bytes if wanted is None else sum(c[3] for name, c in cols.items() if name in wanted)
+    return {
+        "files": len(files),
+        "row_groups_total": len(groups),
+        "row_groups_scanned_estimated": scanned,
+        "bytes_total": bytes_total,
+        "bytes_scanned_estimated": bytes_scanned,
+        "columns_read": columns_read if columns_read is not None else "*",
+    }
+
+
+# ---- Schema-only text-to-SQL ----
+
+TEXT_TO_SQL_MAX_ROWS = int(os.getenv("TEXT_TO_SQL_MAX_ROWS", 200))            # LIMIT enforced on generated SQL
+SQL_RESULT_CACHE_ENTRIES = int(os.getenv("SQL_RESULT_CACHE_ENTRIES", 256))    # 0 disables result caching
+
+# The only functions generated SQL may call: operators, aggregates, window functions and
+# side-effect-free scalars. Anything else (table functions, file/network scanners, settings,
+# sequences, macros) is rejected, including extensions DuckDB would auto-load.
+_SQL_ALLOWED_FUNCTIONS = frozenset({
+    # operators (the parser spells these as functions)
+    "+", "-", "*", "/", "//", "%", "^", "**", "||", "~~", "!~~", "~~*", "!~~*", "~~~", "!~~~",
+    # aggregates
+    "count", "count_star", "count_if", "sum", "avg", "mean", "min", "max", "median", "mode", "quantile",
+    "quantile_cont", "quantile_disc", "approx_quantile", "approx_count_distinct", "stddev", "stddev_pop",
+    "stddev_samp", "variance", "var_pop", "var_samp", "corr", "covar_pop", "covar_samp", "regr_slope",
+    "regr_intercept", "regr_r2", "string_agg", "group_concat", "list", "array_agg", "first", "last",
+    "any_value", "arg_max", "arg_min", "argmax", "argmin", "max_by", "min_by", "bool_and", "bool_or",
+    "product", "entropy", "kurtosis", "skewness",
+    # window functions
+    "row_number", "rank", "dense_rank", "percent_rank", "cume_dist", "ntile", "lag", "lead",
+    "first_value", "last_value", "nth_value",
+    # numeric
+    "abs", "round", "floor", "ceil", "ceiling", "trunc", "sqrt", "pow", "power", "exp", "ln", "log",
+    "log10", "log2", "sign", "greatest", "least", "isnan", "isinf", "isfinite",
+    # text
+    "lower", "upper", "lcase", "ucase", "length", "strlen", "trim", "ltrim", "rtrim", "substring",
+    "substr", "replace", "concat", "concat_ws", "left", "right", "position", "strpos", "instr",
+    "contains", "starts_with", "ends_with", "prefix", "suffix", "split_part", "regexp_matches",
+    "regexp_replace", "regexp_extract", "lpad", "rpad", "reverse", "nullif", "ifnull",
+    # dates
+    "date_part", "datepart", "date_trunc", "datetrunc", "date_diff", "datediff", "date_add", "date_sub",
+    "year", "month", "day", "dayofweek", "dayofyear", "week", "quarter", "hour", "minute", "second",
+    "epoch", "epoch_ms", "strftime", "strptime", "to_timestamp", "make_date", "age", "last_day",
+    # literals built by the parser
+    "list_value", "struct_pack", "array_extract", "list_extract", "struct_extract",
+})
+# FROM-clause node types that only combine or read registered tables; TABLE_FUNCTION is never allowed
+_SQL_ALLOWED_TABLE_REFS = frozenset({"BASE_TABLE", "SUBQUERY", "JOIN", "EMPTY", "EXPRESSION_LIST", "PIVOT"})
+_SQL_TABLE_REF_TYPES = _SQL_ALLOWED_TABLE_REFS | {"TABLE_FUNCTION", "CTE", "SHOW_REF", "COLUMN_DATA", "DELIM_GET", "INVALID"}
+_NUMERIC_SQL_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE", "DECIMAL")
+
+
+def duckdb_tables(con) -> List[Dict[str, Any]]:
+    """Qualified name of every table/view on the connection, without scanning any data."""
+    return [
+        {"table": name if database in ("memory", "temp") else f"{database}.{name}"}
+        for database, _, name, *_ in con.execute("SHOW ALL TABLES").fetchall()
+    ]
+
+
+def _schema_type(kind: Any) -> str:
+    # ENUM types spell out their members (categorical frames register as ENUM('N', 'S')),
+    # which are cell values; the provider only ever sees VARCHAR for them
+    kind = str(kind)
+    return "VARCHAR" if kind.upper().startswith("ENUM") else kind
+
+
+def describe_duckdb_schema(con, max_columns: int = 40) -> List[Dict[str, Any]]:
+    """
+    Schema metadata for every table/view on the connection: qualified name, columns
+    with types, row count, and per-column sketches (null count, approximate distinct
+    count, numeric min/max). No row values leave DuckDB.
+    """
+    schema: List[Dict[str, Any]] = []
+    for database, schema_name, name, col_names, col_types, temporary in con.execute("SHOW ALL TABLES").fetchall():
+        qualified = name if database in ("memory", "temp") else f"{database}.{name}"
+        cols = list(zip(col_names, col_types))[:max_columns]
+        exprs = ["count(*)"]
+        for col, kind in cols:
+            q = _quote_ident(col)
+            exprs += [f"count({q})", f"approx_count_distinct({q})"]
+            if str(kind).upper().startswith(_NUMERIC_SQL_TYPES):
+                exprs += [f"min({q})::DOUBLE", f"max({q})::DOUBLE"]
+        source = ".".join(_quote_ident(p) for p in qualified.split("."))
+        row = con.execute(f"SELECT {', '.join(exprs)} FROM {source}").fetchone()
+        total, values = int(row[0]), list(row[1:])
+        columns = []
+        for col, kind in cols:
+            non_null, distinct = values.pop(0), values.pop(0)
+            info: Dict[str, Any] = {"name": col, "type": _schema_type(kind), "nulls": total - int(non_null), "approx_distinct": int(distinct)}
+            if str(kind).upper().startswith(_NUMERIC_SQL_TYPES):
+                info["min"], info["max"] = values.pop(0), values.pop(0)
+            columns.append(info)
+        schema.append({"table": qualified, "rows": total, "columns": columns})
+    return schema
+
+
+def _sql_references(node: Any, tables: List[Tuple[str, ...]], functions: List[str], ctes: set, refs: List[str]) -> None:
+    # Collect table refs, FROM-clause node types, function names and CTE names from json_serialize_sql output
+    if isinstance(node, dict):
+        if "class" not in node and isinstance(node.get("type"), str) and node["type"] in _SQL_TABLE_REF_TYPES:
+            refs.append(node["type"])
+        if node.get("type") == "BASE_TABLE":
+            tables.append(tuple(p for p in (node.get("catalog_name"), node.get("schema_name"), node.get("table_name")) if p))
+        elif node.get("class") in ("FUNCTION", "WINDOW"):
+            functions.append(str(node.get("function_name") or ""))
+        for entry in (node.get("cte_map") or {}).get("map", []) if isinstance(node.get("cte_map"), dict) else []:
+            ctes.add(str(entry.get("key", "")).lower())
+        for value in node.values():
+            _sql_references(value, tables, functions, ctes, refs)
+    elif isinstance(node, list):
+        for value in node:
+            _sql_references(value, tables, functions, ctes, refs)
+
+
+def validate_readonly_sql(con, sql: str, schema: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Accept exactly one SELECT statement that only reads tables from `schema` (plus its
+    own CTEs), uses no table functions and calls only _SQL_ALLOWED_FUNCTIONS. Uses
+    DuckDB's own parser, so quoting and comments cannot hide a reference.
+    Returns { ok, sql } or { ok: False, error }.
+    """
+    sql = (sql or "").strip().rstrip(";").strip()
+    if not sql:
+        return {"ok": False, "error": "empty_sql"}
+    try:
+        parsed = json.loads(con.execute("SELECT json_serialize_sql(?::VARCHAR)", [sql]).fetchone()[0])
+    except Exception:
+        return {"ok": False, "error": "sql_parse_error"}
+    if parsed.get("error"):
+        return {"ok": False, "error": "only_select_allowed"}
+    if len(parsed.get("statements") or []) != 1:
+        return {"ok": False, "error": "single_statement_only"}
+    tables: List[Tuple[str, ...]] = []
+    functions: List[str] = []
+    ctes: set = set()
+    refs: List[str] = []
+    _sql_references(parsed["statements"], tables, functions, ctes, refs)
+    bad_refs = sorted({r for r in refs if r not in _SQL_ALLOWED_TABLE_REFS})
+    if bad_refs:
+        return {"ok": False, "error": f"table_ref_not_allowed:{bad_refs[0].lower()}"}
+    denied = sorted({f for f in functions if f.lower() not in _SQL_ALLOWED_FUNCTIONS})
+    if denied:
+        return {"ok": False, "error": f"function_not_allowed:{denied[0]}"}
+    allowed = set()
+    for entry in schema:
+        parts = entry["table"].lower().split(".")
+        allowed.add(".".join(parts))
+        if len(parts) == 2:
+            allowed.add(f"{parts[0]}.main.{parts[1]}")
+        else:
+            allowed.update({f"main.{parts[0]}", f"memory.main.{parts[0]}", f"temp.main.{parts[0]}"})
+    for ref in tables:
+        name = ".".join(ref).lower()
+        if name not in allowed and not (len(ref) == 1 and name in ctes):
+            return {"ok": False, "error": f"table_not_allowed:{name}"}
+    return {"ok": True, "sql": sql}
+
+
+def _file_digest(fh) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with fh as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_SQL_RESULT_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_SQL_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def _sql_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    with _SQL_RESULT_CACHE_LOCK:
+        hit = _SQL_RESULT_CACHE.get(key)
+        if hit is not None:
+            _SQL_RESULT_CACHE.move_to_end(key)
+        return hit
+
+
+def _sql_cache_put(key: str, value: Dict[str, Any]) -> None:
+    if SQL_RESULT_CACHE_ENTRIES <= 0:
+        return
+    with _SQL_RESULT_CACHE_LOCK:
+        _SQL_RESULT_CACHE[key] = value
+        _SQL_RESULT_CACHE.move_to_end(key)
+        while len(_SQL_RESULT_CACHE) > SQL_RESULT_CACHE_ENTRIES:
+            _SQL_RESULT_CACHE.popitem(last=False)
+
+
+# ---- Analytic primitives (vectorized, exact, no provider call) ----
+
+TOP_K_MAX = int(os.getenv("TOP_K_MAX", 100))   # rows returned by top_k
+_ROLLING_AGGS = {"mean", "sum", "min", "max", "std", "median", "count"}
+
+
+def _resolve_column(df, name: Any) -> Any:
+    """Actual column label for a requested name (exact, then case/space-insensitive)."""
+    if name is None or name == "":
+        raise ValueError("missing_column")
+    if name in df.columns:
+        return name
+    want = str(name).strip().lower()
+    for col in df.columns:
+        if str(col).strip().lower() == want:
+            return col
+    raise ValueError(f"unknown_column:{name}")
+
+
+def _numeric_values(df, col):
+    """Column as float64 NumPy array; datetimes become epoch nanoseconds, non-numbers NaN."""
+    import numpy as np
+    import pandas as pd
+    series = df[col]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy(dtype="datetime64[ns]").astype("int64").astype("float64")
+        values[series.isna().to_numpy()] = np.nan
+        return values
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype="float64", na_value=np.nan)
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
+def _paired(df, params) -> Tuple[Any, Any, Any, Any]:
+    import numpy as np
+    x_col, y_col = _resolve_column(df, params.get("x")), _resolve_column(df, params.get("y"))
+    x, y = _numeric_values(df, x_col), _numeric_values(df, y_col)
+    mask = np.isfinite(x) & np.isfinite(y)
+    if int(mask.sum()) < 2:
+        raise ValueError("not_enough_rows")
+    return x_col, y_col, x[mask], y[mask]
+
+
+def correlation(df, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    params: x, y, method (pearson | spearman). Without x/y, returns the correlation
+    matrix of up to 20 numeric columns instead of a single answer.
+    """
+    import numpy as np
+    import pandas as pd
+    method = str(params.get("method") or "pearson").lower()
+    if method not in {"pearson", "spearman"}:
+        raise ValueError(f"unsupported_method:{method}")
+    if params.get("x") is None and params.get("y") is None:
+        numeric = df.select_dtypes(include=["number"]).iloc[:, :20]
+        return {"method": method, "matrix": numeric.corr(method=method).round(6).to_dict()}
+    x_col, y_col, x, y = _paired(df, params)
+    if method == "spearman":
+        x, y = pd.Series(x).rank().to_numpy(), pd.Series(y).rank().to_numpy()
+    dx, dy = x - x.mean(), y - y.mean()
+    denom = math.sqrt(float(dx @ dx) * float(dy @ dy))
+    if denom == 0:
+        raise ValueError("constant_column")
+    r = float(dx @ dy) / denom
+    return {"answer": _round_number(r), "x": str(x_col), "y": str(y_col), "method": method, "n": int(len(x))}
+
+
+def linear_regression(df, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Least-squares fit y = slope * x + intercept. params: x, y, optional predict_x, and
+    return (slope | intercept | r2 | prediction; default slope, or prediction when
+    predict_x is given).
+    """
+    x_col, y_col, x, y = _paired(df, params)
+    dx, dy = x - x.mean(), y - y.mean()
+    sxx = float(dx @ dx)
+    if sxx == 0:
+        raise ValueError("constant_column")
+    slope = float(dx @ dy) / sxx
+    intercept = float(y.mean() - slope * x.mean())
+    resid = dy - slope * dx
+    ss_tot = float(dy @ dy)
+    r2 = 1.0 - float(resid @ resid) / ss_tot if ss_tot else 1.0
+    out = {
+        "x": str(x_col), "y": str(y_col), "n": int(len(x)),
+        "slope": _round_number(slope), "intercept": _round_number(intercept), "r2": _round_number(r2),
+    }
+    want = str(params.get("return") or ("prediction" if params.get("predict_x") is not None else "slope")).lower()
+    if params.get("predict_x") is not None:
+        out["prediction"] = _round_number(slope * float(params["predict_x"]) + intercept)
+    if want not in out:
+        raise ValueError(f"unsupported_return:{want}")
+    out["answer"] = out[want]
+    return out
+
+
+def group_aggregate(df, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Hash aggregation in DuckDB over the frame. params: by (column or list), column,
+    agg (sum | avg | mean | min | max | count | count_distinct | median | std) or a full
+    aggregates list, filters, order (desc | asc), limit, and return (table | label | value).
+    With one group column and one aggregate the default answer is {group: value}.
+    """
+    import duckdb  # lazy import
+    by = params.get("by") or params.get("group_by") or []
+    by = [by] if isinstance(by, str) else list(by)
+    if not by:
+        raise ValueError("missing_group_by")
+    by = [str(_resolve_column(df, c)) for c in by]
+    aggregates = [dict(a) for a in (params.get("aggregates") or []) if isinstance(a, dict)]
+    if not aggregates:
+        fn = str(params.get("agg") or params.get("fn") or ("sum" if params.get("column") else "count")).lower()
+        col = str(_resolve_column(df, params["column"])) if params.get("column") else "*"
+        aggregates = [{"fn": fn, "column": col, "as": f"{fn}_{'rows' if col == '*' else col}"}]
+    first = aggregates[0].get("as") or f"{aggregates[0].get('fn')}_{aggregates[0].get('column') or 'all'}"
+    aggregates[0]["as"] = first
+    descending = str(params.get("order") or "desc").lower() != "asc"
+    query = compile_structured_query({
+        "group_by": by,
+        "aggregates": aggregates,
+        "filters": params.get("filters"),
+        "order_by": params.get("order_by") or [{"column": first, "desc": descending}],
+        "limit": params.get("limit"),
+    }, _quote_ident("frame"))
+    con = duckdb.connect()
+    try:
+        con.register("frame", df)
+        res = con.execute(query["sql"], query["args"]).fetchdf()
+    finally:
+        con.close()
+    out: Dict[str, Any] = {"rows": int(len(res)), "table": res.to_dict(orient="records")}
+    want = str(params.get("return") or "").lower()
+    if want == "label" and len(res):
+        out["answer"] = res.iat[0, 0]
+    elif want == "value" and len(res):
+        out["answer"] = res[first].iat[0]
+    elif len(by) == 1 and len(aggregates) == 1:
+        out["answer"] = {str(k): v for k, v in zip(res[by[0]].tolist(), res[first].tolist())}
+    return out
+
+
+def top_k(df, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rows with the k largest (or smallest, ascending=true) values of `column`, found with
+    argpartition in O(n). params: column, k (default 5), ascending, columns (to return),
+    return (a column whose values become the answer list).
+    """
+    import numpy as np
+    col = _resolve_column(df, params.get("column") or params.get("by"))
+    k = max(1, min(int(params.get("k") or params.get("n") or 5), TOP_K_MAX, len(df) or 1))
+    ascending = bool(params.get("ascending")) or str(params.get("order") or "").lower() == "asc"
+    values = _numeric_values(df, col)
+    if np.isnan(values).all():
+        raise ValueError(f"non_numeric_column:{col}")
+    key = np.where(np.isnan(values), np.inf, values) if ascending else np.where(np.isnan(values), np.inf, -values)
+    if k < len(key):
+        idx = np.argpartition(key, k - 1)[:k]
+    else:
+        idx = np.arange(len(key))
+    idx = idx[np.argsort(key[idx], kind="stable")]
+    rows = df.iloc[idx]
+    if params.get("columns"):
+        rows = rows[[_resolve_column(df, c) for c in params["columns"]]]
+    out = {"column": str(col), "k": int(len(idx)), "rows": rows.to_dict(orient="records")}
+    if params.get("return"):
+        out["answer"] = df[_resolve_column(df, params["return"])].iloc[idx].tolist()
+    elif rows.shape[1] == 1:
+        out["answer"] = rows.iloc[:, 0].tolist()
+    return out
+
+
+def rolling_window(df, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rolling aggregate of `column`. params: window (row count, or an offset like "7D" when
+    order_by is a date column), agg (mean | sum | min | max | std | median | count),
+    order_by. The answer is the last complete window's value.
+    """
+    import numpy as np
+    import pandas as pd
+    col = _resolve_column(df, params.get("column"))
+    agg = str(params.get("agg") or "mean").lower()
+    if agg not in _ROLLING_AGGS:
+        raise ValueError(f"unsupported_aggregate:{agg}")
+    window = params.get("window") or 7
+    series = pd.Series(_numeric_values(df, col))
+    if params.get("order_by"):
+        order_col = _resolve_column(df, params["order_by"])
+        order = df[order_col]
+        if not pd.api.types.is_numeric_dtype(order) and not pd.api.types.is_datetime64_any_dtype(order):
+            order = pd.to_datetime(order, errors="coerce")
+        positions = np.argsort(order.to_numpy(), kind="stable")
+        series = series.iloc[positions]
+        series.index = pd.Index(order.to_numpy()[positions])
+    if isinstance(window, str) and not window.strip().isdigit():
+        if not isinstance(series.index, pd.DatetimeIndex):
+            raise ValueError("time_window_needs_date_order_by")
+        rolled = getattr(series.rolling(window.strip()), agg)()
+    else:
+        w = max(1, int(window))
+        rolled = getattr(series.rolling(w, min_periods=w), agg)()
+    values = rolled.to_numpy()
+    finite = values[np.isfinite(values)]
+    return {
+        "column": str(col), "window": window, "agg": agg,
+        "answer": _round_number(float(finite[-1])) if len(finite) else None,
+        "tail": [_round_number(float(v)) if np.isfinite(v) else None for v in values[-10:]],
+    }
+
+
+# Step type (and aliases) -> kernel; each takes (df, params) and raises ValueError on bad params
+ANALYTIC_STEPS = {
+    "correlation": correlation, "corr": correlation,
+    "regression": linear_regression, "linear_regression": linear_regression,
+    "group_by": group_aggregate, "groupby": group_aggregate, "group_aggregate": group_aggregate,
+    "top_k": top_k, "top_n": top_k,
+    "rolling": rolling_window, "rolling_window": rolling_window,
+}
+
+_TOP_K_RE = re.compile(r"\b(top|bottom|highest|lowest|largest|smallest)\s+(\d+)\b")
+# Rolling window size: a number carrying its unit ("7-day", "30 rows"), else one tied to the
+# window itself ("moving average of 5", "window of 4"); other numbers ("top 3") are not windows
+_ROLLING_UNIT_RE = re.compile(r"\b(\d+)[\s-]*(day|row|period|point|week)s?\b")
+_ROLLING_BARE_RE = re.compile(r"\b(?:rolling|moving|window)(?:\s+(?:average|mean|sum|median|min|max|std|window|size|of|over))*\s+(\d+)\b")
+_GROUP_AGG_WORDS = (("average", "avg"), ("mean", "avg"), ("median", "median"), ("total", "sum"), ("sum", "sum"),
+                    ("maximum", "max"), ("max", "max"), ("minimum", "min"), ("min", "min"), ("count", "count"),
+                    ("how many", "count"), ("number of", "count"))
+
+
+def _mentioned_columns(text: str, columns: List[str]) -> List[str]:
+    # Profiled column names that appear in the question, in order of appearance
+    hits = []
+    for col in columns:
+        for variant in {col.lower(), col.lower().replace("_", " ")}:
+            m = re.search(rf"(?<![\w]){re.escape(variant)}(?![\w])", text)
+            if m:
+                hits.append((m.start(), col))
+                break
+    return [c for _, c in sorted(hits)]
+
+
+def heuristic_analytic_step(question_text: str, attachments_meta: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Map common phrasings ("correlation between X and Y", "top 5 by revenue", "7-day rolling
+    mean", "average price by region") to an analytic step, using the column names and dtypes
+    profiled at upload. Returns None unless the needed columns are named in the question.
+    """
+    text = (question_text or "").lower()
+    for meta in attachments_meta:
+        profile = meta.get("profile") or {}
+        dtypes = profile.get("dtypes") or {}
+        cols = _mentioned_columns(text, profile.get("columns") or [])
+        if not cols:
+            continue
+        numeric = [c for c in cols if dtypes.get(c, "").startswith(("int", "float"))]
+        labels = [c for c in cols if c not in numeric]
+        params: Dict[str, Any] = {"file": meta["filename"]}
+        if "correlat" in text and len(numeric) >= 2:
+            params.update(x=numeric[0], y=numeric[1], method="spearman" if "spearman" in text else "pearson")
+            return {"id": "s8", "type": "correlation", "params": params}
+        if any(w in text for w in ("regress", "slope", "intercept", "r2", "r-squared")) and len(numeric) >= 2:
+            want = "intercept" if "intercept" in text else "r2" if ("r2" in text or "r-squared" in text) else "slope"
+            params.update(y=numeric[0], x=numeric[1], **{"return": want})
+            return {"id": "s8", "type": "regression", "params": params}
+        if ("rolling" in text or "moving" in text) and numeric:
+            n = _ROLLING_UNIT_RE.search(text)
+            size = n or _ROLLING_BARE_RE.search(text)
+            params.update(column=numeric[-1], window=int(size.group(1)) if size else 7,
+                          agg=next((a for w, a in _GROUP_AGG_WORDS if w in text and a in _ROLLING_AGGS), "mean"))
+            date_col = next((c for c in profile.get("columns") or [] if re.search(r"date|time|day", c.lower())), None)
+            if n and n.group(2) in {"day", "week"} and date_col:
+                days = int(n.group(1)) * (7 if n.group(2) == "week" else 1)
+                params.update(window=f"{days}D", order_by=date_col)
+            elif date_col:
+                params["order_by"] = date_col
+            return {"id": "s8", "type": "rolling", "params": params}
+        top = _TOP_K_RE.search(text)
+        if top and numeric:
+            params.update(column=numeric[-1], k=int(top.group(2)), ascending=top.group(1) in {"bottom", "lowest", "smallest"})
+            if labels:
+                params["return"] = labels[0]
+            return {"id": "s8", "type": "top_k", "params": params}
+        if labels and (" by " in text or " per " in text or " each " in text or (text.startswith("which") and numeric)):
+            agg = next((a for w, a in _GROUP_AGG_WORDS if w in text), "sum" if numeric else "count")
+            params.update(by=labels[-1], agg=agg)
+            if numeric and agg != "count":
+                params["column"] = numeric[0]
+            if any(w in text for w in ("which", "highest", "most", "top")):
+                params.update({"return": "label", "order": "desc"})
+            elif any(w in text for w in ("lowest", "least", "fewest")):
+                params.update({"return": "label", "order": "asc"})
+            return {"id": "s8", "type": "group_by", "params": params}
+    return None
+
+
+# ---- Graph analytics (CSR) ----
+_GRAPH_SOURCE_NAMES = ("source", "src", "from", "from_node", "node1", "start", "origin", "u")
+_GRAPH_TARGET_NAMES = ("target", "dst", "dest", "destination", "to", "to_node", "node2", "end", "v")
+_GRAPH_WEIGHT_NAMES = ("weight", "cost", "distance", "length", "w")
+_GRAPH_METRICS = ("density", "degree", "average_degree", "components", "shortest_path", "top_nodes", "nodes", "edges")
+
+
+class CSRGraph:
+    """
+    Compressed sparse row adjacency over integer node ids: the neighbours of node i are
+    indices[indptr[i]:indptr[i + 1]], with matching entries in weights. Labels live in a
+    single pandas Index, so the graph is a handful of flat arrays whatever its size.
+    Undirected graphs store every edge in both directions.
+    """
+
+    __slots__ = ("labels", "indptr", "indices", "weights", "directed", "n_edges")
+
+    def __init__(self, labels, indptr, indices, weights, directed: bool, n_edges: int):
+        self.labels = labels
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.directed = directed
+        self.n_edges = n_edges
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.labels)
+
+    @staticmethod
+    def _compress(src, dst, weights, n: int):
+        # Row lengths from bincount, row order from a sort on the source id (order within a row is free)
+        import numpy as np
+        order = np.argsort(src)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        return indptr, dst[order], (weights[order] if weights is not None else None)
+
+    @classmethod
+    def from_frame(cls, df, source, target, weight=None, directed: bool = False) -> "CSRGraph":
+        import numpy as np
+        import pandas as pd
+        m = len(df)
+        codes, labels = pd.factorize(pd.concat([df[source], df[target]], ignore_index=True))
+        itype = np.int32 if len(labels) < 2**31 else np.int64
+        src, dst = codes[:m].astype(itype), codes[m:].astype(itype)
+        keep = (src >= 0) & (dst >= 0)
+        weights = None
+        if weight is not None:
+            weights = _numeric_values(df, weight)
+            keep &= np.isfinite(weights)
+            if (weights[keep] < 0).any():
+                raise ValueError("negative_weight")
+        if not keep.all():
+            src, dst = src[keep], dst[keep]
+            weights = weights[keep] if weights is not None else None
+        n_edges = int(len(src))
+        if not directed:
+            src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+            weights = np.concatenate([weights, weights]) if weights is not None else None
+        indptr, indices, weights = cls._compress(src, dst, weights, len(labels))
+        return cls(labels, indptr, indices, weights, directed, n_edges)
+
+    def label(self, node: int) -> Any:
+        value = self.labels[node]
+        return value.item() if hasattr(value, "item") else value
+
+    def node_id(self, label: Any) -> int:
+        # Exact label first, then its text form, so "7" finds integer node 7 and "alice" finds "Alice"
+        loc = int(self.labels.get_indexer([label])[0]) if self.labels.is_unique else -1
+        if loc >= 0:
+            return loc
+        want = str(label).strip().lower()
+        matches = (self.labels.astype(str).str.strip().str.lower() == want).nonzero()[0]
+        if not len(matches):
+            raise ValueError(f"unknown_node:{label}")
+        return int(matches[0])
+
+    def degree(self):
+        # Out + in degree for directed graphs; the symmetric rows already count both ends otherwise
+        import numpy as np
+        out = np.diff(self.indptr)
+        return out + np.bincount(self.indices, minlength=self.n_nodes) if self.directed else out
+
+    def density(self) -> float:
+        n = self.n_nodes
+        if n < 2:
+            return 0.0
+        return self.n_edges / (n * (n - 1) if self.directed else n * (n - 1) / 2)
+
+    def _neighbours(self, frontier):
+        # Concatenated neighbour slices of all frontier nodes plus the node each came from
+        import numpy as np
+        starts = self.indptr[frontier]
+        lengths = self.indptr[frontier + 1] - starts
+        total = int(lengths.sum())
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        return self.indices[offsets], np.repeat(frontier, lengths)
+
+    def bfs(self, source: int):
+        """
+        Hop distances from source (-1 when unreachable) and parents. Wide frontiers expand
+        with one gather per level; narrow ones (long chains) fall back to a scalar loop so
+        high-diameter graphs do not pay array overhead per level.
+        """
+        import numpy as np
+        n = self.n_nodes
+        dist = np.full(n, -1, dtype=np.int64)
+        parent = np.full(n, -1, dtype=np.int64)
+        claim = np.empty(n, dtype=np.int64)
+        dist[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        level = 0
+        while len(frontier):
+            level += 1
+            if len(frontier) <= 32:
+                nxt = []
+                for u in frontier.tolist():
+                    for v in self.indices[self.indptr[u]:self.indptr[u + 1]].tolist():
+                        if dist[v] < 0:
+                            dist[v] = level
+                            parent[v] = u
+                            nxt.append(v)
+                frontier = np.array(nxt, dtype=np.int64)
+                continue
+            nbrs, owners = self._neighbours(frontier)
+            fresh = dist[nbrs] < 0
+            nbrs, owners = nbrs[fresh], owners[fresh]
+            # Deduplicate without sorting: the last write to claim[v] picks v's single survivor
+            slots = np.arange(len(nbrs))
+            claim[nbrs] = slots
+            keep = claim[nbrs] == slots
+            frontier = nbrs[keep].astype(np.int64)
+            dist[frontier] = level
+            parent[frontier] = owners[keep]
+        return dist, parent
+
+    def dijkstra(self, source: int, target: Optional[int] = None):
+        """Weighted distances (inf when unreachable) and parents; stops once target is settled."""
+        import heapq
+        import numpy as np
+        dist = np.full(self.n_nodes, np.inf)
+        parent = np.full(self.n_nodes, -1, dtype=np.int64)
+        settled = np.zeros(self.n_nodes, dtype=bool)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        pop, push = heapq.heappop, heapq.heappush
+        while heap:
+            d, u = pop(heap)
+            if settled[u]:
+                continue
+            settled[u] = True
+            if u == target:
+                break
+            lo, hi = indptr[u], indptr[u + 1]
+            nbrs = indices[lo:hi]
+            cand = weights[lo:hi] + d
+            better = cand < dist[nbrs]
+            # Only improved edges reach Python; the comparison runs over the whole row
+            for c, v in zip(cand[better].tolist(), nbrs[better].tolist()):
+                if c < dist[v]:  # parallel edges: keep the cheapest
+                    dist[v] = c
+                    parent[v] = u
+                    push(heap, (c, v))
+        return dist, parent
+
+    def components(self):
+        """
+        (Weakly) connected component per node, labelled by its smallest node id: min-label
+        propagation over the CSR rows (one reduceat per round) with pointer jumping.
+        """
+        import numpy as np
+        n = self.n_nodes
+        indptr, indices = self.indptr, self.indices
+        if self.directed:
+            src = np.repeat(np.arange(n, dtype=indices.dtype), np.diff(indptr))
+            indptr, indices, _ = self._compress(np.concatenate([src, indices]), np.concatenate([indices, src]), None, n)
+        labels = np.arange(n, dtype=np.int64)
+        rows = np.diff(indptr) > 0
+        starts = indptr[:-1][rows]
+        if not len(starts):
+            return labels
+        while True:
+            lowest = np.minimum.reduceat(labels[indices], starts)
+            hooked = labels.copy()
+            # Hook each node's current root onto the smallest label among its neighbours
+            np.minimum.at(hooked, labels[rows], lowest)
+            hooked = np.minimum(hooked, hooked[labels])
+            while True:
+                jumped = hooked[hooked]
+                if np.array_equal(jumped, hooked):
+                    break
+                hooked = jumped
+            if np.array_equal(hooked, labels):
+                return labels
+            labels = hooked
+
+
+def _edge_columns(df, params: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+    # Explicit params win; otherwise conventional names, otherwise the first two columns
+    by_name = {str(c).strip().lower(): c for c in df.columns}
+
+    def _guess(names):
+        return next((by_name[n] for n in names if n in by_name), None)
+
+    source = _resolve_column(df, params["source"]) if params.get("source") else _guess(_GRAPH_SOURCE_NAMES)
+    target = _resolve_column(df, params["target"]) if params.get("target") else _guess(_GRAPH_TARGET_NAMES)
+    if source is None or target is None:
+        if len(df.columns) < 2:
+            raise ValueError("missing_edge_columns")
+        source, target = df.columns[0], df.columns[1]
+    weight = params.get("weight")
+    if weight in (False, "none", "None"):
+        weight = None
+    elif weight:
+        weight = _resolve_column(df, weight)
+    else:
+        import pandas as pd
+        weight = _guess(_GRAPH_WEIGHT_NAMES)
+        if weight is not None and not pd.api.types.is_numeric_dtype(df[weight]):
+            weight = None
+    return source, target, weight
+
+
+def _walk_path(graph: CSRGraph, parent, source: int, target: int) -> List[Any]:
+    path = [target]
+    while path[-1] != source and len(path) <= graph.n_nodes:
+        path.append(int(parent[path[-1]]))
+    return [graph.label(v) for v in reversed(path)]
+
+
+def graph_analysis(df, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Graph metrics over an edge list, built into a CSR structure straight from the columns.
+    params: source, target, weight (guessed from names like source/target/weight when omitted),
+    directed (default false), metric (density | degree | average_degree | components |
+    shortest_path | top_nodes | nodes | edges), node (for degree), from/to (for shortest_path;
+    Dijkstra when weighted, BFS otherwise), k (top nodes, default 5).
+    """
+    import numpy as np
+    source, target, weight = _edge_columns(df, params)
+    directed = str(params.get("directed") or "").strip().lower() in {"1", "true", "yes"}
+    graph = CSRGraph.from_frame(df, source, target, weight, directed=directed)
+    n = graph.n_nodes
+    if n == 0:
+        raise ValueError("empty_graph")
+    degree = graph.degree()
+    origin, dest = params.get("from"), params.get("to")
+    metric = str(params.get("metric") or params.get("return") or "").lower()
+    if not metric:
+        metric = "shortest_path" if origin is not None and dest is not None else "degree" if params.get("node") is not None else ""
+    if metric and metric not in _GRAPH_METRICS:
+        raise ValueError(f"unsupported_metric:{metric}")
+    k = max(1, min(int(params.get("k") or 5), TOP_K_MAX, n))
+    top = np.argpartition(-degree, k - 1)[:k] if k < n else np.arange(n)
+    top = top[np.argsort(-degree[top], kind="stable")]
+    hist = np.bincount(degree)
+    out: Dict[str, Any] = {
+        "source": str(source), "target": str(target), "weight": None if weight is None else str(weight),
+        "directed": directed, "nodes": n, "edges": graph.n_edges,
+        "density": _round_number(graph.density()),
+        "average_degree": _round_number(float(degree.mean())),
+        "top_nodes": [{"node": graph.label(v), "degree": int(degree[v])} for v in top.tolist()],
+        "degree_histogram": {str(d): int(c) for d, c in enumerate(hist.tolist()) if c},
+    }
+    if metric in {"", "components"}:
+        sizes = np.bincount(graph.components(), minlength=n)
+        out.update(components=int((sizes > 0).sum()), largest_component=int(sizes.max()))
+    if metric == "shortest_path":
+        if origin is None or dest is None:
+            raise ValueError("missing_path_endpoints")
+        s, t = graph.node_id(origin), graph.node_id(dest)
+        if graph.weights is not None:
+            dist, parent = graph.dijkstra(s, t)
+            reached = bool(np.isfinite(dist[t]))
+        else:
+            dist, parent = graph.bfs(s)
+            reached = bool(dist[t] >= 0)
+        distance = _round_number(float(dist[t])) if reached else None
+        out["shortest_path"] = {"from": graph.label(s), "to": graph.label(t), "distance": distance,
+                                "path": _walk_path(graph, parent, s, t) if reached else []}
+        out["answer"] = distance
+    elif metric == "degree" and params.get("node") is not None:
+        out["answer"] = int(degree[graph.node_id(params["node"])])
+    elif metric == "degree":
+        out["answer"] = out["average_degree"]
+    elif metric == "top_nodes":
+        labels = [row["node"] for row in out["top_nodes"]]
+        out["answer"] = labels[0] if params.get("k") in (None, 1, "1") else labels
+    elif metric:
+        out["answer"] = out[metric]
+    return out
+
+
+_GRAPH_WORDS_RE = re.compile(
+    r"\b(graph|network|nodes?|edges?|vert(?:ex|ices)|degrees?|shortest path|connected|components?|"
+    r"centrality|central|density|hubs?)\b")
+_GRAPH_PATH_RE = re.compile(r"(?:from|between)\s+['\"]?([\w.@-]+)['\"]?\s+(?:to|and)\s+['\"]?([\w.@-]+)", re.I)
+_GRAPH_NODE_RE = re.compile(r"degree\s+of\s+(?:node\s+)?['\"]?([\w.@-]+)", re.I)
+
+
+def heuristic_graph_step(question_text: str, attachments_meta: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Pick a graph_analysis step when a CSV looks like an edge list (source/target style
+    column names) and the question uses graph vocabulary as whole words.
+    """
+    raw = question_text or ""
+    text = raw.lower()
+    if not _GRAPH_WORDS_RE.search(text):
+        return None
+    for meta in attachments_meta:
+        cols = [str(c).strip().lower() for c in (meta.get("profile") or {}).get("columns") or []]
+        if not (any(c in _GRAPH_SOURCE_NAMES for c in cols) and any(c in _GRAPH_TARGET_NAMES for c in cols)):
+            continue
+        params: Dict[str, Any] = {"file": meta["filename"]}
+        if "directed" in text and "undirected" not in text:
+            params["directed"] = True
+        path = _GRAPH_PATH_RE.search(raw)
+        node = _GRAPH_NODE_RE.search(raw)
+        top = _TOP_K_RE.search(text)
+        if ("shortest" in text or "distance" in text or "path" in text) and path:
+            params.update(metric="shortest_path", **{"from": path.group(1), "to": path.group(2)})
+        elif "density" in text or "dense" in text:
+            params["metric"] = "density"
+        elif "component" in text or ("connected" in text and "most connected" not in text):
+            params["metric"] = "components"
+        elif "average degree" in text or "mean degree" in text:
+            params["metric"] = "average_degree"
+        elif node:
+            params.update(metric="degree", node=node.group(1))
+        elif any(w in text for w in ("most connected", "central", "highest degree", "hub", "most edges")):
+            params.update(metric="top_nodes", **({"k": int(top.group(2))} if top else {}))
+        elif re.search(r"how many (nodes|vertices)", text):
+            params["metric"] = "nodes"
+        elif re.search(r"how many edges", text):
+            params["metric"] = "edges"
+        return {"id": "s9", "type": "graph_analysis", "params": params}
+    return None
+
+
+# pyplot draws on a process-wide "current figure"; plots rendered from worker threads take turns
+_PYPLOT_LOCK = threading.Lock()
+
+
 def make_simple_plot_base64(df) -> Optional[str]:
     """Create a tiny PNG plot as base64 from the first numeric column(s).
     Returns None if plotting not possible.
@@ -725,35 +3259,208 @@ def make_simple_plot_base64(df) -> Optional[str]:
         num_df = df.select_dtypes(include=["number"]).head(100)
         if num_df.empty:
             return None
-        plt.figure(figsize=(3, 2))
-        num_df.reset_index(drop=True).plot(ax=plt.gca())
-        plt.tight_layout()
         buf = _io.BytesIO()
-        plt.savefig(buf, format="png", dpi=120)
-        plt.close()
+        with _PYPLOT_LOCK:
+            plt.figure(figsize=(3, 2))
+            num_df.reset_index(drop=True).plot(ax=plt.gca())
+            plt.tight_layout()
+            plt.savefig(buf, format="png", dpi=120)
+            plt.close()
         b64 = base64.b64encode(buf.getvalue()).decode("ascii")
         return b64
     except Exception:
         return None
 
 
+def make_degree_histogram_base64(histogram: Dict[str, int]) -> Optional[str]:
+    """Degree distribution ({degree: node count}) as a small log-log PNG in base64.
+    Returns None if plotting not possible.
+    """
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import io as _io
+        points = sorted((int(d), c) for d, c in histogram.items() if int(d) > 0 and c)
+        if not points:
+            return None
+        buf = _io.BytesIO()
+        with _PYPLOT_LOCK:
+            plt.figure(figsize=(3, 2))
+            plt.loglog([d for d, _ in points], [c for _, c in points], marker=".", linestyle="none")
+            plt.xlabel("degree")
+            plt.ylabel("nodes")
+            plt.tight_layout()
+            plt.savefig(buf, format="png", dpi=120)
+            plt.close()
+        return base64.b64encode(buf.getvalue()).decode("ascii")
+    except Exception:
+        return None
+
+
 # ---- API: /api (lightweight Q&A / analysis) ----
 import base64
 
+# ---- llm_answer cache (exact + near-duplicate) ----
+import random
+import unicodedata
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1024))    # 0 disables the cache
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.85))    # MinHash Jaccard threshold
+
+_CACHE_STOPWORDS = frozenset({"a", "an", "the", "is", "are", "of", "please", "me", "tell", "can", "you", "to"})
+# Wording that may differ between two phrasings of the same question; every other word
+# (the subject: names, places, metrics) must match before an approximate hit is served
+_CACHE_FILLER_WORDS = _CACHE_STOPWORDS | frozenset({
+    "what", "whats", "s", "which", "who", "do", "does", "did", "was", "were", "i", "we", "us", "would",
+    "could", "like", "want", "know", "give", "show", "find", "out", "exactly", "kindly", "just", "currently",
+})
+
+
+_CACHE_SYMBOLS = "<>=!+-*/%#^&|~@$€£¥"
+
+
+def _normalize_question(text: str) -> List[str]:
+    # Case/width-fold and collapse whitespace into tokens; punctuation is dropped, but
+    # operators and signs are tokens of their own ("5 > 3" vs "5 < 3", "C++" vs "C#")
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.findall(r"[^\W_]+(?:\.\d+)?|[" + re.escape(_CACHE_SYMBOLS) + "]", text)
+
+
+class _AnswerCache:
+    """
+    Bounded LRU cache for llm_answer results with two lookup tiers:
+    - exact: hash of the normalized question (casing/whitespace/punctuation-insensitive)
+    - approximate: MinHash signatures over word unigram+bigram shingles, bucketed with
+      LSH bands, accepted when the estimated Jaccard similarity reaches the threshold.
+    Operators and signs are kept as tokens in both tiers. An approximate hit also needs the
+    same numbers and symbols in the same order and the same content words (anything outside
+    _CACHE_FILLER_WORDS), so "in 2010" never answers "in 2020", "5 > 3" never answers
+    "5 < 3", and a question about Germany never gets the cached answer about France.
+    """
+
+    NUM_PERM = 64
+    BANDS = 16
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, max_entries: int, threshold: float):
+        self.max_entries = max(0, max_entries)
+        self.threshold = threshold
+        rng = random.Random(0x5EED)
+        self._perms = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME)) for _ in range(self.NUM_PERM)]
+        self._rows = self.NUM_PERM // self.BANDS
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], set] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits_exact": 0, "hits_approx": 0, "misses": 0, "evictions": 0}
+
+    def _features(self, question: str) -> Tuple[str, Tuple[int, ...], Tuple[str, ...], frozenset]:
+        tokens = _normalize_question(question)
+        key = hashlib.sha1(" ".join(tokens).encode("utf-8")).hexdigest()
+        words = [t for t in tokens if t not in _CACHE_STOPWORDS] or tokens
+        shingles = set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+        base = [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "little") for sh in shingles]
+        if base:
+            sig = tuple(min((a * h + b) % self._PRIME for h in base) for a, b in self._perms)
+        else:
+            sig = ()
+        # Numbers and symbols in order, so "5 > 3" never matches "3 > 5"
+        numbers = tuple(t for t in tokens if t[0].isdigit() or t in _CACHE_SYMBOLS)
+        content = frozenset(t for t in tokens if t not in _CACHE_FILLER_WORDS and not t[0].isdigit())
+        return key, sig, numbers, content
+
+    def _bands(self, sig: Tuple[int, ...]):
+        for i in range(self.BANDS):
+            yield (i, sig[i * self._rows:(i + 1) * self._rows])
+
+    def get(self, question: str) -> Optional[Any]:
+        if not self.max_entries:
+            return None
+        key, sig, numbers, content = self._features(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits_exact"] += 1
+                return entry["answer"]
+            if sig:
+                candidates = set()
+                for band in self._bands(sig):
+                    candidates |= self._buckets.get(band, set())
+                best_key, best_sim = None, 0.0
+                for cand in candidates:
+                    other = self._entries[cand]
+                    if other["numbers"] != numbers or other["content"] != content:
+                        continue
+                    sim = sum(1 for x, y in zip(sig, other["sig"]) if x == y) / self.NUM_PERM
+                    if sim > best_sim:
+                        best_key, best_sim = cand, sim
+                if best_key is not None and best_sim >= self.threshold:
+                    self._entries.move_to_end(best_key)
+                    self._stats["hits_approx"] += 1
+                    return self._entries[best_key]["answer"]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, question: str, answer: Any) -> None:
+        if not self.max_entries:
+            return
+        key, sig, numbers, content = self._features(question)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._entries[key]["answer"] = answer
+                return
+            self._entries[key] = {"answer": answer, "sig": sig, "numbers": numbers, "content": content}
+            if sig:
+                for band in self._bands(sig):
+                    self._buckets.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, old = self._entries.popitem(last=False)
+                for band in self._bands(old["sig"]) if old["sig"] else ():
+                    bucket = self._buckets.get(band)
+                    if bucket is not None:
+                        bucket.discard(old_key)
+                        if not bucket:
+                            del self._buckets[band]
+                self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "size": len(self._entries), "max_entries": self.max_entries}
+
+
+_ANSWER_CACHE = _AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY)
+
+
 # ---- Planning execution engine ----
 async def execute_plan(
     plan: Dict[str, Any],
     *,
     question_text: str,
-    attachments_dir: str,
+    attachments: AttachmentStore,
     attachments_meta: List[Dict[str, Any]],
     request_id: str,
+    frames: Optional[ArtifactStore] = None,
+    timings: Optional[List[Tuple[str, float]]] = None,
 ) -> Dict[str, Any]:
     """
     Execute plan steps sequentially. Returns minimal JSON like {"answer": ...} or {"result": ...}.
     Handlers are lightweight and avoid heavy memory usage. No raw bytes sent to LLM.
+    Parsing, kernels, plots and queries run in worker threads, so concurrent plans overlap
+    and the event loop stays free to enforce deadlines.
+    frames holds parsed attachments under the request's memory budget and may be shared
+    across plans of the same request (fan-out); frames in it are shared by reference, so
+    steps must not modify them in place. When given, timings collects (step type, ms).
     """
     artifacts: Dict[str, Any] = {}
+    if frames is None:
+        frames = ArtifactStore(attachments)
+    plan_frames = frames.view(uuid.uuid4().hex[:8])
+
+    def _dataframes():
+        # This plan's frames, created on first use so it only shows up once something loaded
+        return artifacts.setdefault("dataframes", plan_frames)
 
     # Helper loaders available to steps
     def _csv_files():
@@ -765,18 +3472,74 @@ async def execute_plan(
     def _duckdb_files():
         return [m["filename"] for m in attachments_meta if m["filename"].lower().endswith(".duckdb")]
 
+    def _json_files():
+        return [m["filename"] for m in attachments_meta if m["filename"].lower().endswith(JSON_TABLE_EXTENSIONS)]
+
+    def _table_files():
+        return _csv_files() + _json_files()
+
+    def _parquet_paths():
+        return [attachments.path(fn).replace("\\", "/") for fn in _parquet_files()]
+
+    def _duckdb_connection():
+        """In-memory DuckDB with every attachment queryable by name."""
+        import duckdb  # lazy import
+        con = duckdb.connect()
+        # Register CSV/JSON tables by name (e.g. sales-2024.csv -> sales_2024)
+        for fn in _table_files():
+            try:
+                con.register(_table_name(fn), _read_frame(fn))
+            except Exception:
+                pass
+        # All Parquet uploads form one dataset; .duckdb files are attached read-only
+        pqs = _parquet_paths()
+        if pqs:
+            file_list = ", ".join(_sql_string(p) for p in pqs)
+            con.execute(f"CREATE VIEW parquet_data AS SELECT * FROM read_parquet([{file_list}], union_by_name = true)")
+        for fn in _duckdb_files():
+            path = attachments.path(fn).replace("\\", "/")
+            con.execute(f"ATTACH {_sql_string(path)} AS {_quote_ident(_table_name(fn))} (READ_ONLY)")
+        return con
+
+    def _read_frame(fn):
+        if fn not in frames:
+            if fn.lower().endswith(JSON_TABLE_EXTENSIONS):
+                df = read_json_table(attachments.open_text(fn))
+            else:
+                import pandas as pd  # local import
+                meta = next((m for m in attachments_meta if m["filename"] == fn), None)
+                df = pd.read_csv(attachments.open(fn), **_csv_read_kwargs(meta))
+            frames[fn] = compact_frame(df)
+        return frames[fn]
+
+    def _frame_for(params):
+        # (name, frame) named by params.file, else the first loaded (or loadable) table
+        dfs = artifacts.get("dataframes", {})
+        target = params.get("file")
+        if not dfs or (target and target not in dfs and target in _table_files()):
+            for fn in ([target] if target and target in _table_files() else _table_files()):
+                try:
+                    _dataframes()[fn] = _read_frame(fn)
+                except Exception:
+                    pass
+            dfs = artifacts.get("dataframes", {})
+        target = target or next((k for k, v in dfs.items() if hasattr(v, "columns")), None)
+        df = dfs.get(target) if target else None
+        return target, (df if hasattr(df, "columns") else None)
+
     # Simple dispatcher implementations
     for step in plan.get("plan", {}).get("steps", []):
         stype = (step.get("type") or "").lower().strip()
         sid = step.get("id") or f"s{len(artifacts)+1}"
         params = step.get("params") or {}
+        step_start = time.perf_counter()
 
         try:
             if stype in {"parse_questions", "noop"}:
                 # Optionally extract simple flags or expressions
                 expr_val = eval_simple_math(question_text)
                 if expr_val is not None:
-                    artifacts["math"] = int(expr_val) if abs(expr_val - int(expr_val)) < 1e-9 else round(expr_val, 6)
+                    artifacts["math"] = _round_number(expr_val)
 
             elif stype in {"math", "compute"}:
                 expr = params.get("expression") or question_text
@@ -784,7 +3547,78 @@ async def execute_plan(
                 if val is None:
                     artifacts[sid] = {"error": "invalid_expression"}
                 else:
-                    artifacts["answer"] = int(val) if abs(val - int(val)) < 1e-9 else round(val, 6)
+                    artifacts["answer"] = _round_number(val)
+
+            elif stype in {"expression", "derive", "filter"}:
+                # Vectorized expression over whole columns of a loaded dataframe
+                import numpy as np  # local import
+                target, df = await asyncio.to_thread(_frame_for, params)
+                if df is None:
+                    artifacts[sid] = {"error": "no_dataframe"}
+                    continue
+                evaluated = await asyncio.to_thread(eval_column_expression, params.get("expression") or "", df)
+                if not evaluated["ok"]:
+                    artifacts[sid] = {"error": evaluated["error"]}
+                    continue
+                value = evaluated["value"]
+                how = (params.get("aggregate") or "").lower().strip()
+                name = params.get("name")
+                if np.ndim(value) == 0:
+                    artifacts["answer"] = _round_number(float(value))
+                elif how:
+                    agg = _aggregate_array(value, how)
+                    if agg is None:
+                        artifacts[sid] = {"error": "invalid_aggregate"}
+                    else:
+                        artifacts["answer"] = agg
+                elif value.dtype == bool:
+                    matched = df[value]
+                    artifacts[sid] = {"rows_matched": int(value.sum()), "preview": matched.head(5).to_dict(orient="records")}
+                    if name:
+                        # Named filters feed later steps; unnamed ones answer "how many rows ..."
+                        _dataframes()[str(name)] = matched
+                    else:
+                        artifacts["answer"] = int(value.sum())
+                else:
+                    if name:
+                        _dataframes()[target] = df.assign(**{str(name): value})
+                    artifacts[sid] = {"rows": int(len(value)), "preview": [None if v != v else v for v in value[:5].tolist()]}
+
+            elif stype in ANALYTIC_STEPS:
+                # Exact vectorized kernels: correlation, regression, group_by, top_k, rolling
+                _, df = await asyncio.to_thread(_frame_for, params)
+                if df is None:
+                    artifacts[sid] = {"error": "no_dataframe"}
+                    continue
+                try:
+                    result = await asyncio.to_thread(ANALYTIC_STEPS[stype], df, params)
+                except (ValueError, KeyError, TypeError) as e:
+                    artifacts[sid] = {"error": str(e)}
+                    continue
+                artifacts[sid] = result
+                if "answer" in result:
+                    artifacts["answer"] = result["answer"]
+
+            elif stype in {"graph_analysis", "graph", "network"}:
+                # Edge list -> CSR arrays; degree/density/components/paths without per-node objects
+                _, df = await asyncio.to_thread(_frame_for, params)
+                if df is None:
+                    artifacts[sid] = {"error": "no_dataframe"}
+                    continue
+                try:
+                    result = await asyncio.to_thread(graph_analysis, df, params)
+                except (ValueError, KeyError, TypeError) as e:
+                    artifacts[sid] = {"error": str(e)}
+                    continue
+                artifacts[sid] = result
+                if "answer" in result:
+                    artifacts["answer"] = result["answer"]
+                else:
+                    # Whole-graph report: stats as a summary, degree distribution as the plot
+                    artifacts.setdefault("summaries", {})[sid] = result
+                    b64 = await asyncio.to_thread(make_degree_histogram_base64, result["degree_histogram"])
+                    if b64:
+                        artifacts.setdefault("plots", {})[sid] = b64
 
             elif stype in {"scrape", "fetch"}:
                 urls = params.get("urls") or params.get("url") or []
@@ -804,30 +3638,25 @@ async def execute_plan(
                         texts[u] = f"error:{type(e).__name__}"
                 artifacts[sid] = {"scraped": texts}
 
-            elif stype in {"load_csv"}:
-                files = params.get("files") or _csv_files()
+            elif stype in {"load_csv", "load_json"}:
+                files = params.get("files") or (_json_files() if stype == "load_json" else _csv_files())
                 loaded = {}
                 for fn in files:
-                    path = os.path.join(attachments_dir, fn)
                     try:
-                        import pandas as pd  # local import
-                        df = pd.read_csv(path)
-                        loaded[fn] = df
+                        loaded[fn] = await asyncio.to_thread(_read_frame, fn)
                     except Exception as e:
                         loaded[fn] = f"error:{type(e).__name__}"
-                artifacts.setdefault("dataframes", {}).update(loaded)
+                _dataframes().update(loaded)
 
             elif stype in {"analyze_tabular", "summarize_csv"}:
                 dfs = artifacts.get("dataframes", {})
                 if not dfs:
-                    # try lazy load any CSVs if not yet loaded
-                    files = _csv_files()
+                    # try lazy load any CSV/JSON tables if not yet loaded
+                    files = _table_files()
                     if files:
-                        import pandas as pd  # noqa: F401
                         for fn in files:
                             try:
-                                df = pd.read_csv(os.path.join(attachments_dir, fn))
-                                artifacts.setdefault("dataframes", {})[fn] = df
+                                _dataframes()[fn] = await asyncio.to_thread(_read_frame, fn)
                             except Exception:
                                 pass
                         dfs = artifacts.get("dataframes", {})
@@ -835,7 +3664,7 @@ async def execute_plan(
                 for name, df in list(dfs.items())[:2]:
                     if hasattr(df, "describe"):
                         try:
-                            summary[name] = df.describe(include="all").to_dict()
+                            summary[name] = await asyncio.to_thread(lambda: df.describe(include="all").to_dict())
                         except Exception:
                             summary[name] = {"rows": int(df.shape[0]), "cols": int(df.shape[1])}
                 if summary:
@@ -843,55 +3672,146 @@ async def execute_plan(
 
             elif stype in {"query_parquet_duckdb", "duckdb_query"}:
                 sql = params.get("sql") or ""
-                pqs = _parquet_files()
+                pqs = _parquet_paths()
                 ddbs = _duckdb_files()
-                if not sql:
-                    # generate a trivial preview
-                    if pqs:
-                        _p = os.path.join(attachments_dir, pqs[0]).replace("\\", "/")
-                        sql = f"SELECT * FROM read_parquet('{_p}') LIMIT 5"
-                    elif ddbs:
-                        sql = "SELECT 1 as ok"
                 try:
-                    import duckdb  # lazy import
-                    con = duckdb.connect()
-                    # Register CSVs and Parquet convenience views
-                    for fn in _csv_files():
-                        con.register(fn.replace("-", "_"), os.path.join(attachments_dir, fn))
-                    if pqs and "read_parquet" not in sql.lower():
-                        # If users refer to table parquet_1, map to file 0
-                        pass
-                    res = con.execute(sql).fetchdf()
-                    artifacts[sid] = {"rows": min(5, len(res)), "preview": res.head(5).to_dict(orient="records")}
-                    con.close()
+                    # Registering tables parses uploads; keep it off the event loop like the queries
+                    con = await asyncio.to_thread(_duckdb_connection)
+                    try:
+                        structured = any(params.get(k) for k in ("columns", "filters", "group_by", "aggregates", "order_by", "limit"))
+                        if sql:
+                            checked = validate_readonly_sql(con, sql, duckdb_tables(con))
+                            if not checked["ok"]:
+                                raise ValueError(checked["error"])
+                            # Only a preview is kept, so only a preview is fetched
+                            limited = f"SELECT * FROM (\n{checked['sql']}\n) AS q LIMIT 5"
+                            res = await asyncio.to_thread(lambda: con.execute(limited).fetchdf())
+                            artifacts[sid] = {"rows": int(len(res)), "preview": res.to_dict(orient="records")}
+                        elif pqs or params.get("table"):
+                            source = _quote_ident(params["table"]) if params.get("table") else "parquet_data"
+                            if params.get("table") and "." in str(params["table"]):
+                                source = ".".join(_quote_ident(part) for part in str(params["table"]).split("."))
+                            query = compile_structured_query(params if structured else {"limit": 5}, source)
+                            res = await asyncio.to_thread(lambda: con.execute(query["sql"], query["args"]).fetchdf())
+                            out = {
+                                "rows": int(len(res)),
+                                "columns": [str(c) for c in res.columns],
+                                "preview": res.head(50).to_dict(orient="records"),
+                            }
+                            if pqs and not params.get("table"):
+                                out["stats"] = await asyncio.to_thread(
+                                    parquet_scan_stats,
+                                    con, pqs, _normalize_filters(params.get("filters")), query["columns_read"],
+                                )
+                                _log_event("duckdb_scan", request_id=request_id, step=sid, **out["stats"])
+                            artifacts[sid] = out
+                            if structured and res.shape == (1, 1):
+                                value = res.iat[0, 0]
+                                artifacts["answer"] = value.item() if hasattr(value, "item") else value
+                        elif ddbs:
+                            res = await asyncio.to_thread(lambda: con.execute(
+                                "SELECT database_name, schema_name, table_name, estimated_size FROM duckdb_tables()"
+                            ).fetchdf())
+                            artifacts[sid] = {"tables": res.to_dict(orient="records")}
+                    finally:
+                        con.close()
+                except ValueError as e:
+                    artifacts[sid] = {"error": str(e)}
                 except Exception as e:
                     artifacts[sid] = {"error": f"duckdb:{type(e).__name__}"}
 
+            elif stype in {"text_to_sql", "sql_answer"}:
+                # Provider sees schema metadata only; the SQL runs locally in DuckDB
+                if not _llm_enabled():
+                    artifacts[sid] = {"error": "llm_disabled"}
+                    continue
+                con = await asyncio.to_thread(_duckdb_connection)
+                try:
+                    # Schema sketches scan every table; keep them off the event loop
+                    schema = await asyncio.to_thread(describe_duckdb_schema, con)
+                    if not schema:
+                        artifacts[sid] = {"error": "no_tables"}
+                        continue
+                    q = params.get("question") or question_text[:800]
+                    prompt = (
+                        "Write one read-only DuckDB SQL SELECT that answers the question using only these tables. "
+                        "Keep aggregation in SQL. Quote identifiers with double quotes. "
+                        "Schema: {\"sql\":\"SELECT ...\"}.\n"
+                        "TABLES: " + json.dumps(schema, ensure_ascii=False, default=str) + "\nQUESTION: " + q
+                    )
+                    res = await asyncio.to_thread(
+                        call_llm,
+                        prompt,
+                        max_tokens=512,
+                        temperature=0.0,
+                        request_id=request_id,
+                        prefix_instructions="Respond ONLY with compact JSON. No prose. No markdown.",
+                    )
+                    data = res.get("data") if res.get("ok") else None
+                    if not isinstance(data, dict) or not isinstance(data.get("sql"), str):
+                        artifacts[sid] = {"error": res.get("error", "no_sql")}
+                        continue
+                    checked = validate_readonly_sql(con, data["sql"], schema)
+                    if not checked["ok"]:
+                        artifacts[sid] = {"error": checked["error"]}
+                        continue
+
+                    def _cache_key() -> str:
+                        digest = hashlib.sha256()
+                        for m in sorted(attachments_meta, key=lambda m: m["filename"]):
+                            digest.update(f"{m['filename']}:{_file_digest(attachments.open(m['filename']))};".encode())
+                        digest.update(" ".join(checked["sql"].split()).encode("utf-8"))
+                        return digest.hexdigest()
+
+                    cache_key = await asyncio.to_thread(_cache_key)
+                    result = _sql_cache_get(cache_key)
+                    if result is None:
+                        # Newlines keep a trailing "-- comment" from swallowing the wrapper
+                        limited = f"SELECT * FROM (\n{checked['sql']}\n) AS q LIMIT {TEXT_TO_SQL_MAX_ROWS}"
+                        df = await asyncio.to_thread(lambda: con.execute(limited).fetchdf())
+                        result = {
+                            "sql": checked["sql"],
+                            "rows": int(len(df)),
+                            "columns": [str(c) for c in df.columns],
+                            "preview": df.head(50).to_dict(orient="records"),
+                        }
+                        if df.shape == (1, 1):
+                            value = df.iat[0, 0]
+                            result["value"] = value.item() if hasattr(value, "item") else value
+                        _sql_cache_put(cache_key, result)
+                    artifacts[sid] = result
+                    if "value" in result:
+                        artifacts["answer"] = result["value"]
+                finally:
+                    con.close()
+
             elif stype in {"plot", "matplotlib_plot"}:
                 # plot first available numeric df
                 dfs = artifacts.get("dataframes", {})
                 if not dfs:
-                    files = _csv_files()
+                    files = _table_files()
                     if files:
-                        import pandas as pd  # noqa: F401
                         try:
-                            df = pd.read_csv(os.path.join(attachments_dir, files[0]))
-                            artifacts.setdefault("dataframes", {})[files[0]] = df
+                            _dataframes()[files[0]] = await asyncio.to_thread(_read_frame, files[0])
                             dfs = artifacts["dataframes"]
                         except Exception:
                             pass
                 if dfs:
                     name, df = next(iter(dfs.items()))
-                    b64 = make_simple_plot_base64(df)
+                    b64 = await asyncio.to_thread(make_simple_plot_base64, df)
                     if b64:
                         artifacts.setdefault("plots", {})[name] = b64
 
             elif stype in {"llm_answer", "lookup", "answer"}:
                 # Ask the model for a short answer in JSON only
-                if SKIP_LLM or LLM_PROVIDER == "none":
+                if not _llm_enabled():
                     artifacts[sid] = {"error": "llm_disabled"}
                 else:
                     q = params.get("question") or question_text[:800]
+                    cached = _ANSWER_CACHE.get(q)
+                    if cached is not None:
+                        artifacts["answer"] = cached
+                        continue
                     prompt = "Answer briefly in JSON only. Schema: {\"answer\":\"short\"}. No markdown.\nQUESTION: " + q
                     res = await asyncio.to_thread(
                         call_llm,
@@ -905,6 +3825,7 @@ async def execute_plan(
                         data = res["data"]
                         if "answer" in data:
                             artifacts["answer"] = data["answer"]
+                            _ANSWER_CACHE.put(q, data["answer"])
                         else:
                             artifacts[sid] = data
                     else:
@@ -912,14 +3833,22 @@ async def execute_plan(
 
             else:
                 # Unknown step type: ignore but log
-                print(json.dumps({"event": "unknown_step", "type": stype, "id": sid}), flush=True)
+                _log_event("unknown_step", type=stype, id=sid)
         except Exception as e:
             artifacts[sid] = {"error": f"step_error:{type(e).__name__}"}
+        finally:
+            if timings is not None:
+                timings.append((stype or "unknown", (time.perf_counter() - step_start) * 1000))
+
+    # Frames derived by this plan are not needed once the output is decided
+    plan_frames.release()
 
     # Decide minimal output
     if "answer" in artifacts:
         return {"answer": artifacts["answer"]}
     if "summaries" in artifacts and artifacts["summaries"]:
+        if artifacts.get("plots"):
+            return {"summary": artifacts["summaries"], "plot_png_base64": next(iter(artifacts["plots"].values()))}
         return {"summary": artifacts["summaries"]}
     if "plots" in artifacts and artifacts["plots"]:
         return {"plot_png_base64": next(iter(artifacts["plots"].values()))}
@@ -930,97 +3859,270 @@ async def execute_plan(
     return {"result": {"artifacts": keys or list(artifacts.keys())[:5]}}
 
 
-async def _process_api(request: Request, request_id: str) -> JSONResponse:
+# ---- Tiered dispatch: answer trivial requests without planning ----
+
+_MATH_PREFIX = re.compile(r"^\s*(?:what\s+is|what's|calculate|compute|evaluate)\s+", re.IGNORECASE)
+_PLOT_WORDS = ("plot", "chart", "graph", "histogram", "visuali")
+_SUMMARY_WORDS = ("summar", "describe", "overview", "statistic", "stats", "profile")
+# Anything hinting at a specific computation needs a real plan
+_PLANNING_WORDS = (
+    "correlat", "regress", "group", "top ", "filter", "where", "how many", "average", "mean", "median",
+    "sum ", "count", "predict", "compare", "trend", "join", "sql", " per ", " by ", " vs",
+)
+
+
+def _inline_math(question_text: str) -> Optional[float]:
+    """Value of a text-only question that is plain arithmetic ("2 + 2", "What is 3*7?"), else None."""
+    text = (question_text or "").strip()
+    if not text or len(text) > 200:
+        return None
+    return eval_simple_math(_MATH_PREFIX.sub("", text).rstrip(" ?=."))
+
+
+def _fixed_plan(question_text: str, attachments_meta: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Canned plan for a short summary-or-plot request over exactly one CSV; None if ambiguous."""
+    if len(attachments_meta) != 1 or not attachments_meta[0]["filename"].lower().endswith(".csv"):
+        return None
+    text = f" {(question_text or '').lower()} "
+    if len(text) > 300 or "http://" in text or "https://" in text or any(w in text for w in _PLANNING_WORDS):
+        return None
+    if heuristic_graph_step(question_text, attachments_meta) is not None:
+        return None  # "graph"/"network" over an edge list means graph analytics, not a line plot
+    plot = any(w in text for w in _PLOT_WORDS)
+    summary = any(w in text for w in _SUMMARY_WORDS)
+    if plot == summary:
+        return None
+    fn = attachments_meta[0]["filename"]
+    final = {"id": "s2", "type": "matplotlib_plot"} if plot else {"id": "s2", "type": "analyze_tabular"}
+    return {"plan": {"steps": [{"id": "s1", "type": "load_csv", "params": {"files": [fn]}}, final]}}
+
+
+# ---- Multi-question fan-out ----
+
+FANOUT_MAX_QUESTIONS = int(os.getenv("FANOUT_MAX_QUESTIONS", 20))              # 0 disables splitting
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", 4))                   # sub-questions in flight
+FANOUT_DEADLINE_SECONDS = float(os.getenv("FANOUT_DEADLINE_SECONDS", REQUEST_TIMEOUT_SECONDS * 0.9))  # from request start
+
+_ENUMERATED_LINE = re.compile(r"^\s*(?:q(?:uestion)?\s*)?(\d{1,2})\s*[.):]\s+(\S.*)$", re.IGNORECASE)
+
+
+def split_questions(text: str) -> Tuple[str, List[str]]:
+    """
+    Split a questions.txt body into (preamble, sub_questions) when it contains an
+    enumerated list numbered 1..n (n >= 2). Lines following an item belong to it.
+    Returns (text, []) when there is no such list.
+    """
+    preamble: List[str] = []
+    items: List[List[str]] = []
+    after_gap = False
+    for line in (text or "").splitlines():
+        m = _ENUMERATED_LINE.match(line)
+        if m and int(m.group(1)) == len(items) + 1:
+            items.append([m.group(2).strip()])
+            after_gap = False
+        elif not items or (after_gap and line[:1].strip()):
+            # Text before the list, or unindented text after a blank line, is shared context
+            preamble.append(line)
+        elif line.strip():
+            items[-1].append(line.strip())
+        else:
+            after_gap = True
+    if len(items) < 2:
+        return text, []
+    return "\n".join(preamble).strip(), [" ".join(parts) for parts in items]
+
+
+def _sub_answer(output: Dict[str, Any]) -> Any:
+    # Unwrap {"answer": x} so the array holds bare answers; keep richer outputs as-is
+    if isinstance(output, dict) and set(output) == {"answer"}:
+        return output["answer"]
+    return output
+
+
+async def answer_sub_questions(
+    request_id: str,
+    preamble: str,
+    sub_questions: List[str],
+    attachments: AttachmentStore,
+    attachments_meta: List[Dict[str, Any]],
+    deadline: Optional[float] = None,
+) -> List[Any]:
+    """
+    Plan and execute each sub-question concurrently over the same attachments and
+    return answers in question order. A sub-question that fails or is still running at
+    deadline (a time.monotonic() value; FANOUT_DEADLINE_SECONDS from now if omitted)
+    yields null instead of failing the whole request.
+    """
+    frames = ArtifactStore(attachments)
+    limit = asyncio.Semaphore(max(1, FANOUT_CONCURRENCY))
+
+    async def _answer(question: str) -> Any:
+        if not attachments_meta:
+            value = _inline_math(question)
+            if value is not None:
+                return _round_number(value)
+        # Question first so truncation in llm_answer keeps it; preamble carries shared context
+        text = f"{question}\n\nContext: {preamble}" if preamble else question
+        async with limit:
+            plan = _fixed_plan(question, attachments_meta)
+            if plan is None:
+                plan_result = await plan_and_dispatch(request_id, text, attachments, attachments_meta)
+                if not plan_result.get("ok"):
+                    return None
+                plan = plan_result["plan"]
+            output = await execute_plan(
+                plan,
+                question_text=text,
+                attachments=attachments,
+                attachments_meta=attachments_meta,
+                request_id=request_id,
+                frames=frames,
+            )
+        return _sub_answer(output)
+
+    tasks = [asyncio.ensure_future(_answer(q)) for q in sub_questions]
+    if deadline is None:
+        deadline = time.monotonic() + FANOUT_DEADLINE_SECONDS
+    done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+    for task in pending:
+        task.cancel()
+    answers: List[Any] = []
+    for task in tasks:
+        if task in done and not task.cancelled() and task.exception() is None:
+            answers.append(task.result())
+        else:
+            answers.append(None)
+    return answers
+
+
+async def _process_api(
+    request: Request,
+    request_id: str,
+    started: Optional[float] = None,
+    progress: Optional[Dict[str, str]] = None,
+) -> JSONResponse:
+    """
+    Tiered /api dispatch; the tier that answered is reported in X-Analysis-Tier:
+      inline     - text-only arithmetic, evaluated directly
+      fixed_plan - single-CSV summary/plot run through a canned plan, no planner call
+      fanout     - enumerated sub-questions answered concurrently
+      planned    - everything else: plan_and_dispatch, then execute_plan
+    started is the time.monotonic() at which the request arrived; the fan-out deadline
+    counts from it so a slow upload does not push sub-questions past the request timeout.
+    progress["tier"] tracks the tier in use ("ingest" until one is chosen) so error
+    responses, including the caller's 504, report where the request failed.
+    """
+    if started is None:
+        started = time.monotonic()
+    if progress is None:
+        progress = {}
+    progress["tier"] = "ingest"
     start_ts = _utc_now_iso()
-    start_time = datetime.now(timezone.utc)
 
-    temp_dir = tempfile.mkdtemp(prefix=f"api-{request_id[:8]}-")
+    store = AttachmentStore(prefix=f"api-{request_id[:8]}-")
     total_state = {"total_bytes": 0}
+    timings: List[Tuple[str, float]] = []
 
-    try:
-        form = await request.form()
-        # Collect files
-        files: List[UploadFile] = [v for v in form.values() if isinstance(v, UploadFile)]
-        if not files:
-            return JSONResponse(status_code=400, content={"error": "questions.txt required (multipart/form-data)"})
+    def _failed(status_code: int, content: Any) -> JSONResponse:
+        return AnalysisResponse(status_code=status_code, content=content, headers={"X-Analysis-Tier": progress["tier"]})
 
-        # Locate questions.txt
-        qfile: Optional[UploadFile] = None
-        for uf in files:
-            if (uf.filename or "").lower() == "questions.txt":
-                qfile = uf
-                break
-        if qfile is None:
-            # try heuristic single text file
-            text_like = [uf for uf in files if (uf.content_type or "").startswith("text/")]
-            if len(text_like) == 1:
-                qfile = text_like[0]
-        if qfile is None:
-            return JSONResponse(status_code=400, content={"error": "Missing questions.txt"})
+    def _done(tier: str, content: Any, **log: Any) -> JSONResponse:
+        _log_event("api_done", request_id=request_id, tier=tier, **log, ts=start_ts)
+        headers = {"X-Analysis-Tier": tier}
+        if timings:
+            headers["Server-Timing"] = _server_timing(timings)
+        return AnalysisResponse(status_code=200, content=content, headers=headers)
 
-        # Read questions within limits
-        q_bytes = io.BytesIO()
-        q_written = 0
-        while True:
-            remaining_file = PER_FILE_MAX_BYTES - q_written
-            remaining_total = TOTAL_MAX_BYTES - total_state["total_bytes"]
-            if remaining_file <= 0 or remaining_total <= 0:
-                return JSONResponse(status_code=413, content={"error": "Upload size limit exceeded"})
-            to_read = min(1024 * 1024, remaining_file, remaining_total)
-            chunk = await qfile.read(to_read)
-            if not chunk:
-                break
-            q_bytes.write(chunk)
-            q_written += len(chunk)
-            total_state["total_bytes"] += len(chunk)
-            if q_written > PER_FILE_MAX_BYTES or total_state["total_bytes"] > TOTAL_MAX_BYTES:
-                return JSONResponse(status_code=413, content={"error": "Upload size limit exceeded"})
-        question_text = _strip_bom(q_bytes.getvalue()).strip()
+    try:
+        # Stream the multipart body: attachments land in the store and are profiled while uploading
+        ingested = await _ingest_multipart(request, store, total_state)
+        question_text = ingested["question_text"]
+        attachments_meta: List[Dict[str, Any]] = ingested["attachments_meta"]
+
+        if not attachments_meta:
+            value = _inline_math(question_text)
+            if value is not None:
+                return _done("inline", {"answer": _round_number(value)})
+
+        # Enumerated question lists are answered as an ordered JSON array
+        preamble, sub_questions = split_questions(question_text)
+        if FANOUT_MAX_QUESTIONS and 2 <= len(sub_questions) <= FANOUT_MAX_QUESTIONS:
+            progress["tier"] = "fanout"
+            answers = await answer_sub_questions(
+                request_id, preamble, sub_questions, store, attachments_meta,
+                deadline=started + FANOUT_DEADLINE_SECONDS,
+            )
+            return _done(
+                "fanout", answers,
+                sub_questions=len(sub_questions), sub_failed=sum(1 for a in answers if a is None),
+            )
 
-        # Save other attachments
-        attachments_meta: List[Dict[str, Any]] = []
-        for uf in files:
-            if uf is qfile:
-                continue
-            safe_name = _sanitize_filename(uf.filename or "attachment")
-            dest_path = os.path.join(temp_dir, safe_name)
-            written = await _save_upload_to_disk(uf, dest_path, PER_FILE_MAX_BYTES, total_state)
-            attachments_meta.append({"filename": safe_name, "bytes": written})
+        plan = _fixed_plan(question_text, attachments_meta)
+        if plan is not None:
+            progress["tier"] = "fixed_plan"
+            output = await execute_plan(
+                plan,
+                question_text=question_text,
+                attachments=store,
+                attachments_meta=attachments_meta,
+                request_id=request_id,
+                timings=timings,
+            )
+            return _done("fixed_plan", output)
 
         # Plan using unified LLM integration (or heuristics if SKIP_LLM/none)
-        plan_result = await plan_and_dispatch(request_id, question_text, temp_dir, attachments_meta)
+        progress["tier"] = "planned"
+        plan_start = time.perf_counter()
+        plan_result = await plan_and_dispatch(request_id, question_text, store, attachments_meta)
+        timings.append(("plan", (time.perf_counter() - plan_start) * 1000))
         if not plan_result.get("ok"):
-            return JSONResponse(status_code=502, content={"error": plan_result.get("error", "plan_error")})
-        plan = plan_result.get("plan")
+            return _failed(502, {"error": plan_result.get("error", "plan_error")})
 
         # Execute the plan generically
         exec_output = await execute_plan(
-            plan,
+            plan_result.get("plan"),
             question_text=question_text,
-            attachments_dir=temp_dir,
+            attachments=store,
             attachments_meta=attachments_meta,
             request_id=request_id,
+            timings=timings,
         )
+        return _done("planned", exec_output, provider=plan_result.get("provider"), model=plan_result.get("model"))
 
-        print(json.dumps({
-            "event": "api_done",
-            "request_id": request_id,
-            "provider": plan_result.get("provider"),
-            "model": plan_result.get("model"),
-            "ts": start_ts
-        }), flush=True)
-        return JSONResponse(status_code=200, content=exec_output)
-
+    except HTTPException as he:
+        return _failed(he.status_code, {"error": he.detail})
     except Exception as e:
-        print(json.dumps({"event": "api_error", "request_id": request_id, "detail": str(e), "ts": _utc_now_iso()}), flush=True)
-        return JSONResponse(status_code=500, content={"error": "Internal server error"})
+        _log_event("api_error", request_id=request_id, tier=progress["tier"], detail=str(e), ts=_utc_now_iso())
+        return _failed(500, {"error": "Internal server error"})
     finally:
-        # Best-effort cleanup
-        try:
-            import shutil
-            shutil.rmtree(temp_dir, ignore_errors=True)
-        except Exception:
-            pass
+        # Spilled files (if any) are removed off the response path
+        store.release()
+
+
+def _server_timing(timings: List[Tuple[str, float]]) -> str:
+    # Per-phase durations for clients and load tests, e.g. "plan;dur=3.1, load_csv;dur=12.0"
+    return ", ".join(f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)};dur={ms:.1f}" for name, ms in timings)
+
+
+@app.post("/api")
+async def analyze(request: Request):
+    request_id = str(uuid.uuid4())
+    started = time.monotonic()
+    progress = {"tier": "ingest"}
+    try:
+        return await asyncio.wait_for(
+            _process_api(request, request_id, started, progress), timeout=REQUEST_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        _log_event("timeout", request_id=request_id, tier=progress["tier"], ts=_utc_now_iso())
+        return AnalysisResponse(
+            status_code=504,
+            content={"error": "Processing timed out. Please try a smaller request or simplify inputs."},
+            headers={"X-Analysis-Tier": progress["tier"]},
+        )
+
+
+app.add_api_route("/api/", analyze, methods=["POST"])
 
 
 # ---- Inline quick tests (doctest-style) ----
@@ -0,0 +1,453 @@
+"""
+Load-test harness for api.index:app.
+
+Starts a stub LLM server that speaks the LOCAL_LLM_ENDPOINT contract (single
+"input" and batched "inputs" requests) and also serves a small HTML page for
+scrape steps. Then starts the app under uvicorn with N workers and drives an
+open-loop mix of requests at a target rate. Reports throughput, error rates,
+p50/p95/p99 per scenario, endpoint and plan step (from the Server-Timing
+header), the stub's batch sizes, and the peak RSS of the server processes.
+
+Usage:
+  python scripts/loadtest.py --workers 2 --rate 20 --duration 30
+  python scripts/loadtest.py --mix math=1,csv=1 --llm-latency-ms 50 --batching --json report.json
+
+Not deployed (see .vercelignore); needs only the app's own requirements.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# scenario -> (endpoint, questions.txt, attachment kind)
+SCENARIOS: Dict[str, Tuple[str, str, Optional[str]]] = {
+    "math": ("/api", "What is 17 * 23 + 4?", None),
+    "csv": ("/api", "Summarize the data in data.csv", "csv"),
+    "plot": ("/api", "Plot the data in data.csv", "csv"),
+    "parquet": ("/api", "What is the average value in the parquet data?", "parquet"),
+    "scrape": ("/api", "Summarize the page at {page_url}", None),
+    "ingest": ("/", "Summarize the data in data.csv", "csv"),
+}
+DEFAULT_MIX = "math=3,csv=3,plot=1,parquet=2,scrape=1"
+
+
+# ---- Stub LLM provider ----
+
+class StubLLM:
+    """Deterministic planner/answerer with configurable latency; records batch sizes."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.batch_sizes: List[int] = []
+
+    def reply(self, prompt: str) -> str:
+        if "execution plan" not in prompt:
+            # llm_answer / text_to_sql style prompts
+            return json.dumps({"answer": "stub", "sql": "SELECT 1"})
+        question = prompt.split('"question_preview": "', 1)[-1].split('"', 1)[0]
+        low = question.lower()
+        if ".parquet" in prompt:
+            steps = [{"id": "s1", "type": "query_parquet_duckdb", "params": {
+                "aggregates": [{"fn": "avg", "column": "value", "as": "avg_value"}],
+                "filters": [{"column": "id", "op": ">=", "value": 0}],
+            }}]
+        elif "plot" in low and ".csv" in prompt:
+            steps = [{"id": "s1", "type": "load_csv"}, {"id": "s2", "type": "matplotlib_plot"}]
+        elif ".csv" in prompt:
+            steps = [{"id": "s1", "type": "load_csv"}, {"id": "s2", "type": "analyze_tabular"}]
+        elif "http://" in question:
+            url = re.search(r"http://\S+", question).group(0)
+            steps = [{"id": "s1", "type": "scrape", "params": {"url": url}}, {"id": "s2", "type": "llm_answer"}]
+        else:
+            expr = max(re.findall(r"[\d\s+\-*/().]+", question), key=len, default="0").strip()
+            steps = [{"id": "s1", "type": "math", "params": {"expression": expr}}]
+        return json.dumps({"plan": {"steps": steps}})
+
+    def sleep(self) -> None:
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+
+def _make_handler(stub: StubLLM, page_html: bytes):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # keep the report readable
+            pass
+
+        def _send(self, status: int, body: bytes, ctype: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.startswith("/page"):
+                self._send(200, page_html, "text/html; charset=utf-8")
+            else:
+                self._send(404, b"not found", "text/plain")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            stub.sleep()
+            if isinstance(payload.get("inputs"), list):
+                prompts = payload["inputs"]
+                out = {"outputs": [stub.reply(p) for p in prompts]}
+            else:
+                prompts = [payload.get("input") or ""]
+                out = {"output": stub.reply(prompts[0])}
+            with stub.lock:
+                stub.calls += 1
+                stub.batch_sizes.append(len(prompts))
+            self._send(200, json.dumps(out).encode(), "application/json")
+
+    return Handler
+
+
+def _page_html() -> bytes:
+    paras = "".join(
+        f"<p>Paragraph {i}: quarterly revenue grew in region {i % 7} while costs held flat.</p>" for i in range(200)
+    )
+    return f"<html><head><title>Stub page</title></head><body><h1>Report</h1>{paras}</body></html>".encode()
+
+
+# ---- Fixtures ----
+
+def build_fixtures(csv_rows: int, parquet_rows: int) -> Dict[str, bytes]:
+    rng = random.Random(7)
+    buf = io.StringIO()
+    buf.write("id,region,value,qty\n")
+    for i in range(csv_rows):
+        buf.write(f"{i},{rng.choice('NSEW')},{rng.random() * 100:.4f},{rng.randint(1, 50)}\n")
+    import duckdb  # app dependency; writes the Parquet fixture
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "data.parquet").replace("\\", "/")
+        con = duckdb.connect()
+        con.execute(
+            f"COPY (SELECT range AS id, random() * 100 AS value, (range % 4)::INTEGER AS bucket "
+            f"FROM range({int(parquet_rows)})) TO '{path}' (FORMAT parquet, ROW_GROUP_SIZE 20000)"
+        )
+        con.close()
+        with open(path, "rb") as f:
+            parquet = f.read()
+    return {"csv": buf.getvalue().encode(), "parquet": parquet}
+
+
+# ---- Server process ----
+
+def start_server(args, llm_url: str, log_file) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "SKIP_LLM": "false",
+        "LLM_PROVIDER": "local",
+        "LLM_PROVIDERS": "local",
+        "LOCAL_LLM_ENDPOINT": llm_url,
+        "LOCAL_LLM_BATCHING": "true" if args.batching else "false",
+        "PYTHONUNBUFFERED": "1",
+    })
+    cmd = [
+        sys.executable, "-m", "uvicorn", "api.index:app",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+    ]
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {proc.returncode}; see {log_file.name}")
+        try:
+            if requests.get(f"http://127.0.0.1:{args.port}/", timeout=1).status_code == 200:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not become ready within 60 s")
+
+
+def _descendants(pid: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    out, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        out.append(p)
+        stack.extend(children.get(p, []))
+    return out
+
+
+def peak_rss(pid: int) -> Optional[Dict[str, Any]]:
+    """VmHWM (peak resident set) of the server and its workers, in MB; Linux only."""
+    if not os.path.isdir("/proc"):
+        return None
+    per_proc = {}
+    for p in _descendants(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        per_proc[p] = int(line.split()[1]) / 1024.0
+        except OSError:
+            continue
+    if not per_proc:
+        return None
+    return {
+        "processes": len(per_proc),
+        "max_process_mb": round(max(per_proc.values()), 1),
+        "total_mb": round(sum(per_proc.values()), 1),
+    }
+
+
+# ---- Traffic ----
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def _parse_server_timing(header: str) -> List[Tuple[str, float]]:
+    out = []
+    for part in header.split(","):
+        name, _, rest = part.strip().partition(";")
+        m = re.search(r"dur=([\d.]+)", rest)
+        if name and m:
+            out.append((name, float(m.group(1))))
+    return out
+
+
+class Driver:
+    def __init__(self, base_url: str, fixtures: Dict[str, bytes], page_url: str, timeout: float):
+        self.base_url = base_url
+        self.fixtures = fixtures
+        self.page_url = page_url
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.results: List[Dict[str, Any]] = []
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def run_one(self, scenario: str) -> None:
+        endpoint, question, kind = SCENARIOS[scenario]
+        files = {"questions.txt": ("questions.txt", question.format(page_url=self.page_url).encode(), "text/plain")}
+        if kind == "csv":
+            files["data.csv"] = ("data.csv", self.fixtures["csv"], "text/csv")
+        elif kind == "parquet":
+            files["data.parquet"] = ("data.parquet", self.fixtures["parquet"], "application/octet-stream")
+        start = time.perf_counter()
+        result: Dict[str, Any] = {"scenario": scenario, "endpoint": endpoint}
+        try:
+            resp = self._session().post(
+                self.base_url + endpoint, files=files, timeout=self.timeout,
+                headers={"Accept-Encoding": "gzip"},
+            )
+            result["status"] = resp.status_code
+            result["ok"] = resp.status_code in (200, 202)
+            result["steps"] = _parse_server_timing(resp.headers.get("server-timing", ""))
+            result["tier"] = resp.headers.get("x-analysis-tier")
+        except requests.RequestException as e:
+            result["status"] = type(e).__name__
+            result["ok"] = False
+        result["ms"] = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.results.append(result)
+
+
+def drive(driver: Driver, mix: List[Tuple[str, float]], rate: float, duration: float, concurrency: int) -> float:
+    """Open-loop arrivals at `rate` per second for `duration` seconds; returns elapsed time."""
+    names = [n for n, _ in mix]
+    weights = [w for _, w in mix]
+    rng = random.Random(11)
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        i = 0
+        while True:
+            due = start + i * interval
+            if due - start >= duration:
+                break
+            now = time.perf_counter()
+            if due > now:
+                time.sleep(due - now)
+            pool.submit(driver.run_one, rng.choices(names, weights)[0])
+            i += 1
+    return time.perf_counter() - start
+
+
+# ---- Report ----
+
+def _percentile(sorted_vals: List[float], pct: float) -> float:
+    if not sorted_vals:
+        return float("nan")
+    k = max(0, min(len(sorted_vals) - 1, int(round(pct / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def _latency_row(values: List[float], errors: int = 0) -> Dict[str, Any]:
+    vals = sorted(values)
+    n = len(vals)
+    return {
+        "n": n,
+        "error_rate": round(errors / n, 4) if n else 0.0,
+        "p50_ms": round(_percentile(vals, 50), 1),
+        "p95_ms": round(_percentile(vals, 95), 1),
+        "p99_ms": round(_percentile(vals, 99), 1),
+        "mean_ms": round(sum(vals) / n, 1) if n else float("nan"),
+    }
+
+
+def build_report(args, results, elapsed, stub: StubLLM, rss) -> Dict[str, Any]:
+    by_key: Dict[str, Dict[str, List]] = {}
+    steps: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+    for r in results:
+        for key in (f"scenario:{r['scenario']}", f"endpoint:{r['endpoint']}"):
+            bucket = by_key.setdefault(key, {"ms": [], "errors": 0})
+            bucket["ms"].append(r["ms"])
+            bucket["errors"] += 0 if r["ok"] else 1
+        for name, dur in r.get("steps") or []:
+            steps.setdefault(name, []).append(dur)
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    ok = sum(1 for r in results if r["ok"])
+    sizes = stub.batch_sizes
+    return {
+        "config": {
+            "workers": args.workers, "rate": args.rate, "duration_s": args.duration,
+            "concurrency": args.concurrency, "mix": args.mix, "batching": args.batching,
+            "llm_latency_ms": args.llm_latency_ms,
+        },
+        "requests": len(results),
+        "ok": ok,
+        "error_rate": round(1 - ok / len(results), 4) if results else 0.0,
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "statuses": statuses,
+        "latency": {k: _latency_row(v["ms"], v["errors"]) for k, v in sorted(by_key.items())},
+        "steps": {k: _latency_row(v) for k, v in sorted(steps.items())},
+        "llm_stub": {
+            "calls": stub.calls,
+            "prompts": sum(sizes),
+            "mean_batch": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "max_batch": max(sizes) if sizes else 0,
+        },
+        "peak_rss": rss,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    cfg = report["config"]
+    print(f"\nworkers={cfg['workers']} rate={cfg['rate']}/s duration={cfg['duration_s']}s "
+          f"concurrency={cfg['concurrency']} batching={cfg['batching']} llm_latency={cfg['llm_latency_ms']}ms")
+    print(f"requests={report['requests']} ok={report['ok']} error_rate={report['error_rate']:.2%} "
+          f"throughput={report['throughput_rps']} req/s statuses={report['statuses']}")
+    header = f"{'':28} {'n':>6} {'err%':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}"
+    for title, rows in (("latency (client, ms)", report["latency"]), ("steps (Server-Timing, ms)", report["steps"])):
+        print(f"\n{title}\n{header}")
+        for name, row in rows.items():
+            print(f"{name:28} {row['n']:>6} {row['error_rate'] * 100:>6.1f} {row['p50_ms']:>9} "
+                  f"{row['p95_ms']:>9} {row['p99_ms']:>9} {row['mean_ms']:>9}")
+    stub = report["llm_stub"]
+    print(f"\nllm stub: calls={stub['calls']} prompts={stub['prompts']} "
+          f"mean_batch={stub['mean_batch']} max_batch={stub['max_batch']}")
+    rss = report["peak_rss"]
+    if rss:
+        print(f"peak RSS: {rss['max_process_mb']} MB max per process, {rss['total_mb']} MB across {rss['processes']} processes")
+    else:
+        print("peak RSS: unavailable (needs /proc)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0], formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    ap.add_argument("--rate", type=float, default=10.0, help="target arrivals per second")
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds of traffic")
+    ap.add_argument("--concurrency", type=int, default=64, help="max requests in flight from the client")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted scenarios (default {DEFAULT_MIX}); also: ingest")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--llm-port", type=int, default=8766)
+    ap.add_argument("--llm-latency-ms", type=float, default=150.0)
+    ap.add_argument("--llm-jitter-ms", type=float, default=30.0)
+    ap.add_argument("--batching", action="store_true", help="enable LOCAL_LLM_BATCHING in the server")
+    ap.add_argument("--csv-rows", type=int, default=5000)
+    ap.add_argument("--parquet-rows", type=int, default=200000)
+    ap.add_argument("--timeout", type=float, default=120.0, help="client timeout per request (s)")
+    ap.add_argument("--server-log", default=os.path.join(tempfile.gettempdir(), "loadtest-server.log"))
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args()
+
+    mix = parse_mix(args.mix)
+    fixtures = build_fixtures(args.csv_rows, args.parquet_rows)
+
+    stub = StubLLM(args.llm_latency_ms, args.llm_jitter_ms)
+    llm_server = ThreadingHTTPServer(("127.0.0.1", args.llm_port), _make_handler(stub, _page_html()))
+    llm_server.daemon_threads = True
+    threading.Thread(target=llm_server.serve_forever, daemon=True).start()
+    llm_base = f"http://127.0.0.1:{args.llm_port}"
+
+    with open(args.server_log, "wb") as log_file:
+        server = start_server(args, f"{llm_base}/generate", log_file)
+        try:
+            driver = Driver(f"http://127.0.0.1:{args.port}", fixtures, f"{llm_base}/page", args.timeout)
+            # One request per scenario first so imports/JIT-ish warmup stays out of the numbers
+            for name, _ in mix:
+                driver.run_one(name)
+            driver.results.clear()
+            stub.batch_sizes.clear()
+            stub.calls = 0
+            elapsed = drive(driver, mix, args.rate, args.duration, args.concurrency)
+            rss = peak_rss(server.pid)
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            llm_server.shutdown()
+
+    report = build_report(args, driver.results, elapsed, stub, rss)
+    print_report(report)
+    print(f"server log: {args.server_log}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
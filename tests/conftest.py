@@ -0,0 +1,31 @@
+import os
+import sys
+
+# Heuristic planning only: tests never reach a real provider
+os.environ.setdefault("SKIP_LLM", "true")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def index():
+    import api.index as module
+    return module
+
+
+@pytest.fixture
+def client(index):
+    from fastapi.testclient import TestClient
+    return TestClient(index.app)
+
+
+@pytest.fixture
+def ask(client):
+    """POST a question (plus {filename: bytes} attachments) to /api and return the response."""
+    def _ask(question: str, attachments=None):
+        files = {"questions.txt": ("questions.txt", question.encode(), "text/plain")}
+        for filename, content in (attachments or {}).items():
+            files[filename] = (filename, content, "application/octet-stream")
+        return client.post("/api", files=files)
+    return _ask
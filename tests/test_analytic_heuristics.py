@@ -0,0 +1,29 @@
+import pytest
+
+META = [{
+    "filename": "sales.csv",
+    "profile": {"columns": ["day", "region", "sales"], "dtypes": {"day": "object", "region": "object", "sales": "int64"}},
+}]
+NO_DATES = [{
+    "filename": "sales.csv",
+    "profile": {"columns": ["region", "sales"], "dtypes": {"region": "object", "sales": "int64"}},
+}]
+
+
+@pytest.mark.parametrize("question, window", [
+    ("Top 3 regions by 7-day rolling average of sales", "7D"),
+    ("Show the 2-week moving average of sales for the 3 largest regions", "14D"),
+    ("Rolling mean of sales over 12 rows", 12),
+    ("In 2024, what was the moving average of 5 for sales?", 5),
+    ("Rolling sum of sales with a window of 4", 4),
+    ("Rolling average of sales", 7),
+])
+def test_rolling_window_ignores_unrelated_numbers(index, question, window):
+    step = index.heuristic_analytic_step(question, META if isinstance(window, str) else NO_DATES)
+    assert step["type"] == "rolling"
+    assert step["params"]["window"] == window
+
+
+def test_top_k_without_rolling(index):
+    step = index.heuristic_analytic_step("Top 3 regions by sales", NO_DATES)
+    assert step["type"] == "top_k" and step["params"]["k"] == 3
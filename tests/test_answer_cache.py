@@ -0,0 +1,57 @@
+import pytest
+
+LONG = ("According to the most recent official census data published by the national statistics office, "
+        "roughly how many people currently live in the capital city of {} including the surrounding metropolitan area?")
+
+
+@pytest.fixture
+def cache(index):
+    return index._AnswerCache(max_entries=16, threshold=0.85)
+
+
+def test_exact_tier_ignores_case_whitespace_and_punctuation(cache):
+    cache.put("What is the capital of France?", "Paris")
+    assert cache.get("  what IS the capital   of france ") == "Paris"
+    assert cache.stats()["hits_exact"] == 1
+
+
+def test_approximate_tier_accepts_rewording(cache):
+    cache.put("What is the capital of France?", "Paris")
+    assert cache.get("Can you tell me what the capital of France is, please") == "Paris"
+    assert cache.stats()["hits_approx"] == 1
+
+
+def test_approximate_tier_rejects_a_different_subject(cache):
+    cache.put(LONG.format("France"), "40k")
+    assert cache.get(LONG.format("Germany")) is None
+    assert cache.get("Please tell me: " + LONG.format("France")) == "40k"
+
+
+def test_numbers_must_match(cache):
+    cache.put("Who won the world cup in 2010?", "Spain")
+    assert cache.get("Who won the world cup in 2014?") is None
+
+
+def test_lru_eviction(index):
+    cache = index._AnswerCache(max_entries=2, threshold=0.85)
+    cache.put("alpha question", 1)
+    cache.put("beta question", 2)
+    cache.get("alpha question")
+    cache.put("gamma question", 3)
+    assert cache.get("beta question") is None
+    assert cache.get("alpha question") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Is 5 > 3?", "Is 5 < 3?"),
+    ("What is 2*3?", "What is 2+3?"),
+    ("What is -5 squared?", "What is 5 squared?"),
+    ("Compare C++ and C#", "compare C and C"),
+    ("Is 5 > 3?", "Is 3 > 5?"),
+    ("Convert $100 to yen", "Convert €100 to yen"),
+])
+def test_operators_and_signs_are_part_of_the_question(cache, cached, asked):
+    cache.put(cached, "cached")
+    assert cache.get(asked) is None
+    assert cache.get(cached) == "cached"
@@ -0,0 +1,42 @@
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def store(index):
+    store = index.AttachmentStore()
+    yield store
+    store.close()
+
+
+def test_compact_frame_keeps_integer_width_for_sql_arithmetic(index):
+    df = pd.DataFrame({"price": [100000, 200000], "qty": [100000, 3]})
+    compact = index.compact_frame(df)
+    assert compact["price"].dtype == np.int64
+    con = duckdb.connect()
+    try:
+        con.register("frame", compact)
+        assert con.execute("SELECT sum(price * qty) FROM frame").fetchone()[0] == 100000 * 100000 + 600000
+    finally:
+        con.close()
+
+
+def test_compact_frame_categorizes_repetitive_strings(index):
+    df = pd.DataFrame({"region": ["n", "s"] * 50, "id": [f"row{i}" for i in range(100)], "x": np.linspace(0, 1, 100)})
+    compact = index.compact_frame(df)
+    assert isinstance(compact["region"].dtype, pd.CategoricalDtype)
+    assert not isinstance(compact["id"].dtype, pd.CategoricalDtype)
+    assert compact["x"].dtype == np.float64
+    pd.testing.assert_frame_equal(compact.astype(object), df.astype(object))
+
+
+def test_artifact_store_spills_least_recently_used(index, store):
+    frames = index.ArtifactStore(store, budget_bytes=1)
+    a = pd.DataFrame({"a": np.arange(1000)})
+    b = pd.DataFrame({"b": np.arange(1000)})
+    frames["a"], frames["b"] = a, b
+    assert frames.stats()["spilled"] >= 1
+    pd.testing.assert_frame_equal(frames["a"], a)
+    pd.testing.assert_frame_equal(frames["b"], b)
@@ -0,0 +1,85 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class _StubLLM(BaseHTTPRequestHandler):
+    """Local-provider stand-in: records every request body and echoes prompts back as JSON."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        if self.server.short_reply and "inputs" in body:
+            body["inputs"] = body["inputs"][:-1]
+        if "inputs" in body:
+            reply = {"outputs": [json.dumps({"answer": p}) for p in body["inputs"]]}
+        else:
+            reply = {"output": json.dumps({"answer": body["input"]})}
+        data = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubLLM)
+    server.requests, server.short_reply = [], False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/generate"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _submit_all(batcher, prompts, max_tokens=128):
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        futures = [pool.submit(batcher.submit, p, max_tokens=max_tokens, temperature=0.0, timeout=10) for p in prompts]
+        return [f.result() for f in futures]
+
+
+def test_concurrent_prompts_share_batches_capped_at_max_size(index, stub):
+    batcher = index._LocalBatcher(stub.url, "stub-model", window_s=0.3, max_size=4)
+    prompts = [f"q{i}" for i in range(10)]
+    outputs = _submit_all(batcher, prompts)
+    assert [json.loads(o)["answer"] for o in outputs] == prompts
+    sizes = [len(r["inputs"]) for r in stub.requests]
+    assert sum(sizes) == 10 and max(sizes) == 4 and len(sizes) <= 4
+    assert all(r["model"] == "stub-model" and r["max_tokens"] == 128 for r in stub.requests)
+
+
+def test_prompts_with_different_params_are_not_mixed(index, stub):
+    batcher = index._LocalBatcher(stub.url, "stub-model", window_s=0.3, max_size=8)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        short = [pool.submit(batcher.submit, f"s{i}", max_tokens=16, temperature=0.0, timeout=10) for i in range(2)]
+        long = [pool.submit(batcher.submit, f"l{i}", max_tokens=512, temperature=0.0, timeout=10) for i in range(2)]
+        [f.result() for f in short + long]
+    by_tokens = {r["max_tokens"]: sorted(r["inputs"]) for r in stub.requests}
+    assert by_tokens == {16: ["s0", "s1"], 512: ["l0", "l1"]}
+
+
+def test_batch_size_mismatch_fails_every_caller(index, stub):
+    stub.short_reply = True
+    batcher = index._LocalBatcher(stub.url, "stub-model", window_s=0.2, max_size=4)
+    with pytest.raises(RuntimeError, match="size mismatch"):
+        _submit_all(batcher, ["a", "b"])
+
+
+def test_local_provider_routes_through_batcher(index, stub, monkeypatch):
+    monkeypatch.setattr(index, "LOCAL_LLM_ENDPOINT", stub.url)
+    monkeypatch.setattr(index, "LOCAL_LLM_BATCHING", True)
+    monkeypatch.setattr(index, "_LOCAL_BATCHER", index._LocalBatcher(stub.url, "stub-model", window_s=0.2, max_size=8))
+    call = lambda p: index._call_provider("local", p, max_tokens=64, temperature=0.0, retries=0)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(call, ["x", "y", "z"]))
+    assert [r["data"]["answer"] for r in results] == ["x", "y", "z"]
+    assert [len(r["inputs"]) for r in stub.requests] == [3]
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({"name": ["a", "b", "c"], "price": [1.0, 2.5, 4.0], "qty": [3, 2, 1], "ok": [True, False, True]})
+
+
+@pytest.mark.parametrize("expr, value", [
+    ("2 + 2", 4.0),
+    ("7 // 2 + 2 ** 10", 1027.0),
+    ("(1 + 2) * 3 / 2", 4.5),
+    ("-5 % 3", 1.0),
+])
+def test_simple_math(index, expr, value):
+    assert index.eval_simple_math(expr) == value
+
+
+@pytest.mark.parametrize("expr", ["9**9**9", "2 ** 100000", "(10**2000) * (10**2000) * (10**2000)", "__import__('os')", "'a' * 3", "x + 1"])
+def test_simple_math_rejects_unbounded_or_unsafe(index, expr):
+    assert index.eval_simple_math(expr) is None
+
+
+def test_cost_bits_are_bounded(index):
+    assert index.compile_expression("2 ** 1000")["ok"]
+    assert index.compile_expression("2 ** 5000") == {"ok": False, "error": "expression_too_expensive"}
+
+
+def test_column_arithmetic_and_filters(index, df):
+    out = index.eval_column_expression("price * qty", df)
+    assert out["ok"] and out["value"].tolist() == [3.0, 5.0, 4.0]
+    mask = index.eval_column_expression("price > 2 and ok", df)["value"]
+    assert mask.tolist() == [False, False, True]
+    assert index.eval_column_expression("name == 'b'", df)["value"].tolist() == [False, True, False]
+    assert index.eval_column_expression("name != 'b' and qty > 1", df)["value"].tolist() == [True, False, False]
+
+
+@pytest.mark.parametrize("expr, error", [
+    ("name * 3", "string_arithmetic"),
+    ("name * 10**9", "string_arithmetic"),
+    ("name + name", "string_arithmetic"),
+    ("-name", "string_arithmetic"),
+    ("sqrt(name)", "string_arithmetic"),
+    ("name and ok", "string_arithmetic"),
+    ("name > 'a'", "text_column_comparison"),
+    ("missing + 1", "unknown_column:missing"),
+])
+def test_text_columns_only_support_equality(index, df, expr, error):
+    assert index.eval_column_expression(expr, df) == {"ok": False, "error": error}
+
+
+def test_vector_budget(index, monkeypatch):
+    monkeypatch.setattr(index, "MATH_MAX_VECTOR_OPS", 10)
+    big = pd.DataFrame({"x": np.arange(100)})
+    assert index.eval_column_expression("x + 1", big) == {"ok": False, "error": "expression_too_expensive"}
+
+
+def test_compacted_text_columns_are_text(index, df):
+    compact = index.compact_frame(df)
+    assert index.eval_column_expression("name * 2", compact)["error"] == "string_arithmetic"
+    assert index.eval_column_expression("name == 'c'", compact)["value"].tolist() == [False, False, True]
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+CSV = b"price,qty\n1,2\n2,4\n3,7\n4,8\n"
+
+
+def _meta(index, store):
+    store.put("data.csv", CSV)
+    profile = {"columns": ["price", "qty"], "dtypes": {"price": "int64", "qty": "int64"}}
+    return [{"filename": "data.csv", "size": len(CSV), "profile": profile}]
+
+
+def test_slow_kernel_does_not_hold_the_deadline(index, monkeypatch):
+    # A CPU-bound step blocks its worker thread, not the event loop, so the deadline still fires
+    def slow_correlation(df, params):
+        time.sleep(1.5)
+        return index.correlation(df, params)
+
+    monkeypatch.setitem(index.ANALYTIC_STEPS, "correlation", slow_correlation)
+    store = index.AttachmentStore(prefix="test-fanout-")
+    try:
+        meta = _meta(index, store)
+
+        async def _run():
+            # Timed inside the loop: asyncio.run itself waits for the abandoned worker thread
+            start = time.monotonic()
+            answers = await index.answer_sub_questions(
+                "test", "", ["What is the correlation between price and qty?", "What is 2 + 3?"], store, meta,
+                deadline=start + 0.5,
+            )
+            return answers, time.monotonic() - start
+
+        answers, elapsed = asyncio.run(_run())
+    finally:
+        store.release()
+    assert answers[0] is None and answers[1] is not None
+    assert elapsed < 1.2
+
+
+def test_deadline_counts_from_request_start(index):
+    # Time already spent on the upload is deducted from the fan-out budget
+    store = index.AttachmentStore(prefix="test-fanout-")
+    try:
+        meta = _meta(index, store)
+        answers = asyncio.run(index.answer_sub_questions(
+            "test", "", ["What is the correlation between price and qty?", "Summarize the data"], store, meta,
+            deadline=time.monotonic() - 1,
+        ))
+    finally:
+        store.release()
+    assert answers == [None, None]
+
+
+def test_sub_questions_answered_in_order(ask):
+    res = ask("1. What is the correlation between price and qty?\n2. What is 2 + 3?", {"data.csv": CSV})
+    assert res.status_code == 200
+    assert res.headers["X-Analysis-Tier"] == "fanout"
+    answers = res.json()
+    assert len(answers) == 2 and answers[0] is not None
+
+
+def test_timeout_reports_the_tier_it_reached(index, ask, monkeypatch):
+    def slow_correlation(df, params):
+        time.sleep(1)
+        return index.correlation(df, params)
+
+    monkeypatch.setitem(index.ANALYTIC_STEPS, "correlation", slow_correlation)
+    monkeypatch.setattr(index, "REQUEST_TIMEOUT_SECONDS", 0.3)
+    monkeypatch.setattr(index, "FANOUT_DEADLINE_SECONDS", 5)
+    res = ask("1. What is the correlation between price and qty?\n2. Summarize the data", {"data.csv": CSV})
+    assert res.status_code == 504
+    assert res.headers["X-Analysis-Tier"] == "fanout"
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+EDGES_CSV = b"source,target,weight\nalice,bob,1\nbob,carol,2\nalice,carol,5\ncarol,dave,1\neve,frank,1\n"
+
+
+@pytest.fixture
+def edges():
+    return pd.DataFrame({
+        "source": ["alice", "bob", "alice", "carol", "eve"],
+        "target": ["bob", "carol", "carol", "dave", "frank"],
+        "weight": [1.0, 2.0, 5.0, 1.0, 1.0],
+    })
+
+
+def test_csr_layout_and_degree(index, edges):
+    graph = index.CSRGraph.from_frame(edges, "source", "target")
+    assert graph.n_nodes == 6 and graph.n_edges == 5
+    assert graph.indptr[-1] == 10  # undirected: both directions stored
+    degree = dict(zip(graph.labels, graph.degree().tolist()))
+    assert degree == {"alice": 2, "bob": 2, "carol": 3, "dave": 1, "eve": 1, "frank": 1}
+
+
+def test_components(index, edges):
+    graph = index.CSRGraph.from_frame(edges, "source", "target", directed=True)
+    labels = graph.components()
+    assert len(set(labels.tolist())) == 2
+    assert labels[graph.node_id("dave")] == labels[graph.node_id("alice")]
+
+
+def test_weighted_and_hop_shortest_paths(index, edges):
+    weighted = index.graph_analysis(edges, {"from": "alice", "to": "dave"})
+    assert weighted["answer"] == 4
+    assert weighted["shortest_path"]["path"] == ["alice", "bob", "carol", "dave"]
+    hops = index.graph_analysis(edges, {"from": "alice", "to": "dave", "weight": "none"})
+    assert hops["answer"] == 2
+    unreachable = index.graph_analysis(edges, {"from": "alice", "to": "frank"})
+    assert unreachable["answer"] is None and unreachable["shortest_path"]["path"] == []
+
+
+def test_bfs_on_long_chain(index):
+    n = 5000
+    chain = pd.DataFrame({"from": np.arange(n), "to": np.arange(1, n + 1)})
+    assert index.graph_analysis(chain, {"from": 0, "to": n})["answer"] == n
+
+
+def test_graph_question_is_not_served_as_a_plot(ask):
+    r = ask("What is the density of this graph?", {"edges.csv": EDGES_CSV})
+    assert r.headers["x-analysis-tier"] == "planned"
+    assert r.json() == {"answer": 0.333333}
+
+
+def test_components_question_excludes_header_row(ask):
+    r = ask("How many connected components are in the graph?", {"edges.csv": EDGES_CSV})
+    assert r.json() == {"answer": 2}
+
+
+def test_network_summary_includes_degree_plot(ask):
+    body = ask("Summarize this network", {"edges.csv": EDGES_CSV}).json()
+    assert body["summary"]["s9"]["components"] == 2
+    assert body["plot_png_base64"]
+
+
+@pytest.mark.parametrize("question, columns", [
+    ("Which social network has the most users?", ["network", "users"]),
+    ("Summarize the knowledge base", ["source", "target"]),
+])
+def test_graph_heuristic_needs_edge_list_and_whole_words(index, question, columns):
+    meta = [{"filename": "t.csv", "profile": {"columns": columns}}]
+    assert index.heuristic_graph_step(question, meta) is None
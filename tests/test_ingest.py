@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+
+ALL_TEXT_CSV = b"name,city\nAlice,Paris\nBob,Rome\nCara,Oslo\n"
+
+
+def test_profile_keeps_header_of_all_text_csv(index):
+    profile = index._profile_csv_head(ALL_TEXT_CSV, True)
+    assert profile["columns"] == ["name", "city"]
+    assert profile["delimiter"] == ","
+
+
+def test_profile_sniffs_semicolon_delimiter(index):
+    profile = index._profile_csv_head(b"a;b\n1;2\n3;4\n", True)
+    assert profile["delimiter"] == ";"
+    assert profile["columns"] == ["a", "b"]
+
+
+def test_summary_of_all_text_csv_uses_header_row(ask):
+    r = ask("Summarize this file", {"people.csv": ALL_TEXT_CSV})
+    assert r.status_code == 200
+    summary = r.json()["summary"]["people.csv"]
+    assert set(summary) == {"name", "city"}
+    assert summary["name"]["count"] == 3
+
+
+def _profile(index, filename: str, content: bytes):
+    async def run():
+        profiler = index._AttachmentProfiler(filename)
+        profiler.feed(content)
+        return await profiler.finish()
+    return asyncio.run(run())
+
+
+def test_pretty_printed_json_is_not_ndjson(index):
+    content = b'{\n  "data": [\n    {"a": 1},\n    {"a": 2},\n    {"a": 3}\n  ]\n}\n'
+    profile = _profile(index, "records.json", content)
+    assert profile["layout"] == "object"
+    assert "rows_estimate" not in profile
+
+
+def test_ndjson_layout_and_row_estimate(index):
+    profile = _profile(index, "records.jsonl", b'{"a": 1}\n{"a": 2}\n{"a": 3}\n')
+    assert profile == {"layout": "ndjson", "rows_estimate": 3}
+
+
+def test_csv_row_estimate_excludes_header(index):
+    profile = _profile(index, "people.csv", ALL_TEXT_CSV)
+    assert profile["rows_estimate"] == 3
+
+
+class _ChunkedRequest:
+    def __init__(self, boundary: str, chunks):
+        self.headers = {"content-type": f"multipart/form-data; boundary={boundary}"}
+        self._chunks = chunks
+
+    async def stream(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+def test_oversized_upload_cancels_head_profiling(index, monkeypatch):
+    profilers = []
+
+    class RecordingProfiler(index._AttachmentProfiler):
+        def __init__(self, filename):
+            super().__init__(filename)
+            profilers.append(self)
+
+    def slow_profile(head, complete):
+        time.sleep(0.5)
+        return {}
+
+    monkeypatch.setattr(index, "_AttachmentProfiler", RecordingProfiler)
+    monkeypatch.setattr(index, "_profile_csv_head", slow_profile)
+    monkeypatch.setattr(index, "PROFILE_HEAD_BYTES", 16)
+    monkeypatch.setattr(index, "PER_FILE_MAX_BYTES", 64)
+    part = b'--b\r\nContent-Disposition: form-data; name="f"; filename="big.csv"\r\n\r\n'
+    request = _ChunkedRequest("b", [part + b"a,b\n" + b"1,2\n" * 8, b"1,2\n" * 16, b"\r\n--b--\r\n"])
+
+    async def run():
+        # Checked inside the loop: asyncio.run cancels leftover tasks on its own at shutdown
+        store = index.AttachmentStore()
+        try:
+            with pytest.raises(index.HTTPException) as err:
+                await index._ingest_multipart(request, store, {"total_bytes": 0})
+            await asyncio.sleep(0)
+            task = profilers[0]._task
+            return err.value.status_code, task is not None and task.cancelled()
+        finally:
+            store.close()
+
+    status, cancelled = asyncio.run(run())
+    assert status == 413
+    assert cancelled
+
+
+def test_rejected_upload_reports_ingest_tier(client, index, monkeypatch):
+    monkeypatch.setattr(index, "PER_FILE_MAX_BYTES", 64)
+    files = {
+        "questions.txt": ("questions.txt", b"Summarize", "text/plain"),
+        "big.csv": ("big.csv", b"a,b\n" + b"1,2\n" * 64, "text/csv"),
+    }
+    res = client.post("/api", files=files)
+    assert res.status_code == 413
+    assert res.headers["X-Analysis-Tier"] == "ingest"
+    res = client.post("/api", data={"q": "no files"})
+    assert res.status_code == 400
+    assert res.headers["X-Analysis-Tier"] == "ingest"
@@ -0,0 +1,70 @@
+import io
+import json
+
+import pytest
+
+
+def records(index, text, chunk_size=7):
+    return list(index.iter_json_records(io.StringIO(text), chunk_size=chunk_size))
+
+
+RECORDS = [{"a": 1, "b": "x"}, {"a": 2, "b": "y, [z]"}, {"a": 3.5, "b": None}]
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(RECORDS),
+    json.dumps(RECORDS, indent=2),
+    "\n".join(json.dumps(r) for r in RECORDS) + "\n",
+    "".join(json.dumps(r) for r in RECORDS),
+    json.dumps({"meta": {"n": 3}, "data": RECORDS}, indent=1),
+    json.dumps({"rows": RECORDS, "other": [{"a": 0}]}),
+])
+def test_layouts_yield_the_same_records(index, text):
+    assert records(index, text) == RECORDS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 64, 1 << 20])
+def test_chunk_boundaries_do_not_split_values(index, chunk_size):
+    text = json.dumps([{"n": 12345678901234}, {"s": 'a"b' * 20}, 3.25, 100]) + "\n"
+    assert records(index, text, chunk_size) == [{"n": 12345678901234}, {"s": 'a"b' * 20}, 3.25, 100]
+
+
+def test_single_object_without_record_list_is_one_record(index):
+    assert records(index, '{"a": 1, "tags": ["x", "y"]}') == [{"a": 1, "tags": ["x", "y"]}]
+
+
+@pytest.mark.parametrize("text", ["", "   \n", "[]"])
+def test_empty_inputs(index, text):
+    assert records(index, text) == []
+
+
+def test_truncated_input_raises(index):
+    with pytest.raises(json.JSONDecodeError):
+        records(index, '[{"a": 1}, {"a": ')
+
+
+def test_read_json_table_flattens_and_unions_columns(index):
+    text = "\n".join(json.dumps(r) for r in [{"id": 1, "user": {"name": "a"}}, {"id": 2, "extra": True}])
+    df = index.read_json_table(io.StringIO(text), batch_rows=1)
+    assert list(df.columns) == ["id", "user.name", "extra"]
+    assert df["id"].tolist() == [1, 2]
+
+
+def test_wrapped_array_is_streamed_item_by_item(index):
+    text = json.dumps({"meta": {"n": 1000}, "data": [{"i": i, "pad": "x" * 100} for i in range(1000)]})
+    fh = io.StringIO(text)
+    it = index.iter_json_records(fh, chunk_size=256)
+    assert next(it) == {"i": 0, "pad": "x" * 100}
+    assert fh.tell() < 1024  # the rest of the array is still unread
+    assert sum(1 for _ in it) == 999
+
+
+def test_wrapped_array_yields_records_before_a_truncation(index):
+    it = index.iter_json_records(io.StringIO('{"data": [{"a": 1}, {"a": 2}, {"a": '), chunk_size=4)
+    assert [next(it), next(it)] == [{"a": 1}, {"a": 2}]
+    with pytest.raises(json.JSONDecodeError):
+        next(it)
+
+
+def test_wrapper_with_scalar_list_is_one_record(index):
+    assert records(index, '{"data": [1, 2], "name": "x"}') == [{"data": [1, 2], "name": "x"}]
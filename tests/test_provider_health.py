@@ -0,0 +1,46 @@
+import time
+
+
+def _tripped(index, monkeypatch):
+    monkeypatch.setattr(index, "LLM_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(index, "LLM_BREAKER_COOLDOWN_SECONDS", 0.05)
+    health = index._ProviderHealth()
+    health.record(False, 0.1)
+    health.record(False, 0.1)
+    return health
+
+
+def test_open_breaker_rejects_until_cooldown(index, monkeypatch):
+    health = _tripped(index, monkeypatch)
+    assert health.snapshot()["state"] == "open"
+    assert not health.allow()
+
+
+def test_half_open_admits_a_single_probe(index, monkeypatch):
+    health = _tripped(index, monkeypatch)
+    time.sleep(0.06)
+    assert health.snapshot()["state"] == "half_open"
+    assert health.available()
+    assert [health.allow() for _ in range(3)] == [True, False, False]
+    assert not health.available()
+    health.record(True, 0.1)
+    assert health.snapshot()["state"] == "closed"
+    assert all(health.allow() for _ in range(3))
+
+
+def test_failed_probe_reopens_the_breaker(index, monkeypatch):
+    health = _tripped(index, monkeypatch)
+    time.sleep(0.06)
+    assert health.allow()
+    health.record(False, 0.1)
+    assert health.snapshot()["state"] == "open"
+    assert not health.allow()
+    time.sleep(0.06)
+    assert health.allow() and not health.allow()
+
+
+def test_available_claims_nothing(index, monkeypatch):
+    health = _tripped(index, monkeypatch)
+    time.sleep(0.06)
+    assert health.available() and health.available()
+    assert health.allow()
@@ -0,0 +1,33 @@
+import asyncio
+
+
+def _send(response):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(response({"type": "http", "headers": []}, receive, send))
+    return dict(messages[0]["headers"])
+
+
+def test_truncated_list_response_is_flagged(index, monkeypatch):
+    monkeypatch.setattr(index, "RESPONSE_MAX_BYTES", 1000)
+    response = index.AnalysisResponse(content=[{"answer": "x" * 100}] * 100)
+    assert len(response.body) <= 1000
+    assert _send(response)[b"x-response-truncated"] == b"true"
+
+
+def test_truncated_dict_response_keeps_its_marker(index, monkeypatch):
+    monkeypatch.setattr(index, "RESPONSE_MAX_BYTES", 1000)
+    response = index.AnalysisResponse(content={"rows": list(range(1000))})
+    assert b'"truncated":true' in response.body
+    assert _send(response)[b"x-response-truncated"] == b"true"
+
+
+def test_response_within_budget_is_not_flagged(index):
+    response = index.AnalysisResponse(content=[1, 2, 3])
+    assert b"x-response-truncated" not in _send(response)
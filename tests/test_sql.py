@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import duckdb
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.register("sales", pd.DataFrame({"region": ["n", "s", "n"], "price": [1.0, 2.0, 3.0], "qty": [1, 2, 3]}))
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def schema(index, con):
+    return index.duckdb_tables(con)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT region, sum(price * qty) AS revenue FROM sales GROUP BY region ORDER BY revenue DESC",
+    "SELECT count(*) FROM sales WHERE region ILIKE 'N%' AND qty BETWEEN 1 AND 3",
+    "WITH t AS (SELECT region, avg(price) AS p FROM sales GROUP BY 1) SELECT * FROM t",
+    "SELECT region, rank() OVER (ORDER BY price) FROM sales",
+    "SELECT CAST(qty AS DOUBLE), coalesce(region, '?'), date_part('year', DATE '2024-01-01') FROM sales;",
+    "SELECT a.region FROM sales a JOIN sales b USING (region)",
+])
+def test_accepts_read_only_selects(index, con, schema, sql):
+    checked = index.validate_readonly_sql(con, sql, schema)
+    assert checked["ok"], checked
+    con.execute(checked["sql"]).fetchall()
+
+
+@pytest.mark.parametrize("sql, error", [
+    ("SELECT * FROM sqlite_scan('/tmp/x.db', 't')", "table_ref_not_allowed:table_function"),
+    ("SELECT * FROM postgres_scan('host=evil', 'public', 't')", "table_ref_not_allowed:table_function"),
+    ("SELECT * FROM read_csv_auto('/etc/passwd')", "table_ref_not_allowed:table_function"),
+    ("SELECT * FROM range(10)", "table_ref_not_allowed:table_function"),
+    ("SELECT * FROM '/etc/passwd'", "table_not_allowed:/etc/passwd"),
+    ("SELECT current_setting('home_directory')", "function_not_allowed:current_setting"),
+    ("SELECT getenv('HOME')", "function_not_allowed:getenv"),
+    ("SELECT repeat('x', 1000000000)", "function_not_allowed:repeat"),
+    ("SELECT * FROM other_table", "table_not_allowed:other_table"),
+    ("SELECT 1; SELECT 2", "single_statement_only"),
+    ("DELETE FROM sales", "only_select_allowed"),
+    ("", "empty_sql"),
+])
+def test_rejects_everything_else(index, con, schema, sql, error):
+    assert index.validate_readonly_sql(con, sql, schema) == {"ok": False, "error": error}
+
+
+def test_sql_param_of_duckdb_step_is_validated(index, monkeypatch):
+    seen = []
+    original = index.validate_readonly_sql
+
+    def spy(con, sql, schema):
+        seen.append(original(con, sql, schema))
+        return seen[-1]
+
+    monkeypatch.setattr(index, "validate_readonly_sql", spy)
+    sql = "SELECT * FROM read_text('/etc/hostname')"
+    plan = {"plan": {"steps": [{"id": "s1", "type": "duckdb_query", "params": {"sql": sql}}]}}
+    store = index.AttachmentStore()
+    try:
+        asyncio.run(index.execute_plan(
+            plan, question_text="q", attachments=store, attachments_meta=[], request_id="test"))
+    finally:
+        store.close()
+    assert seen == [{"ok": False, "error": "table_ref_not_allowed:table_function"}]
+
+
+def test_schema_never_lists_categorical_values(index):
+    df = index.compact_frame(pd.DataFrame({"region": ["Northwind", "Southpark"] * 50, "qty": range(100)}))
+    assert isinstance(df["region"].dtype, pd.CategoricalDtype)
+    con = duckdb.connect()
+    try:
+        con.register("sales", df)
+        schema = index.describe_duckdb_schema(con)
+    finally:
+        con.close()
+    assert schema[0]["columns"][0]["type"] == "VARCHAR"
+    assert "Northwind" not in str(schema)
+
+
+def test_text_to_sql_prompt_carries_no_cell_values(index, monkeypatch):
+    prompts = []
+
+    def fake_llm(prompt, **kwargs):
+        prompts.append(prompt)
+        return {"ok": True, "data": {"sql": "SELECT count(*) FROM sales"}}
+
+    monkeypatch.setattr(index, "call_llm", fake_llm)
+    monkeypatch.setattr(index, "_llm_enabled", lambda: True)
+    store = index.AttachmentStore()
+    store.put("sales.csv", b"region,qty\n" + b"".join(b"Northwind,1\nSouthpark,2\n" for _ in range(50)))
+    plan = {"plan": {"steps": [{"id": "s1", "type": "text_to_sql"}]}}
+    try:
+        out = asyncio.run(index.execute_plan(
+            plan, question_text="how many rows", attachments=store,
+            attachments_meta=[{"filename": "sales.csv"}], request_id="test"))
+    finally:
+        store.close()
+    assert out == {"answer": 100}
+    assert "Northwind" not in prompts[0] and "Southpark" not in prompts[0]
+
+
+def test_raw_sql_fetches_only_the_preview(index):
+    # A 10^8-row cross join would take minutes to materialize; the preview LIMIT stops it early
+    store = index.AttachmentStore()
+    store.put("sales.csv", b"region,qty\n" + b"".join(b"Northwind,1\nSouthpark,2\n" for _ in range(50)))
+    sql = "SELECT a.qty FROM sales a, sales b, sales c, sales d"
+    plan = {"plan": {"steps": [{"id": "s1", "type": "duckdb_query", "params": {"sql": sql}}]}}
+    start = time.monotonic()
+    try:
+        out = asyncio.run(index.execute_plan(
+            plan, question_text="q", attachments=store,
+            attachments_meta=[{"filename": "sales.csv"}], request_id="test"))
+    finally:
+        store.close()
+    assert out == {"result": {"artifacts": ["s1"]}}
+    assert time.monotonic() - start < 5
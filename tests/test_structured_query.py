@@ -0,0 +1,75 @@
+import duckdb
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.register("t", pd.DataFrame({"region": ["n", "s", "n", "e"], "price": [1.0, 2.0, 3.0, 4.0], "qty": [1, 2, 3, 4]}))
+    yield con
+    con.close()
+
+
+def run(index, con, params):
+    query = index.compile_structured_query(params, '"t"')
+    return query, con.execute(query["sql"], query["args"]).fetchall()
+
+
+def test_group_by_without_aggregates_returns_one_row_per_group(index, con):
+    query, rows = run(index, con, {"group_by": ["region"], "order_by": ["region"]})
+    assert "GROUP BY" in query["sql"]
+    assert rows == [("e",), ("n",), ("s",)]
+
+
+def test_group_by_string_and_aggregates(index, con):
+    _, rows = run(index, con, {
+        "group_by": "region",
+        "aggregates": [{"fn": "sum", "column": "price", "as": "total"}, {"fn": "count"}],
+        "order_by": [{"column": "total", "desc": True}, "region"],
+    })
+    assert rows == [("e", 4.0, 1), ("n", 4.0, 2), ("s", 2.0, 1)]
+
+
+def test_filters_are_bound_as_parameters(index, con):
+    query, rows = run(index, con, {
+        "columns": ["region"],
+        "filters": [{"column": "region", "op": "=", "value": "n' OR 1=1 --"}, {"column": "qty", "op": "between", "value": [1, 4]}],
+    })
+    assert "n' OR" not in query["sql"]
+    assert rows == []
+    assert query["columns_read"] == ["qty", "region"]
+
+
+def test_identifiers_are_quoted(index, con):
+    with pytest.raises(duckdb.Error):
+        run(index, con, {"columns": ['region" FROM t; DROP TABLE t; --']})
+    assert con.execute("SELECT count(*) FROM t").fetchone()[0] == 4
+
+
+@pytest.mark.parametrize("params, error", [
+    ({"aggregates": [{"fn": "exec", "column": "price"}]}, "unsupported_aggregate:exec"),
+    ({"aggregates": [{"fn": "sum"}]}, "aggregate_needs_column"),
+    ({"filters": [{"column": "price", "op": "regex", "value": "x"}]}, "unsupported_filter:regex"),
+])
+def test_bad_params_raise(index, params, error):
+    with pytest.raises(ValueError, match=error):
+        index.compile_structured_query(params, '"t"')
+
+
+def test_limit_is_capped(index, monkeypatch):
+    monkeypatch.setattr(index, "PARQUET_QUERY_MAX_ROWS", 10)
+    assert index.compile_structured_query({"limit": 10**9}, '"t"')["limit"] == 10
+
+
+def test_parquet_scan_stats_are_labelled_estimates(index, tmp_path):
+    path = str(tmp_path / "p.parquet")
+    con = duckdb.connect()
+    try:
+        con.execute(f"COPY (SELECT range AS id, range % 7 AS g FROM range(100000)) TO '{path}' (FORMAT parquet, ROW_GROUP_SIZE 10000)")
+        stats = index.parquet_scan_stats(con, [path], [{"column": "id", "op": ">", "value": 85000}], ["g", "id"])
+    finally:
+        con.close()
+    assert stats["row_groups_total"] == 10
+    assert stats["row_groups_scanned_estimated"] == 2
+    assert 0 < stats["bytes_scanned_estimated"] < stats["bytes_total"]